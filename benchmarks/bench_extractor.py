@@ -0,0 +1,90 @@
+import os
+import glob
+import time
+import argparse
+import statistics
+
+from jarvis.smartgpt import extractor
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "html")
+
+
+def load_fixtures(fixtures_dir):
+    fixtures = {}
+    for file_name in sorted(glob.glob(os.path.join(fixtures_dir, "*.html"))):
+        with open(file_name, "r", encoding="utf-8") as f:
+            fixtures[os.path.basename(file_name)] = f.read()
+    return fixtures
+
+
+def bench(engine, html, rounds, use_pool):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        extractor.extract_text(html, engine, use_pool=use_pool)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), min(timings)
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the HTML to text extractors"
+    )
+    parser.add_argument(
+        "--fixtures",
+        type=str,
+        default=FIXTURES_DIR,
+        help="Directory of saved HTML pages",
+    )
+    parser.add_argument(
+        "--rounds", type=int, default=20, help="Number of extractions per fixture"
+    )
+    parser.add_argument(
+        "--scale",
+        type=int,
+        default=1,
+        help="Repeat each page body to simulate larger pages",
+    )
+    parser.add_argument(
+        "--pool", action="store_true", help="Run the extraction in the process pool"
+    )
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"No HTML fixtures found in {args.fixtures}")
+        return
+
+    engines = [name for name in extractor.EXTRACTORS if extractor.is_available(name)]
+    baseline = extractor.BeautifulSoupExtractor.name
+
+    print(
+        f"{'fixture':<24}{'engine':<12}{'median ms':>12}{'min ms':>12}{'speedup':>10}{'same text':>11}"
+    )
+    for fixture_name, html in fixtures.items():
+        html = html * args.scale
+        expected = (
+            extractor.get_extractor(baseline).extract(html)
+            if baseline in engines
+            else None
+        )
+        baseline_median = None
+        for engine in engines:
+            median, fastest = bench(engine, html, args.rounds, args.pool)
+            if engine == baseline:
+                baseline_median = median
+            speedup = f"{baseline_median / median:.1f}x" if baseline_median else "-"
+            same = (
+                "-"
+                if expected is None
+                else str(extractor.get_extractor(engine).extract(html) == expected)
+            )
+            print(
+                f"{fixture_name:<24}{engine:<12}{median * 1000:>12.2f}{fastest * 1000:>12.2f}{speedup:>10}{same:>11}"
+            )
+
+    extractor.shutdown_pool()
+
+
+if __name__ == "__main__":
+    run()
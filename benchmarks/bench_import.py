@@ -0,0 +1,73 @@
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+MODULES = [
+    "jarvis.smartgpt.gpt",
+    "jarvis.smartgpt.actions",
+    "jarvis.smartgpt.planner",
+    "jarvis.smartgpt.translator",
+]
+
+# Run in a fresh interpreter each round, the import cache would hide the cost otherwise
+SCRIPT = """
+import time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+from jarvis.smartgpt import gpt
+if {build_models}:
+    for name in list(gpt.OPEN_AI_MODELS_HUB._factories):
+        gpt.OPEN_AI_MODELS_HUB[name]
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def bench(module, rounds, build_models):
+    env = {**os.environ, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "sk-bench")}
+    imports, builds = [], []
+    for _ in range(rounds):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                SCRIPT.format(module=module, build_models=build_models),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+            env=env,
+        ).stdout
+        import_seconds, build_seconds = map(float, output.split())
+        imports.append(import_seconds)
+        builds.append(build_seconds)
+    return statistics.median(imports), statistics.median(builds)
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the import time of the jarvis modules"
+    )
+    parser.add_argument(
+        "--rounds", type=int, default=5, help="Number of fresh interpreters per module"
+    )
+    parser.add_argument(
+        "--modules", nargs="*", default=MODULES, help="Modules to import"
+    )
+    args = parser.parse_args()
+
+    print(f"{'module':<32}{'import ms':>12}{'all models ms':>15}{'eager ms':>12}")
+    for module in args.modules:
+        import_seconds, _ = bench(module, args.rounds, False)
+        # what importing cost when every model of the hub was built at import
+        _, build_seconds = bench(module, args.rounds, True)
+        print(
+            f"{module:<32}{import_seconds * 1000:>12.1f}{build_seconds * 1000:>15.1f}"
+            f"{(import_seconds + build_seconds) * 1000:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,87 @@
+"""Load test of the gRPC server, offline against the OpenAI stand-in.
+
+    python -m jarvis.utils.openai_standin --cassette llm_cassette.jsonl &
+    OPENAI_API_BASE=http://127.0.0.1:8089/v1 python -m jarvis.server &
+    python benchmarks/bench_server.py --goal-file goal.txt --requests 20 --concurrency 4
+"""
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+
+import jarvis.server.jarvis_pb2 as jarvis_pb2
+import jarvis.server.jarvis_pb2_grpc as jarvis_pb2_grpc
+
+
+def execute_plan(stub, goal, skip_gen, index):
+    start = time.perf_counter()
+    response = stub.ExecutePlan(
+        jarvis_pb2.ExecuteRequest(
+            goal=goal, skip_gen=skip_gen, executor_id=f"bench-{index}"
+        )
+    )
+    return time.perf_counter() - start, response.error
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Load test the jarvis gRPC server")
+    parser.add_argument(
+        "--address",
+        type=str,
+        default="localhost:51155",
+        help="Address of the gRPC server",
+    )
+    parser.add_argument(
+        "--goal-file",
+        type=str,
+        required=True,
+        help="File with the goal of every request",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=10, help="Number of ExecutePlan requests"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=2, help="Requests in flight at the same time"
+    )
+    parser.add_argument(
+        "--skip-gen",
+        action="store_true",
+        help="Reuse the instructions already generated",
+    )
+    args = parser.parse_args()
+
+    with open(args.goal_file, "r") as f:
+        goal = f.read()
+
+    with grpc.insecure_channel(args.address) as channel:
+        stub = jarvis_pb2_grpc.JarvisStub(channel)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(
+                pool.map(
+                    lambda index: execute_plan(stub, goal, args.skip_gen, index),
+                    range(args.requests),
+                )
+            )
+        elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, _ in results]
+    errors = sum(1 for _, error in results if error)
+    print(
+        f"{'requests':<12}{'errors':>8}{'req/s':>10}{'median s':>12}{'p95 s':>10}{'max s':>10}"
+    )
+    print(
+        f"{args.requests:<12}{errors:>8}{args.requests / elapsed:>10.2f}"
+        f"{statistics.median(latencies):>12.2f}{percentile(latencies, 95):>10.2f}{max(latencies):>10.2f}"
+    )
+
+
+if __name__ == "__main__":
+    run()
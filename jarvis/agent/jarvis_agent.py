@@ -3,7 +3,6 @@ import glob
 import os
 import uuid
 import logging
-import tiktoken
 import re
 import json
 
@@ -19,6 +18,8 @@ from jarvis.smartgpt import planner
 from jarvis.smartgpt import instruction
 from jarvis.smartgpt import jvm
 from jarvis.smartgpt import gpt
+from jarvis.smartgpt import provisioner
+from jarvis.smartgpt import usage
 from jarvis.smartgpt.compiler import Compiler
 from jarvis.agent.skill import SkillManager
 from jarvis.utils.tracer import conditional_chan_traceable
@@ -31,15 +32,17 @@ Max_Overview_Length = 500
 # BASE_MODEL = gpt.GPT_3_5_TURBO_16K
 BASE_MODEL = gpt.GPT_4
 EMPTY_FIELD_INDICATOR = "EMPTY_FIELD_INDICATOR"
-Encoding = tiktoken.encoding_for_model(BASE_MODEL)
 
 
 def generate_task_outcome_overview(task, result):
     sys_prompt = "You're a helpful assistant, assigned to summarize the the task result overview in at most 250 words based on the provided  tasks and its execution results. "
     user_prompt = f"The task is to {task}. Its execution results are {result}."
-    resp = gpt.complete(
-        prompt=user_prompt, model=gpt.GPT_3_5_TURBO_16K, system_prompt=sys_prompt
-    )
+    with usage.call_site("overview"):
+        resp = gpt.complete(
+            prompt=user_prompt,
+            model=gpt.GPT_3_5_TURBO_16K,
+            system_prompt=sys_prompt,
+        )
 
     return resp
 
@@ -69,7 +72,8 @@ def get_best_skill_for_task(task, skills):
 
     prompt = f"Given the task: '{task}', and the following skills with their descriptions:\n{skill_list}\nWhich skill is best suited to solve the task?"
 
-    resp = gpt.complete(prompt=prompt, model=gpt.GPT_4, system_prompt=sys_prompt)
+    with usage.call_site("skill_selection"):
+        resp = gpt.complete(prompt=prompt, model=gpt.GPT_4, system_prompt=sys_prompt)
 
     logging.info(f"Get task skill selection result: {resp}")
 
@@ -99,6 +103,8 @@ class ChainInfo(BaseModel):
     task_infos: List[TaskInfo]
     result: str
     error: Optional[str] = None
+    # LLM requests, tokens and cost of the whole chain, including planning
+    llm_usage: Optional[dict] = None
 
 
 class JarvisExecutor:
@@ -114,6 +120,8 @@ class JarvisExecutor:
             unique_id = str(uuid.uuid4())
             timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
             self.executor_id = f"{unique_id}-{timestamp}"
+        # LLM usage of everything this executor ran, tasks keep theirs in metadata["llm_usage"]
+        self.usage = usage.UsageSummary()
 
     @conditional_chan_traceable(run_type="chain")
     def execute_with_plan(
@@ -121,6 +129,13 @@ class JarvisExecutor:
         goal: str,
         skip_gen: bool = False,
     ):
+        with usage.track(self.usage), usage.track() as chain_usage:
+            result = self._execute_with_plan(goal, skip_gen)
+        result.llm_usage = chain_usage.to_dict()
+        logging.info(chain_usage.report())
+        return result
+
+    def _execute_with_plan(self, goal: str, skip_gen: bool) -> ChainInfo:
         current_workdir = os.getcwd()
         logging.info(f"Current workdir: {current_workdir}")
         new_subdir = os.path.join(current_workdir, self.executor_id)
@@ -154,8 +169,10 @@ class JarvisExecutor:
         last_task_result = EMPTY_FIELD_INDICATOR
         for task in task_list:
             task_idx, instrs = task
+            task_usage = usage.UsageSummary()
             try:
-                task_info = self.execute_instructions([task])
+                with usage.track(task_usage):
+                    task_info = self.execute_instructions([task])
                 last_task_result = task_info.result
             except Exception as e:
                 logging.error(f"Error executing task {task}: {e}")
@@ -167,6 +184,7 @@ class JarvisExecutor:
                     result=EMPTY_FIELD_INDICATOR,
                     metadata={
                         "instruction_outcome": instrs["overall_outcome"],
+                        "llm_usage": task_usage.to_dict(),
                     },
                     error=str(e),
                 )
@@ -175,10 +193,12 @@ class JarvisExecutor:
                 result.error = f"Error on executing task{instrs['task']}:{str(e)}"
                 return result
 
-            if len(Encoding.encode(task_info.result)) > Max_Overview_Length:
-                task_info.result = generate_task_outcome_overview(
-                    instrs["task"], task_info.result
-                )
+            if gpt.count_tokens(task_info.result) > Max_Overview_Length:
+                with usage.track(task_usage):
+                    task_info.result = generate_task_outcome_overview(
+                        instrs["task"], task_info.result
+                    )
+            task_info.metadata["llm_usage"] = task_usage.to_dict()
 
             logging.info(f"Sucess executing task: {task_info}")
             result.task_infos.append(task_info)
@@ -216,13 +236,14 @@ class JarvisExecutor:
                 previous_tasks.append(previous_task)
 
         try:
-            if skip_gen:
-                instrs = self.load_instructions()
-            else:
-                instrs = self.gen_instructions(
-                    task, goal, previous_tasks, task_num, reference
-                )
-            result = self.execute_instructions(instrs)
+            with usage.track(self.usage), usage.track() as task_usage:
+                if skip_gen:
+                    instrs = self.load_instructions()
+                else:
+                    instrs = self.gen_instructions(
+                        task, goal, previous_tasks, task_num, reference
+                    )
+                result = self.execute_instructions(instrs)
         except Exception as e:
             logging.error(f"Error executing task {task}: {e}")
             os.chdir(current_workdir)
@@ -231,6 +252,7 @@ class JarvisExecutor:
 
         os.chdir(current_workdir)
         if result is not None:
+            result.metadata["llm_usage"] = task_usage.to_dict()
             self.completed_tasks[result.task_num] = result
         return result
 
@@ -252,7 +274,9 @@ class JarvisExecutor:
             with open(file_name, "r") as f:
                 saved = f.read()
             task_num = int(file_name.split(".")[0])
-            instructions.append((task_num, yaml.safe_load(saved)))
+            task_instrs = yaml.safe_load(saved)
+            provisioner.provision(os.getcwd(), task_instrs)
+            instructions.append((task_num, task_instrs))
 
         # Sort instructions by task_num
         sorted_instructions = sorted(instructions, key=lambda x: x[0])
@@ -343,9 +367,12 @@ class JarvisExecutor:
         )
         user_prompt = overall_outcome
 
-        resp = gpt.complete(
-            prompt=user_prompt, model=gpt.GPT_3_5_TURBO_16K, system_prompt=sys_prompt
-        )
+        with usage.call_site("result_extraction"):
+            resp = gpt.complete(
+                prompt=user_prompt,
+                model=gpt.GPT_3_5_TURBO_16K,
+                system_prompt=sys_prompt,
+            )
 
         logging.info(f"Get task task_{task_num} result from keys: {resp}")
 
@@ -10,6 +10,7 @@ import traceback
 from langchain.vectorstores import Chroma
 
 from jarvis.smartgpt import gpt
+from jarvis.smartgpt import usage
 
 skill_gen_prompt = """
 You are a helpful assistant that writes a json format skill description for the given task and it's execution plan.
@@ -146,9 +147,12 @@ class SkillManager:
     def generate_skill_description(self, task, code):
         sys_prompt = "Please review the task and its execution plan, and give the task a suitable name\n"
         user_prompt = f"Come up with a detail skill name (skill name should be function-name style, eg. 'get_weather'; skill name should detailed to be unqieu) for the task({task}) execution plan:\n{code}\n###\nSKILL_NAME:"
-        skill_name = gpt.complete(
-            prompt=user_prompt, model=self.model_name, system_prompt=sys_prompt
-        )
+        with usage.call_site("skill_naming"):
+            skill_name = gpt.complete(
+                prompt=user_prompt,
+                model=self.model_name,
+                system_prompt=sys_prompt,
+            )
         return (skill_name, None)
 
     def retrieve_skills(self, query):
@@ -29,6 +29,16 @@ class JarvisStub(object):
                 request_serializer=jarvis__pb2.SaveSkillRequest.SerializeToString,
                 response_deserializer=jarvis__pb2.SaveSkillResponse.FromString,
                 )
+        self.ExecuteStream = channel.unary_stream(
+                '/server.Jarvis/ExecuteStream',
+                request_serializer=jarvis__pb2.ExecuteRequest.SerializeToString,
+                response_deserializer=jarvis__pb2.ExecuteResponse.FromString,
+                )
+        self.ExecutePlanStream = channel.unary_stream(
+                '/server.Jarvis/ExecutePlanStream',
+                request_serializer=jarvis__pb2.ExecuteRequest.SerializeToString,
+                response_deserializer=jarvis__pb2.ExecuteResponse.FromString,
+                )
 
 
 class JarvisServicer(object):
@@ -53,6 +63,22 @@ class JarvisServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ExecuteStream(self, request, context):
+        """Like Execute, sending the partial output of the execution as it happens, each one an
+        ExecuteResponse with its chunk_kind and chunk_text. The last message of the stream is the
+        response of Execute.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ExecutePlanStream(self, request, context):
+        """Like ExecutePlan, sending the partial output of the execution as ExecuteStream does.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_JarvisServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -71,6 +97,16 @@ def add_JarvisServicer_to_server(servicer, server):
                     request_deserializer=jarvis__pb2.SaveSkillRequest.FromString,
                     response_serializer=jarvis__pb2.SaveSkillResponse.SerializeToString,
             ),
+            'ExecuteStream': grpc.unary_stream_rpc_method_handler(
+                    servicer.ExecuteStream,
+                    request_deserializer=jarvis__pb2.ExecuteRequest.FromString,
+                    response_serializer=jarvis__pb2.ExecuteResponse.SerializeToString,
+            ),
+            'ExecutePlanStream': grpc.unary_stream_rpc_method_handler(
+                    servicer.ExecutePlanStream,
+                    request_deserializer=jarvis__pb2.ExecuteRequest.FromString,
+                    response_serializer=jarvis__pb2.ExecuteResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'server.Jarvis', rpc_method_handlers)
@@ -132,3 +168,37 @@ class Jarvis(object):
             jarvis__pb2.SaveSkillResponse.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def ExecuteStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/server.Jarvis/ExecuteStream',
+            jarvis__pb2.ExecuteRequest.SerializeToString,
+            jarvis__pb2.ExecuteResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def ExecutePlanStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/server.Jarvis/ExecutePlanStream',
+            jarvis__pb2.ExecuteRequest.SerializeToString,
+            jarvis__pb2.ExecuteResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -1,5 +1,8 @@
 import os
+import queue
 import logging
+import threading
+import contextvars
 
 from datetime import datetime
 import hashlib
@@ -12,6 +15,7 @@ import traceback
 import jarvis.server.jarvis_pb2 as jarvis_pb2
 import jarvis.server.jarvis_pb2_grpc as jarvis_pb2_grpc
 from jarvis.agent.jarvis_agent import JarvisAgent, EMPTY_FIELD_INDICATOR
+from jarvis.smartgpt import gpt, streaming, usage
 
 
 class JarvisServicer(jarvis_pb2_grpc.JarvisServicer, JarvisAgent):
@@ -80,6 +84,8 @@ class JarvisServicer(jarvis_pb2_grpc.JarvisServicer, JarvisAgent):
                 error="failed to get execution result",
             )
 
+        logging.info(f"Task {task_info.task_num} {task_info.metadata.get('llm_usage')}")
+        logging.info(f"Server-wide {usage.SERVER_USAGE.report()}")
         return jarvis_pb2.ExecuteResponse(
             executor_id=executor_id,
             task_id=task_info.task_num,
@@ -115,6 +121,7 @@ class JarvisServicer(jarvis_pb2_grpc.JarvisServicer, JarvisAgent):
                 error=str(e),
             )
 
+        logging.info(f"Server-wide {usage.SERVER_USAGE.report()}")
         response = jarvis_pb2.ExecuteResponse(
             executor_id=executor_id,
             goal=goal,
@@ -134,6 +141,43 @@ class JarvisServicer(jarvis_pb2_grpc.JarvisServicer, JarvisAgent):
             response.subtasks.append(task_response)
         return response
 
+    def ExecuteStream(self, request, context):
+        yield from self._stream(self.Execute, request, context)
+
+    def ExecutePlanStream(self, request, context):
+        yield from self._stream(self.ExecutePlan, request, context)
+
+    def _stream(self, execute, request, context):
+        """Runs execute in a thread, sending its partial output before its response."""
+        events = queue.Queue()
+
+        def run():
+            with streaming.listen(lambda kind, text: events.put((kind, text))):
+                try:
+                    response = execute(request, context)
+                except Exception as e:
+                    logging.error(traceback.format_exc())
+                    response = jarvis_pb2.ExecuteResponse(
+                        executor_id=request.executor_id, error=str(e)
+                    )
+            events.put(response)
+
+        threading.Thread(
+            target=contextvars.copy_context().run, args=(run,), daemon=True
+        ).start()
+        while True:
+            event = events.get()
+            if isinstance(event, jarvis_pb2.ExecuteResponse):
+                yield event
+                return
+            kind, text = event
+            yield jarvis_pb2.ExecuteResponse(
+                executor_id=request.executor_id,
+                task_id=request.task_id,
+                chunk_kind=kind,
+                chunk_text=text,
+            )
+
     def SaveSkill(self, request, context):
         if len(request.executor_id.strip()) <= 0:
             return jarvis_pb2.SaveSkillResponse(
@@ -168,6 +212,9 @@ def serve():
         filename=f"grpc_jarvis.log",
     )
 
+    # load the local model before serving, not on the first request
+    gpt.warm_up_local_models()
+
     server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
     jarvis_pb2_grpc.add_JarvisServicer_to_server(
         JarvisServicer(skill_library_dir=skill_lib_dir), server
@@ -1,21 +1,20 @@
 from dataclasses import dataclass, field
+from contextlib import contextmanager
 import subprocess
 import os
 import inspect
 import json
 import logging
-import time
+import threading
 import venv
-from typing import Union, List, Dict
+from typing import Any, Callable, Union, List, Dict, Optional, Tuple
 from abc import ABC
 import uuid
 from urllib.parse import urlparse, urlunparse
 import hashlib
 import platform
 import requests
-import pkgutil
 
-from bs4 import BeautifulSoup
 import yaml
 
 from webdriver_manager.chrome import ChromeDriverManager
@@ -26,6 +25,17 @@ from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 
 from jarvis.smartgpt import gpt
+from jarvis.smartgpt import extractor
+from jarvis.smartgpt import compactor
+from jarvis.smartgpt import search
+from jarvis.smartgpt import pyworker
+from jarvis.smartgpt import venvs
+from jarvis.smartgpt import provisioner
+from jarvis.smartgpt import runmemo
+from jarvis.smartgpt import sandbox
+from jarvis.smartgpt import streaming
+from jarvis.smartgpt import structured
+from jarvis.smartgpt import usage
 from jarvis.smartgpt import jvm
 from jarvis.smartgpt import utils
 from jarvis.smartgpt import preprompts
@@ -36,15 +46,30 @@ TEXT_COMPLETION_MODEL = gpt.GPT_3_5_TURBO_16K
 _CACHE = {}
 _ENABLE_CACHE = True
 
+# Pages fetched with HTTP validators, they are revalidated with the origin even if the cache is disabled
+_VALIDATED_PAGES_FILE = "validated_pages.json"
+_VALIDATED_PAGES = {}
+try:
+    # the pages saved least recently are forgotten beyond this number
+    MAX_VALIDATED_PAGES = int(os.getenv("JARVIS_MAX_VALIDATED_PAGES", "200"))
+except (ValueError, TypeError):
+    MAX_VALIDATED_PAGES = 200
+
 
 def load_cache():
-    global _CACHE
+    global _CACHE, _VALIDATED_PAGES
     if os.path.exists("cache.json"):
         with open("cache.json", "r") as f:
             _CACHE = json.load(f)
     else:
         _CACHE = {}
 
+    if os.path.exists(_VALIDATED_PAGES_FILE):
+        with open(_VALIDATED_PAGES_FILE, "r") as f:
+            _VALIDATED_PAGES = json.load(f)
+    else:
+        _VALIDATED_PAGES = {}
+
 
 def enable_cache():
     global _ENABLE_CACHE
@@ -72,6 +97,34 @@ def save_to_cache(key, value):
         json.dump(_CACHE, f)
 
 
+def get_validated_page(url):
+    return _VALIDATED_PAGES.get(url, None)
+
+
+_VALIDATED_PAGES_LOCK = threading.Lock()
+
+
+def save_validated_page(url, validators, text, path=_VALIDATED_PAGES_FILE):
+    with _VALIDATED_PAGES_LOCK:
+        # saved last, so evicted last
+        _VALIDATED_PAGES.pop(url, None)
+        _VALIDATED_PAGES[url] = {**validators, "text": text}
+        while len(_VALIDATED_PAGES) > MAX_VALIDATED_PAGES:
+            del _VALIDATED_PAGES[next(iter(_VALIDATED_PAGES))]
+
+        # replaced whole, so a reader never sees a partly written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(_VALIDATED_PAGES, f)
+        os.replace(tmp_path, path)
+
+
+def _in_background(fn, *args):
+    thread = threading.Thread(target=fn, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
 @dataclass(frozen=True)
 class Action(ABC):
     @classmethod
@@ -117,6 +170,9 @@ class FetchWebContentAction:
     url: str
     save_to: str = ""  # the key that will be used to save content to database
 
+    # timeout of the requests used to check whether a page has changed, in seconds
+    validation_timeout = 10
+
     def key(self):
         return "FetchWebContent"
 
@@ -183,36 +239,105 @@ class FetchWebContentAction:
 
     @staticmethod
     def extract_text(html: str) -> str:
-        soup = BeautifulSoup(html, "html.parser")
-        for script in soup(["script", "style"]):
-            script.extract()
-
-        # modify a tags to include href in markdown format
-        for a in soup.find_all("a"):
-            url = a.get("href", "")
-
-            # Only modify the link if it's an external link (i.e., starts with 'http' or 'https')
-            if url and (url.startswith("http://") or url.startswith("https://")):
-                a.string = f"[{a.get_text()}]({url})"
-
-        text = soup.get_text()
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = "\n".join(chunk for chunk in chunks if chunk)
+        return extractor.extract_text(html)
+
+    @staticmethod
+    def get_text(html: str) -> str:
+        if not compactor.ENABLE_COMPACTION:
+            return FetchWebContentAction.extract_text(html)
+
+        compacted = compactor.compact_page(
+            html, FetchWebContentAction.extract_text, gpt.count_tokens
+        )
+        logging.info(
+            f"FetchWebContentAction compacted content from {compacted.tokens_before} "
+            f"to {compacted.tokens_after} tokens (main content found: {compacted.main_content_found})."
+        )
+        return compacted.text
+
+    @staticmethod
+    def get_validators(headers) -> Dict[str, str]:
+        validators = {}
+        if headers.get("ETag"):
+            validators["etag"] = headers["ETag"]
+        if headers.get("Last-Modified"):
+            validators["last_modified"] = headers["Last-Modified"]
+        return validators
+
+    def check_page(self, url: str, page) -> Tuple[bool, Dict[str, str]]:
+        """Returns whether the recorded page is still fresh, and the current validators of the url."""
+        headers = {}
+        if page.get("etag"):
+            headers["If-None-Match"] = page["etag"]
+        if page.get("last_modified"):
+            headers["If-Modified-Since"] = page["last_modified"]
+
+        try:
+            # stream the response so a changed page isn't downloaded twice, it is rendered by the browser
+            with requests.get(
+                url,
+                headers=headers,
+                timeout=self.validation_timeout,
+                allow_redirects=True,
+                stream=True,
+            ) as response:
+                return response.status_code == 304, self.get_validators(
+                    response.headers
+                )
+        except requests.exceptions.RequestException as err:
+            logging.warning(f"FetchWebContentAction failed to validate {url}: {err}")
+            return False, {}
+
+    def record_validators(self, url: str, text: str, path: str):
+        """Records the validators of a page fetched for the first time, to revalidate it next time."""
+        try:
+            response = requests.head(
+                url, timeout=self.validation_timeout, allow_redirects=True
+            )
+            response.close()
+        except requests.exceptions.RequestException as err:
+            logging.warning(
+                f"FetchWebContentAction failed to get the validators of {url}: {err}"
+            )
+            return
+
+        validators = self.get_validators(response.headers)
+        if validators:
+            save_validated_page(url, validators, text, path)
+
+    def fetch_text(self, url: str) -> str:
+        page = get_validated_page(url)
+        validators = {}
+        if page is not None:
+            not_modified, validators = self.check_page(url, page)
+            if not_modified:
+                logging.info(
+                    f"FetchWebContentAction: {url} is not modified, reusing its text."
+                )
+                return page["text"]
+
+        html = self.get_html(url)
+        text = self.get_text(html)
+
+        if validators:
+            save_validated_page(url, validators, text)
+        elif page is None:
+            # the browser doesn't expose the response headers, they are requested off the
+            # critical path; the working directory may change meanwhile
+            _in_background(
+                self.record_validators,
+                url,
+                text,
+                os.path.abspath(_VALIDATED_PAGES_FILE),
+            )
         return text
 
     def run(self):
-        # Check if the url is already in the cache
-        cached_key = self.url + self.save_to
-        cached_result = get_from_cache(cached_key)
-        if cached_result is not None:
-            logging.debug("FetchWebContentAction RESULT(cached).")
-            return cached_result
-
+        # pages aren't kept in the cache, which would serve them forever: fetch_text reuses
+        # the text of a page as long as the origin says it is not modified
         try:
             url = self.ensure_url_scheme(self.url)
-            html = self.get_html(url)
-            text = self.extract_text(html)
+            text = self.fetch_text(url)
         except Exception as err:
             logging.error(
                 f"FetchWebContentAction RESULT: An error occurred: {str(err)}"
@@ -223,10 +348,7 @@ class FetchWebContentAction:
             return f"FetchWebContentAction RESULT: An error occurred: {str(err)}"
         else:
             logging.debug(f"\nFetchWebContentAction RESULT:\n{text}")
-            result_str = json.dumps({"kvs": [{"key": self.save_to, "value": text}]})
-
-            save_to_cache(cached_key, result_str)
-            return result_str
+            return json.dumps({"kvs": [{"key": self.save_to, "value": text}]})
 
 
 @dataclass(frozen=True)
@@ -252,47 +374,24 @@ class WebSearchAction:
             logging.info(f"\nWebSearchAction RESULT(cached)\n")
             return cached_result
 
-        url = "https://www.googleapis.com/customsearch/v1"
-        params = {
-            "q": self.query,
-            "num": 3,
-            "key": os.getenv("GOOGLE_API_KEY"),
-            "cx": os.getenv("GOOGLE_SEARCH_ENGINE_ID"),
-        }
-
-        for _ in range(3):  # retry for 3 times
-            try:
-                response = requests.get(url, params=params)
-                response.raise_for_status()  # raise exception if the request was unsuccessful
-
-                search_results = response.json()
-                if not search_results.get("items"):
-                    logging.error(
-                        f"WebSearchAction RESULT: The online search for `{self.query}` appears to have failed."
-                    )
-                    continue  # retry on failure
-
-                # return a list of links
-                result = [item["link"] for item in search_results["items"]]
-                logging.debug(f"WebSearchAction RESULT: {result}")
+        try:
+            result = search.get_provider().search(self.query)
+        except Exception as err:
+            logging.error(f"WebSearchAction RESULT: An error occurred: {err}")
+            return "WebSearchAction RESULT: Max retry limit reached."
 
-                result_str = json.dumps(
-                    {"kvs": [{"key": self.save_to, "value": result}]}
-                )
+        if not result:
+            logging.error(
+                f"WebSearchAction RESULT: The online search for `{self.query}` appears to have failed."
+            )
+            return "WebSearchAction RESULT: Max retry limit reached."
 
-                save_to_cache(cached_key, result_str)
-                return result_str
-            except requests.exceptions.HTTPError as http_err:
-                if http_err.response.status_code == 429:
-                    time.sleep(30)
-                else:
-                    logging.error(
-                        f"WebSearchAction RESULT: An HTTP error occurred: {http_err}"
-                    )
-            except Exception as err:
-                logging.error(f"WebSearchAction RESULT: An error occurred: {err}")
+        # return a list of links
+        logging.debug(f"WebSearchAction RESULT: {result}")
+        result_str = json.dumps({"kvs": [{"key": self.save_to, "value": result}]})
 
-        return "WebSearchAction RESULT: Max retry limit reached."
+        save_to_cache(cached_key, result_str)
+        return result_str
 
 
 @dataclass(frozen=True)
@@ -302,6 +401,10 @@ class RunPythonAction(Action):
     code: str = ""
     pkg_dependencies: List[str] = field(default_factory=list)
     cmd_args: str = ""
+    # Set by the scripts whose only inputs and effects are in the database: the reads of the
+    # database are the only inputs recorded, so a script reading files, URLs, the time or random
+    # numbers would be replayed from a stale run
+    memoize: bool = False
 
     # Keep the project's Python path
     project_dir = os.getcwd()
@@ -326,108 +429,173 @@ class RunPythonAction(Action):
         if not self.code:
             return "RunPythonAction failed: The 'code' argument can not be empty"
 
-        # Create or use existing virtual environment
-        venv_path = self._create_or_use_virtual_env(work_dir)
+        # Replay the script if it already ran with the same inputs
+        memo_key = None
+        if runmemo.ENABLE_MEMOIZATION and self.memoize:
+            memo_key = runmemo.script_key(
+                self.code, self.cmd_args, self.pkg_dependencies
+            )
+            memoized = runmemo.lookup(work_dir, memo_key)
+            if memoized is not None:
+                logging.info("RunPythonAction: replaying a previous run of the script")
+                runmemo.replay(work_dir, memoized)
+                return self._construct_output(
+                    0, memoized["stdout"], memoized["stderr"], work_dir, file_name
+                )
 
-        # Install dependencies in virtual environment
+        # Create or use existing virtual environment, kept until the script is done
+        with self._create_or_use_virtual_env(work_dir) as venv_path:
+            return self._run_in_env(venv_path, work_dir, file_name, memo_key)
 
+    def _run_in_env(self, venv_path, work_dir, file_name, memo_key):
+        # Install dependencies in virtual environment
         self._install_dependencies(venv_path)
 
         # Write code to file
-        self._write_code_to_file(work_dir, file_name)
+        trace_file = os.path.join(work_dir, f"{file_name}.reads") if memo_key else None
+        self._write_code_to_file(work_dir, file_name, trace_file)
 
         # Run the python script and fetch the output
-        exit_code, stdout_output, stderr_error = self._run_script(
-            venv_path, work_dir, file_name
-        )
+        store_before = runmemo.load_store(work_dir) if memo_key else None
+        try:
+            exit_code, stdout_output, stderr_error, usage = self._run_script(
+                venv_path, work_dir, file_name
+            )
+            if memo_key and exit_code == 0:
+                runmemo.record(
+                    work_dir,
+                    memo_key,
+                    trace_file,
+                    store_before,
+                    runmemo.load_store(work_dir),
+                    stdout_output,
+                    stderr_error,
+                )
+        finally:
+            if trace_file and os.path.exists(trace_file):
+                os.remove(trace_file)
+
         output = self._construct_output(
-            exit_code, stdout_output, stderr_error, work_dir, file_name
+            exit_code, stdout_output, stderr_error, work_dir, file_name, usage
         )
 
         return output
 
+    @contextmanager
     def _create_or_use_virtual_env(self, work_dir):
+        if venvs.SHARED_VENVS:
+            # the packages found when the task was compiled may still be installing
+            provisioner.wait(work_dir)
+            # the executor's scripts share an env with every executor needing the same packages,
+            # leased so that it isn't garbage collected under the script
+            with venvs.lease_work_dir_env(work_dir, self.pkg_dependencies) as venv_bin:
+                yield venv_bin
+            return
+
         venv_dir = os.path.join(work_dir, "venv")
         if not os.path.exists(venv_dir):
             venv.EnvBuilder(with_pip=True).create(venv_dir)
-        return os.path.join(venv_dir, "bin")
+        yield os.path.join(venv_dir, "bin")
 
     def _install_dependencies(self, venv_path):
-        # Get a list of all standard library modules
-        code = (
-            "import sys, pkgutil; "
-            "print('\\n'.join([module[1] for module in pkgutil.iter_modules()]))"
-        )
-        result = subprocess.check_output(
-            [
-                os.path.join(venv_path, "python")
-                if os.name != "nt"
-                else os.path.join(venv_path, "Scripts", "python.exe"),
-                "-c",
-                code,
-            ]
-        ).decode("utf-8")
-        standard_lib = result.splitlines()
-
-        # Get a list of currently installed packages in the venv
-        installed_packages = (
-            subprocess.check_output(
-                [os.path.join(venv_path, "pip"), "list", "--format=freeze"]
-            )
-            .decode("utf-8")
-            .splitlines()
-        )
-        installed_packages = [pkg.split("==")[0] for pkg in installed_packages]
-
-        # Filter out already installed and standard library packages
-        packages_to_install = [
-            dependency
-            for dependency in self.pkg_dependencies
-            if dependency not in installed_packages and dependency not in standard_lib
-        ]
+        # Already installed and standard library packages are skipped
+        venvs.install_packages(venv_path, self.pkg_dependencies)
 
-        logging.info(f"Installing the following packages: {packages_to_install}")
-        # Install the remaining packages
-        for dependency in packages_to_install:
-            subprocess.check_call(
-                [os.path.join(venv_path, "pip"), "install", dependency]
-            )
-
-    def _write_code_to_file(self, work_dir, file_name):
+    def _write_code_to_file(self, work_dir, file_name, trace_file=None):
         with open(
             os.path.join(work_dir, file_name), mode="w", encoding="utf-8"
         ) as file:
             file.write("import sys\n")
             file.write(f"sys.path.append('{self.project_dir}')\n")
             file.write("from jarvis.smartgpt import jvm\n")
+            if trace_file:
+                file.write(f"jvm.trace_reads({trace_file!r})\n")
             file.write("jvm.load_kv_store()\n")
             file.write(self.code)
 
+    def _timeout_message(self, script_full_path):
+        return f"RunPythonAction failed: The Python script at `{script_full_path} {self.cmd_args}` timed out after {self.timeout} seconds."
+
     def _run_script(self, venv_path, work_dir, file_name):
+        """Returns (exit code, stdout, stderr, resource usage) of the script."""
         script_full_path = os.path.join(work_dir, file_name)
-        with subprocess.Popen(
-            [os.path.join(venv_path, "python"), script_full_path]
-            + self.cmd_args.split(),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        ) as process:
+        python_path = os.path.join(venv_path, "python")
+        limits = sandbox.limits_for(self.timeout)
+
+        if pyworker.ENABLED:
+            # run in a warm, pre-imported worker, falling back to a fresh interpreter if none
+            # could take the script
             try:
-                stdout_output, stderr_error = process.communicate(timeout=self.timeout)
-                return process.returncode, stdout_output, stderr_error
-            except subprocess.TimeoutExpired:
-                process.kill()
+                result = pyworker.run_script(
+                    python_path,
+                    self.project_dir,
+                    script_full_path,
+                    self.cmd_args.split(),
+                    work_dir,
+                    self.timeout,
+                    limits,
+                )
+            except pyworker.WorkerTimeoutError:
+                return 1, "", self._timeout_message(script_full_path), {}
+            except pyworker.WorkerLostError as err:
+                # the script may have run, it isn't run again
                 return (
                     1,
                     "",
-                    f"RunPythonAction failed: The Python script at `{script_full_path} {self.cmd_args}` timed out after {self.timeout} seconds.",
+                    f"Python worker failed while running {script_full_path}: {err}",
+                    {},
+                )
+            if result is not None:
+                exit_code, stdout_output, stderr_error, timed_out, usage = result
+                if timed_out:
+                    return 1, "", self._timeout_message(script_full_path), usage
+                return (
+                    exit_code,
+                    stdout_output,
+                    self._stderr(stderr_error, exit_code, limits),
+                    usage,
                 )
 
+        # stream the output into bounded buffers instead of holding all of it in memory
+        with subprocess.Popen(
+            sandbox.limited_command(
+                python_path, [script_full_path] + self.cmd_args.split(), limits
+            ),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        ) as process:
+            exit_code, stdout, stderr, timed_out, usage = sandbox.collect(
+                process.pid,
+                process.stdout.fileno(),
+                process.stderr.fileno(),
+                self.timeout,
+            )
+            # collect() reaped the process already
+            process.returncode = exit_code
+            if timed_out:
+                return 1, "", self._timeout_message(script_full_path), usage
+            return (
+                exit_code,
+                stdout.text(),
+                self._stderr(stderr.text(), exit_code, limits),
+                usage,
+            )
+
+    @staticmethod
+    def _stderr(stderr_error, exit_code, limits):
+        """The stderr of the script, with the resource limit that killed it if any."""
+        error = sandbox.limit_error(exit_code, limits)
+        if error is None:
+            return stderr_error
+        return f"{stderr_error}{error}\n"
+
     def _construct_output(
-        self, exit_code, stdout_output, stderr_error, work_dir, file_name
+        self, exit_code, stdout_output, stderr_error, work_dir, file_name, usage=None
     ):
         script_full_path = os.path.join(work_dir, file_name)
         output = f"\n`python {script_full_path} {self.cmd_args}` returned: \n#exit code {exit_code}\n"
+        if usage:
+            output += f"#resources: {usage['cpu_seconds']}s CPU, {usage['max_rss_mb']} MB peak memory\n"
         if stdout_output:
             output += f"#stdout of process:\n{stdout_output}"
         if stderr_error:
@@ -457,25 +625,14 @@ class TextCompletionAction(Action):
     def short_string(self) -> str:
         return f'action_id: {self.id()}, text completion for Request: "{self.request}".'
 
-    def generate_messages(self) -> List[Dict[str, str]]:
-        # Adjust content to fit within model's max tokens
-        content = self.content
-        max_token_count = (
-            gpt.get_max_tokens(gpt.GPT_3_5_TURBO_16K) - 4096
-        )  # leaving some space for the system and user roles and responses
-        content_token_count = gpt.count_tokens(content)
-
-        if content_token_count > max_token_count:
-            # If content is too long, truncate it to fit within model's max tokens.
-            content = gpt.truncate_to_tokens(content, max_token_count)
-
+    def _build_messages(self, content: str) -> List[Dict[str, str]]:
         user_prompt = preprompts.get("text_completion_user").format(
             request=self.request,
             output_format=utils.remove_quoted_token(self.output_format, "<to_fill>"),
             content=content,
         )
 
-        messages = [
+        return [
             {
                 "role": "system",
                 "content": preprompts.get("text_completion_sys"),
@@ -486,21 +643,29 @@ class TextCompletionAction(Action):
             },
         ]
 
-        return messages
+    def generate_messages_with_token_count(self) -> Tuple[List[Dict[str, str]], int]:
+        # Adjust content to fit within model's max tokens
+        max_token_count = (
+            gpt.get_max_tokens(gpt.GPT_3_5_TURBO_16K) - 4096
+        )  # leaving some space for the system and user roles and responses
+        # encodes the content once, truncating it if it's too long
+        content, content_token_count = gpt.TOKENIZER.truncate(
+            self.content, max_token_count
+        )
 
-    def adjust_token_and_model(self, messages: List[Dict[str, str]]) -> str:
-        request_token_count = gpt.count_tokens(messages)
-        max_token_count = gpt.get_max_tokens(self.model_name)
-        model_name = self.model_name
+        # the prompt is counted without the content, which was just counted
+        token_count = gpt.count_tokens(self._build_messages("")) + content_token_count
+        return self._build_messages(content), token_count
 
-        if (
-            request_token_count + 1024 > max_token_count
-        ):  # leave some space for the response
-            model_name = gpt.GPT_3_5_TURBO_16K
+    def generate_messages(self) -> List[Dict[str, str]]:
+        return self.generate_messages_with_token_count()[0]
 
-        return model_name
+    def run(self, on_kv: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        """Returns the completion, on_kv is called with each of its kvs as soon as it arrives.
 
-    def run(self) -> str:
+        Without on_kv, output formats with kvs are filled by a function call instead, on the
+        models supporting it, and their kvs arrive all at once.
+        """
         hash_key = self.request + str(jvm.get("idx"))
         hash_str = hashlib.md5(hash_key.encode()).hexdigest()
         cached_key = f"{hash_str}"
@@ -512,14 +677,51 @@ class TextCompletionAction(Action):
             )
             return cached_result
 
-        messages = self.generate_messages()
-        model_name = self.adjust_token_and_model(messages)
+        messages, token_count = self.generate_messages_with_token_count()
+        # a caller waiting for the kvs one by one gets them streamed, the function call
+        # arguments would only arrive once complete
+        stream = on_kv is not None and gpt.ENABLE_STREAMING
+        function = (
+            structured.output_function(self.output_format)
+            if gpt.ENABLE_FUNCTION_CALLING and not stream
+            else None
+        )
 
         try:
-            result = gpt.send_messages(messages, model_name)
+            # the router moves the request to a larger model if it doesn't fit model_name
+            with usage.default_call_site("text_completion"):
+                if function is not None:
+                    # the kvs come back as the arguments of a function call, no JSON to parse
+                    # out of free text
+                    result = gpt.call_function(
+                        messages, self.model_name, function, prompt_tokens=token_count
+                    )
+                elif stream:
+                    kvs = streaming.JSONArrayStream("kvs")
+
+                    def on_token(piece: str):
+                        for kv in kvs.feed(piece):
+                            on_kv(kv)
+
+                    result = gpt.stream_messages(
+                        messages, self.model_name, on_token, prompt_tokens=token_count
+                    )
+                else:
+                    result = gpt.send_messages(
+                        messages, self.model_name, prompt_tokens=token_count
+                    )
             if result is None:
                 raise ValueError("Generating text completion appears to have failed.")
-            result = utils.strip_json(result)
+            if function is not None:
+                kvs = structured.to_kvs(utils.loads_json(result))
+                result = json.dumps({"kvs": kvs}, ensure_ascii=False)
+            else:
+                result = utils.strip_json(result)
+                try:
+                    json.loads(result)
+                except json.JSONDecodeError:
+                    # repaired once here, rather than failing the task and having it retried whole
+                    result = json.dumps(utils.loads_json(result), ensure_ascii=False)
 
             save_to_cache(cached_key, result)
             return result
@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# openai sends LLM requests to OpenAI, record also saves them into the cassette, replay answers
+# them from the cassette without any network access
+LLM_BACKEND = os.getenv("JARVIS_LLM_BACKEND", "openai").lower()
+# absolute, the agent changes the working directory to the executor's
+CASSETTE_PATH = os.path.abspath(
+    os.path.expanduser(os.getenv("JARVIS_LLM_CASSETTE", "llm_cassette.jsonl"))
+)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except (ValueError, TypeError):
+        return default
+
+
+# Simulated latency of a replayed response: its recorded latency times the scale, plus a fixed delay
+REPLAY_LATENCY_SCALE = _env_float("JARVIS_LLM_CASSETTE_LATENCY_SCALE", 0.0)
+REPLAY_LATENCY = _env_float("JARVIS_LLM_CASSETTE_LATENCY", 0.0)
+
+Request = Union[str, List[Tuple[str, str]]]
+
+
+class CassetteMissError(KeyError):
+    """The replayed request was never recorded."""
+
+
+def request_key(model: str, temperature: float, request: Request) -> str:
+    """Identifies a request by its model, temperature and a hash of its prompt or messages.
+
+    Messages are (role, content) pairs with the roles of the OpenAI API: system, user, assistant.
+    """
+    if not isinstance(request, str):
+        request = [list(message) for message in request]
+    digest = hashlib.sha256(
+        json.dumps([temperature, request]).encode("utf-8")
+    ).hexdigest()
+    return f"{model}:{digest}"
+
+
+class Cassette:
+    """LLM requests and their responses, one JSON object per line.
+
+    A request recorded several times is replayed with its responses in the recorded order,
+    the last one is repeated once they run out.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        latency_scale: float = REPLAY_LATENCY_SCALE,
+        latency: float = REPLAY_LATENCY,
+    ):
+        self.path = path
+        self.latency_scale = latency_scale
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self._replayed: Dict[str, int] = defaultdict(int)
+
+    def _load(self) -> Dict[str, List[Dict[str, Any]]]:
+        if self._entries is None:
+            self._entries = defaultdict(list)
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self._entries[entry["key"]].append(entry)
+        return self._entries
+
+    def record(
+        self, key: str, model: str, request: Request, response: str, latency: float
+    ):
+        entry = {
+            "key": key,
+            "model": model,
+            "request": request,
+            "response": response,
+            "latency": round(latency, 3),
+        }
+        with self._lock:
+            self._load()[key].append(entry)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def replay(self, key: str) -> Tuple[str, float]:
+        """Returns the next recorded response of key and the seconds to wait before answering."""
+        with self._lock:
+            entries = self._load().get(key)
+            if not entries:
+                raise CassetteMissError(f"Request {key} is not recorded in {self.path}")
+            index = min(self._replayed[key], len(entries) - 1)
+            self._replayed[key] += 1
+        entry = entries[index]
+        return (
+            entry["response"],
+            entry.get("latency", 0.0) * self.latency_scale + self.latency,
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(entries) for entries in self._load().values())
+
+
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Cassette:
+    global _cassette
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(CASSETTE_PATH)
+        return _cassette
@@ -0,0 +1,237 @@
+import os
+import re
+import copy
+import logging
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from jarvis.smartgpt import extractor
+from jarvis.smartgpt import utils
+
+# Whether FetchWebContent compacts the page text before saving it to the database
+ENABLE_COMPACTION = utils.str_to_bool(os.getenv("JARVIS_COMPACT_WEB_CONTENT", "true"))
+
+# Main content shorter than this is considered a failed extraction, the whole page is used instead
+MIN_MAIN_CONTENT_CHARS = 250
+# Only lines at least this long are de-duplicated, short fragments such as "|" or "by" are kept
+MIN_DEDUP_LINE_CHARS = 8
+# Runs of link-only lines at least this long are collapsed into a single line
+MIN_LINK_RUN = 3
+# Number of links kept when a run of links is collapsed
+MAX_LINKS_PER_RUN = 8
+
+BOILERPLATE_TAGS = [
+    "script",
+    "style",
+    "noscript",
+    "nav",
+    "footer",
+    "aside",
+    "form",
+    "iframe",
+    "svg",
+    "button",
+]
+
+NEGATIVE_PATTERN = re.compile(
+    r"banner|breadcrumb|combx|comment|consent|cookie|footer|gdpr|masthead|menu|modal|nav|"
+    r"newsletter|popup|promo|related|share|sidebar|social|sponsor|subscribe|widget|advert",
+    re.IGNORECASE,
+)
+POSITIVE_PATTERN = re.compile(
+    r"article|body|content|entry|main|page|post|story|text|blog", re.IGNORECASE
+)
+MARKDOWN_LINK_LINE = re.compile(r"^\[[^\]]*\]\([^)]*\)$")
+
+
+@dataclass
+class CompactionResult:
+    text: str
+    tokens_before: int
+    tokens_after: int
+    main_content_found: bool
+
+
+def _class_weight(element) -> int:
+    weight = 0
+    for attr in (element.get("class"), element.get("id")):
+        if not attr:
+            continue
+        if NEGATIVE_PATTERN.search(attr):
+            weight -= 25
+        if POSITIVE_PATTERN.search(attr):
+            weight += 25
+    return weight
+
+
+def _link_density(element) -> float:
+    text_length = len(element.text_content())
+    if text_length == 0:
+        return 0.0
+    link_length = sum(len(a.text_content()) for a in element.iter("a"))
+    return link_length / text_length
+
+
+def _remove_boilerplate(root):
+    from lxml import etree
+
+    etree.strip_elements(root, *BOILERPLATE_TAGS, with_tail=False)
+    # Page headers are boilerplate, but an article's own header carries its title
+    for header in list(root.iter("header")):
+        if not any(ancestor.tag == "article" for ancestor in header.iterancestors()):
+            header.drop_tree()
+    for element in list(root.iter("div", "section", "ul", "p", "span", "table")):
+        parent = element.getparent()
+        if parent is None:
+            continue
+        attrs = f"{element.get('class', '')} {element.get('id', '')}"
+        if NEGATIVE_PATTERN.search(attrs) and not POSITIVE_PATTERN.search(attrs):
+            element.drop_tree()
+
+
+def _parse(html: str):
+    if not html or not html.strip():
+        return None
+    try:
+        return extractor.parse_html(html)
+    except ImportError:
+        logging.debug("lxml is not installed, skipping main content extraction")
+        return None
+
+
+def _main_content_blocks(root) -> list:
+    """Readability-style extraction on a parsed tree, returns the main content blocks or []."""
+    _remove_boilerplate(root)
+
+    # Score the parents of every paragraph like readability does
+    scores = {}
+    for paragraph in root.iter("p", "pre", "td"):
+        text = paragraph.text_content().strip()
+        if len(text) < 25:
+            continue
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+        parent = paragraph.getparent()
+        grand_parent = parent.getparent() if parent is not None else None
+        for candidate, share in ((parent, 1.0), (grand_parent, 0.5)):
+            if candidate is None:
+                continue
+            if candidate not in scores:
+                scores[candidate] = _class_weight(candidate) + (
+                    5 if candidate.tag in ("div", "article", "main", "section") else 0
+                )
+            scores[candidate] += score * share
+
+    if not scores:
+        return []
+
+    for candidate in scores:
+        scores[candidate] *= 1 - _link_density(candidate)
+
+    top = max(scores, key=scores.get)
+    threshold = max(10, scores[top] * 0.2)
+
+    # Keep the siblings that look like part of the same article
+    parent = top.getparent()
+    if parent is None:
+        return [top]
+    return [
+        sibling
+        for sibling in parent
+        if sibling is top or scores.get(sibling, 0) >= threshold
+    ]
+
+
+def extract_main_content(html: str) -> Optional[str]:
+    """Readability-style extraction, returns the HTML of the main content block or None."""
+    root = _parse(html)
+    if root is None:
+        return None
+
+    from lxml import etree
+
+    blocks = _main_content_blocks(root)
+    if not blocks:
+        return None
+
+    return "".join(
+        etree.tostring(block, encoding="unicode", method="html") for block in blocks
+    )
+
+
+def _collapse_links(lines: List[str]) -> List[str]:
+    if len(lines) < MIN_LINK_RUN:
+        return lines
+
+    kept = lines[:MAX_LINKS_PER_RUN]
+    collapsed = " | ".join(kept)
+    if len(lines) > len(kept):
+        collapsed += f" | (+{len(lines) - len(kept)} more links)"
+    return [collapsed]
+
+
+def compact_text(text: str) -> str:
+    """Removes repeated lines and collapses runs of link-only lines."""
+    seen = set()
+    result = []
+    link_run = []
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        if len(line) >= MIN_DEDUP_LINE_CHARS:
+            normalized = " ".join(line.lower().split())
+            if normalized in seen:
+                continue
+            seen.add(normalized)
+
+        if MARKDOWN_LINK_LINE.match(line):
+            link_run.append(line)
+            continue
+
+        result.extend(_collapse_links(link_run))
+        link_run = []
+        result.append(line)
+
+    result.extend(_collapse_links(link_run))
+    return "\n".join(result)
+
+
+def compact_page(
+    html: str,
+    extract: Callable[[str], str],
+    count_tokens: Callable[[str], int],
+) -> CompactionResult:
+    """Turns html into compact text, reporting the token count before and after.
+
+    The page is parsed once: the main content and the full text both come from the lxml tree,
+    extract is only used for the pages lxml can't parse.
+    """
+    root = _parse(html)
+    if root is None:
+        full_text = extract(html)
+        main_text = ""
+    else:
+        import lxml.html
+
+        # Copying the tree is much cheaper than parsing the page again
+        blocks = _main_content_blocks(copy.deepcopy(root))
+        full_text = extractor.tree_to_text(root)
+        main_text = ""
+        if blocks:
+            # The copy is thrown away, moving its blocks keeps their tails
+            container = lxml.html.Element("div")
+            container.extend(blocks)
+            main_text = extractor.tree_to_text(container)
+
+    main_content_found = len(main_text) >= MIN_MAIN_CONTENT_CHARS
+
+    text = compact_text(main_text if main_content_found else full_text)
+
+    return CompactionResult(
+        text=text,
+        tokens_before=count_tokens(full_text),
+        tokens_after=count_tokens(text),
+        main_content_found=main_content_found,
+    )
@@ -4,6 +4,7 @@ from typing import Dict, List, Optional
 
 import yaml
 
+from jarvis.smartgpt import provisioner
 from jarvis.smartgpt.translator import Translator
 
 
@@ -67,6 +68,8 @@ class Compiler:
             self.write_yaml(f"{num}.yaml", instructions_yaml_str)
 
             task_instrs = yaml.safe_load(instructions_yaml_str)
+            # install the task's packages while the next tasks are translated
+            provisioner.provision(os.getcwd(), task_instrs)
             result.append(task_instrs)
 
             task_outcomes[num] = {
@@ -115,6 +118,7 @@ class Compiler:
                 )
                 self.write_yaml(file_name, instructions_yaml_str)
                 task_instrs = yaml.safe_load(instructions_yaml_str)
+            provisioner.provision(os.getcwd(), task_instrs)
 
             result.append(task_instrs)
 
@@ -149,4 +153,5 @@ class Compiler:
         instructions_yaml_str = self.translator.translate_to_instructions(task_info)
         self.write_yaml(f"{task_num}.yaml", instructions_yaml_str)
         result = yaml.safe_load(instructions_yaml_str)
+        provisioner.provision(os.getcwd(), result)
         return result
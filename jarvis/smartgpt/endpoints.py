@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from jarvis.smartgpt import retry
+from jarvis.smartgpt.ratelimit import RateLimit, RateLimiter, parse_rate_limits
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except (ValueError, TypeError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except (ValueError, TypeError):
+        return default
+
+
+# JSON file listing the API keys, Azure regions and deployments serving the models, see load_endpoints
+ENDPOINTS_PATH = os.getenv("JARVIS_LLM_ENDPOINTS")
+# An endpoint failing this many requests in a row with a 429, a 5xx or a connection error is ejected
+EJECT_AFTER = _env_int("JARVIS_LLM_ENDPOINT_EJECT_AFTER", 3)
+# for this many seconds, doubled each time it fails again right after coming back, up to the max
+EJECT_SECONDS = _env_float("JARVIS_LLM_ENDPOINT_EJECT_SECONDS", 30.0)
+MAX_EJECT_SECONDS = _env_float("JARVIS_LLM_ENDPOINT_MAX_EJECT_SECONDS", 600.0)
+
+# endpoints serving every model, they list no models of their own
+ALL_MODELS = "*"
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    """One API key at one OpenAI or Azure base URL, serving one model."""
+
+    name: str
+    api_key: Optional[str] = None
+    api_base: Optional[str] = None
+    api_type: str = "open_ai"
+    api_version: Optional[str] = None
+    organization: Optional[str] = None
+    # the Azure deployment of the model
+    deployment: Optional[str] = None
+    weight: int = 1
+    rate_limit: Optional[RateLimit] = None
+
+    @property
+    def is_azure(self) -> bool:
+        return self.api_type == "azure"
+
+    def credentials(self) -> Dict[str, Any]:
+        """Arguments of the LangChain client sending requests to this endpoint."""
+        credentials = {"openai_api_key": self.api_key, "openai_api_base": self.api_base}
+        if self.organization:
+            credentials["openai_organization"] = self.organization
+        return {name: value for name, value in credentials.items() if value is not None}
+
+    def model_kwargs(self) -> Optional[Dict[str, Any]]:
+        if not self.is_azure:
+            return None
+        return {"api_type": "azure", "api_version": self.api_version}
+
+
+def is_endpoint_failure(err: Exception) -> bool:
+    """Whether err counts against the endpoint's health: throttled, failing or unreachable.
+
+    A rejected request, such as one too long for the model, says nothing about the endpoint.
+    """
+    status = getattr(err, "http_status", None) or getattr(err, "status", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return retry.is_retryable(err)
+
+
+@dataclass
+class _EndpointState:
+    endpoint: Endpoint
+    limiter: Optional[RateLimiter]
+    current_weight: int = 0
+    # failures in a row, and ejections in a row without a success in between
+    failures: int = 0
+    ejections: int = 0
+    ejected_until: float = 0.0
+    requests: int = 0
+    errors: int = 0
+    latency: retry.LatencyTracker = field(default_factory=retry.LatencyTracker)
+
+
+class EndpointPool:
+    """The endpoints serving one model, picked by smooth weighted round-robin.
+
+    An endpoint failing EJECT_AFTER requests in a row stops being picked for a while, then
+    takes requests again on probation: one more failure ejects it for twice as long.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        endpoints: List[Endpoint],
+        default_limit: Optional[RateLimit] = None,
+        rate_limited: bool = True,
+        eject_after: int = EJECT_AFTER,
+        eject_seconds: float = EJECT_SECONDS,
+        max_eject_seconds: float = MAX_EJECT_SECONDS,
+    ):
+        if not endpoints:
+            raise ValueError(f"No endpoint serves {model}")
+        self.model = model
+        self.eject_after = max(1, eject_after)
+        self.eject_seconds = eject_seconds
+        self.max_eject_seconds = max_eject_seconds
+        self._lock = threading.Lock()
+        self._states: Dict[str, _EndpointState] = {}
+        for endpoint in endpoints:
+            limit = endpoint.rate_limit or default_limit
+            limiter = (
+                RateLimiter(f"{model}@{endpoint.name}", limit)
+                if rate_limited and limit
+                else None
+            )
+            self._states[endpoint.name] = _EndpointState(endpoint, limiter)
+
+    @property
+    def endpoints(self) -> List[Endpoint]:
+        return [state.endpoint for state in self._states.values()]
+
+    def pick(
+        self, now: Optional[float] = None, exclude: Tuple[str, ...] = ()
+    ) -> Optional[Endpoint]:
+        """The endpoint of the next request.
+
+        A request failing over from the endpoints in exclude gets another healthy endpoint,
+        None if there is none left.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            states = [
+                state
+                for state in self._states.values()
+                if state.endpoint.name not in exclude
+            ]
+            available = [state for state in states if state.ejected_until <= now]
+            if not available:
+                if exclude or not states:
+                    return None
+                # everything is ejected, the endpoint coming back first is tried early
+                state = min(states, key=lambda state: state.ejected_until)
+                state.requests += 1
+                return state.endpoint
+
+            total = 0
+            for state in available:
+                state.current_weight += state.endpoint.weight
+                total += state.endpoint.weight
+            state = max(available, key=lambda state: state.current_weight)
+            state.current_weight -= total
+
+            if state.ejected_until:
+                logging.info(
+                    f"Endpoint {state.endpoint.name} of {self.model} is back on probation"
+                )
+                state.ejected_until = 0.0
+                state.failures = self.eject_after - 1
+            state.requests += 1
+            return state.endpoint
+
+    def rate_limiter(self, endpoint: Endpoint) -> Optional[RateLimiter]:
+        return self._states[endpoint.name].limiter
+
+    def report(
+        self,
+        endpoint: Endpoint,
+        latency: Optional[float] = None,
+        error: Optional[Exception] = None,
+        now: Optional[float] = None,
+    ):
+        """Records the outcome of a request sent to endpoint."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._states[endpoint.name]
+            if error is None or not is_endpoint_failure(error):
+                if latency is not None:
+                    state.latency.record(latency)
+                state.failures = 0
+                state.ejections = 0
+                return
+
+            state.errors += 1
+            state.failures += 1
+            if state.failures < self.eject_after or state.ejected_until > now:
+                return
+            state.ejections += 1
+            state.failures = 0
+            seconds = min(
+                self.max_eject_seconds, self.eject_seconds * 2 ** (state.ejections - 1)
+            )
+            state.ejected_until = now + seconds
+        logging.warning(
+            f"Ejecting endpoint {endpoint.name} of {self.model} for {seconds:.0f}s "
+            f"({type(error).__name__}: {error})"
+        )
+
+    def expected_wait(self, tokens: int, now: Optional[float] = None) -> float:
+        """Seconds a request would wait for the rate limit of the least loaded endpoint."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            limiters = [
+                state.limiter
+                for state in self._states.values()
+                if state.ejected_until <= now
+            ]
+        if not limiters:
+            return float("inf")
+        return min(
+            limiter.expected_wait(tokens) if limiter is not None else 0.0
+            for limiter in limiters
+        )
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Health, traffic and latency of every endpoint."""
+        now = time.monotonic()
+        with self._lock:
+            states = list(self._states.values())
+            stats = {
+                state.endpoint.name: {
+                    "weight": state.endpoint.weight,
+                    "healthy": state.ejected_until <= now,
+                    "ejected_for": round(max(0.0, state.ejected_until - now), 1),
+                    "requests": state.requests,
+                    "errors": state.errors,
+                }
+                for state in states
+            }
+        for state in states:
+            stats[state.endpoint.name]["p50_latency"] = state.latency.percentile(50)
+            stats[state.endpoint.name]["p95_latency"] = state.latency.percentile(95)
+        return stats
+
+
+def parse_endpoints(config: List[Dict[str, Any]]) -> Dict[str, List[Endpoint]]:
+    """Endpoints by model, from a list of endpoint configurations such as
+
+        {"name": "openai-a", "api_key_env": "OPENAI_KEY_A", "models": ["gpt-4"], "weight": 2}
+        {"name": "azure-east", "api_type": "azure", "api_base": "https://east.openai.azure.com/",
+         "api_version": "2023-07-01-preview", "api_key_env": "AZURE_EAST_KEY",
+         "deployments": {"gpt-4": "gpt-4-0613-azure"}, "rate_limits": "gpt-4=200:40000"}
+
+    Keys are better read from the environment variable named by api_key_env than written in
+    api_key. Azure endpoints serve the models of their deployments, OpenAI endpoints the models
+    they list, or all of them.
+    """
+    endpoints: Dict[str, List[Endpoint]] = {}
+    for index, item in enumerate(config):
+        name = item.get("name", f"endpoint-{index}")
+        api_type = item.get("api_type", "open_ai")
+        api_key = item.get("api_key") or os.getenv(
+            item.get("api_key_env", "OPENAI_API_KEY")
+        )
+        if not api_key:
+            logging.error(f"Endpoint {name} has no API key, skipping it")
+            continue
+
+        deployments: Dict[str, Optional[str]] = item.get("deployments") or {}
+        if api_type == "azure":
+            if not deployments:
+                logging.error(f"Azure endpoint {name} has no deployments, skipping it")
+                continue
+        else:
+            deployments = {model: None for model in item.get("models") or [ALL_MODELS]}
+
+        rate_limits = parse_rate_limits(item.get("rate_limits"))
+        for model, deployment in deployments.items():
+            endpoints.setdefault(model, []).append(
+                Endpoint(
+                    name=name,
+                    api_key=api_key,
+                    api_base=item.get("api_base"),
+                    api_type=api_type,
+                    api_version=item.get("api_version"),
+                    organization=item.get("organization"),
+                    deployment=deployment,
+                    weight=max(1, int(item.get("weight", 1))),
+                    rate_limit=rate_limits.get(model),
+                )
+            )
+    return endpoints
+
+
+def load_endpoints(path: Optional[str]) -> Dict[str, List[Endpoint]]:
+    if not path:
+        return {}
+    try:
+        with open(os.path.expanduser(path), "r") as f:
+            return parse_endpoints(json.load(f))
+    except (OSError, ValueError) as err:
+        logging.error(f"Failed to load the LLM endpoints from {path}: {err}")
+        return {}
+
+
+def endpoints_for(endpoints: Dict[str, List[Endpoint]], model: str) -> List[Endpoint]:
+    return endpoints.get(model, []) + endpoints.get(ALL_MODELS, [])
@@ -0,0 +1,210 @@
+import os
+import re
+import logging
+import atexit
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Type
+
+# Which engine FetchWebContent uses to turn HTML into text: "bs4", "lxml" or "selectolax"
+DEFAULT_EXTRACTOR = os.getenv("JARVIS_HTML_EXTRACTOR", "lxml")
+
+# Number of worker processes used for extraction, 0 means extracting in the calling thread
+try:
+    EXTRACTOR_PROCESSES = int(os.getenv("JARVIS_HTML_EXTRACTOR_PROCESSES", "0"))
+except (ValueError, TypeError):
+    EXTRACTOR_PROCESSES = 0
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def is_external_link(url: str) -> bool:
+    return bool(url) and (url.startswith("http://") or url.startswith("https://"))
+
+
+def markdown_link(text: str, url: str) -> str:
+    return f"[{text}]({url})"
+
+
+# lxml refuses str input with an encoding declaration, the text is decoded already
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+
+def parse_html(html: str):
+    """Parses html with lxml, returns None if it can't.
+
+    An XML declaration, as XHTML pages start with, is dropped: it is irrelevant to a decoded str.
+    """
+    import lxml.html
+    from lxml import etree
+
+    try:
+        return lxml.html.fromstring(_XML_DECLARATION.sub("", html, count=1))
+    except (etree.ParserError, ValueError) as err:
+        logging.debug(f"lxml failed to parse the page: {err}")
+        return None
+
+
+def tree_to_text(root) -> str:
+    """Text of a tree returned by parse_html, external links in markdown format. Modifies the tree."""
+    from lxml import etree
+
+    etree.strip_elements(root, "script", "style", with_tail=False)
+
+    for a in root.iter("a"):
+        url = a.get("href", "")
+        if is_external_link(url):
+            text = a.text_content()
+            tail = a.tail
+            for child in list(a):
+                a.remove(child)
+            a.text = markdown_link(text, url)
+            a.tail = tail
+
+    return normalize_text(root.text_content())
+
+
+def normalize_text(text: str) -> str:
+    """Strips every line, splits it into phrases on double spaces and drops the empty ones."""
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return "\n".join(chunk for chunk in chunks if chunk)
+
+
+class HTMLExtractor(ABC):
+    """Turns HTML into plain text, keeping external links in markdown format."""
+
+    name = ""
+
+    @abstractmethod
+    def extract(self, html: str) -> str:
+        pass
+
+
+class BeautifulSoupExtractor(HTMLExtractor):
+    name = "bs4"
+
+    def extract(self, html: str) -> str:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, "html.parser")
+        for script in soup(["script", "style"]):
+            script.extract()
+
+        # modify a tags to include href in markdown format
+        for a in soup.find_all("a"):
+            url = a.get("href", "")
+
+            # Only modify the link if it's an external link (i.e., starts with 'http' or 'https')
+            if is_external_link(url):
+                a.string = markdown_link(a.get_text(), url)
+
+        return normalize_text(soup.get_text())
+
+
+class LxmlExtractor(HTMLExtractor):
+    name = "lxml"
+
+    def extract(self, html: str) -> str:
+        if not html or not html.strip():
+            return ""
+
+        root = parse_html(html)
+        if root is None:
+            # the more lenient parser
+            return BeautifulSoupExtractor().extract(html)
+
+        return tree_to_text(root)
+
+
+class SelectolaxExtractor(HTMLExtractor):
+    name = "selectolax"
+
+    def extract(self, html: str) -> str:
+        from selectolax.lexbor import LexborHTMLParser
+
+        tree = LexborHTMLParser(html)
+        tree.strip_tags(["script", "style"])
+
+        for a in tree.css("a"):
+            url = a.attributes.get("href") or ""
+            if is_external_link(url):
+                a.replace_with(markdown_link(a.text(deep=True), url))
+
+        if tree.root is None:
+            return ""
+        return normalize_text(tree.root.text(deep=True))
+
+
+EXTRACTORS: Dict[str, Type[HTMLExtractor]] = {
+    cls.name: cls
+    for cls in [BeautifulSoupExtractor, LxmlExtractor, SelectolaxExtractor]
+}
+
+_ENGINE_MODULES = {
+    "bs4": "bs4",
+    "lxml": "lxml.html",
+    "selectolax": "selectolax.lexbor",
+}
+
+
+def is_available(name: str) -> bool:
+    module = _ENGINE_MODULES.get(name)
+    if module is None:
+        return False
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+
+def get_extractor(name: Optional[str] = None) -> HTMLExtractor:
+    """Returns the requested extractor, falling back to BeautifulSoup if its engine is missing."""
+    name = name or DEFAULT_EXTRACTOR
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown HTML extractor: {name}")
+
+    if name != BeautifulSoupExtractor.name and not is_available(name):
+        logging.warning(
+            f"HTML extractor '{name}' is not installed, falling back to '{BeautifulSoupExtractor.name}'"
+        )
+        name = BeautifulSoupExtractor.name
+
+    return EXTRACTORS[name]()
+
+
+def _extract(html: str, name: Optional[str]) -> str:
+    return get_extractor(name).extract(html)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=EXTRACTOR_PROCESSES or None)
+        atexit.register(shutdown_pool)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def extract_text(
+    html: str, name: Optional[str] = None, use_pool: Optional[bool] = None
+) -> str:
+    """Extracts text from html, in a worker process when the pool is enabled.
+
+    Running in the pool keeps the parsing off the GIL of the calling process, so the
+    gRPC server can keep serving other requests while a large page is parsed.
+    """
+    if use_pool is None:
+        use_pool = EXTRACTOR_PROCESSES > 0
+
+    if not use_pool:
+        return _extract(html, name)
+
+    return _get_pool().submit(_extract, html, name).result()
@@ -1,23 +1,43 @@
 import os
-from typing import Optional, List, Dict
-from dataclasses import dataclass, field
-
-import openai
-import tiktoken
-
-from langchain.chat_models import ChatOpenAI
-from langchain.llms.openai import OpenAI, AzureOpenAI
-from langchain.schema.language_model import BaseLanguageModel
-from langchain.schema.messages import (
-    HumanMessage,
-    SystemMessage,
-    BaseMessage,
-    ChatMessage,
+import sys
+import json
+import time
+import logging
+import asyncio
+import weakref
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Optional,
+    List,
+    Dict,
+    Tuple,
 )
-from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain.embeddings.base import Embeddings
+from dataclasses import dataclass, field, replace
+
+# langchain, openai and aiohttp take most of the time of importing this module, they are
+# imported when the first client is built so that modules merely importing gpt start fast
+if TYPE_CHECKING:
+    import aiohttp
+    from langchain.embeddings.base import Embeddings
+    from langchain.schema.language_model import BaseLanguageModel
+    from langchain.schema.messages import BaseMessage
 
 import jarvis.smartgpt.initializer  # ignore this line
+from jarvis.smartgpt import cassette, endpoints, llmcache, localllm, retry, usage
+from jarvis.smartgpt.endpoints import Endpoint, EndpointPool
+from jarvis.smartgpt.ratelimit import RateLimit, RateLimiter, parse_rate_limits
+from jarvis.smartgpt.retry import RetryPolicy
+from jarvis.smartgpt.router import RoutePolicy, Router, parse_route_policies
+from jarvis.smartgpt.singleflight import SingleFlight
+from jarvis.smartgpt.tokenizer import TOKENS_PER_MESSAGE, Tokenizer
 
 GPT_4 = "gpt-4"
 GPT_3_5_TURBO = "gpt-3.5-turbo"
@@ -47,6 +67,23 @@ try:
 except (ValueError, TypeError):
     TEMPERATURE = 0.7
 
+try:
+    # LLM requests in flight per fan-out, also the size of the async HTTP connection pool
+    LLM_CONCURRENCY = int(os.getenv("JARVIS_LLM_CONCURRENCY", "8"))
+except (ValueError, TypeError):
+    LLM_CONCURRENCY = 8
+
+# Identical requests in flight at the same time are sent once and share the response
+ENABLE_SINGLEFLIGHT = os.getenv("JARVIS_LLM_SINGLEFLIGHT", "true").lower() == "true"
+# Call sites with a use for partial responses, such as text completions storing their kvs as
+# they arrive, stream them
+ENABLE_STREAMING = os.getenv("JARVIS_LLM_STREAMING", "true").lower() == "true"
+# Call sites expecting JSON, such as text completions, get it as the arguments of a function call
+# from the models supporting functions, rather than asking for it in free text
+ENABLE_FUNCTION_CALLING = (
+    os.getenv("JARVIS_LLM_FUNCTION_CALLING", "true").lower() == "true"
+)
+
 
 ## define openai models
 @dataclass
@@ -152,16 +189,157 @@ OPEN_AI_EMBEDDING_MODELS = {
     ]
 }
 
+
+def _local_model_enabled() -> bool:
+    if not localllm.LOCAL_MODEL_PATH:
+        return False
+    if not localllm.is_installed():
+        logging.warning(
+            f"JARVIS_LOCAL_MODEL_PATH is set but llama-cpp-python isn't installed, "
+            f"{localllm.LOCAL_MODEL_NAME} is not available"
+        )
+        return False
+    return True
+
+
+# A llama.cpp model running on the CPU of this machine, listed when JARVIS_LOCAL_MODEL_PATH is set
+# and llama-cpp-python is installed
+LOCAL_MODELS = {
+    info.name: info
+    for info in [
+        ChatModelInfo(
+            name=localllm.LOCAL_MODEL_NAME,
+            prompt_token_cost=0.0,
+            completion_token_cost=0.0,
+            max_tokens=localllm.CONTEXT_TOKENS,
+        ),
+    ]
+    if _local_model_enabled()
+}
+
 OPEN_AI_MODELS: dict[str, ChatModelInfo | EmbeddingModelInfo | CompletionModelInfo] = {
     **OPEN_AI_CHAT_MODELS,
     **OPEN_AI_COMPLETION_MODELS,
     **OPEN_AI_EMBEDDING_MODELS,
+    **LOCAL_MODELS,
+}
+
+# Requests and tokens per minute allowed per model, for Azure they apply per deployment.
+# Override with JARVIS_LLM_RATE_LIMITS="gpt-4=200:40000,gpt-3.5-turbo=3500:90000"
+ENABLE_RATE_LIMITS = os.getenv("JARVIS_LLM_RATE_LIMIT", "true").lower() == "true"
+MODEL_RATE_LIMITS: Dict[str, RateLimit] = {
+    "gpt-3.5-turbo-0613": RateLimit(requests_per_minute=3500, tokens_per_minute=90000),
+    "gpt-3.5-turbo-16k-0613": RateLimit(
+        requests_per_minute=3500, tokens_per_minute=180000
+    ),
+    "gpt-4-0613": RateLimit(requests_per_minute=200, tokens_per_minute=40000),
+    "gpt-4-32k-0613": RateLimit(requests_per_minute=200, tokens_per_minute=80000),
+    "gpt-3.5-turbo-instruct": RateLimit(
+        requests_per_minute=3500, tokens_per_minute=90000
+    ),
+    "text-embedding-ada-002": RateLimit(
+        requests_per_minute=3500, tokens_per_minute=350000
+    ),
 }
+for name, limit in parse_rate_limits(os.getenv("JARVIS_LLM_RATE_LIMITS")).items():
+    MODEL_RATE_LIMITS[chat_model_mapping.get(name, name)] = limit
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def rate_limit_key(model: str) -> str:
+    if API_TYPE == "azure":
+        return azure_deployment_map.get(model, model)
+    return chat_model_mapping.get(model, model)
+
+
+def get_rate_limiter(model: str) -> Optional[RateLimiter]:
+    """Returns the limiter shared by all the clients of model, None if it isn't limited."""
+    limit = MODEL_RATE_LIMITS.get(chat_model_mapping.get(model, model))
+    if not ENABLE_RATE_LIMITS or limit is None:
+        return None
+
+    key = rate_limit_key(model)
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = RateLimiter(key, limit)
+        return _rate_limiters[key]
+
+
+_latency_trackers: Dict[str, retry.LatencyTracker] = {}
+
+
+def get_latency_tracker(model: str) -> retry.LatencyTracker:
+    """Returns the recent latencies of model, shared by the hedging and the router."""
+    with _rate_limiters_lock:
+        if model not in _latency_trackers:
+            _latency_trackers[model] = retry.LatencyTracker()
+        return _latency_trackers[model]
+
+
+def rate_limit_stats() -> Dict[str, Dict[str, float]]:
+    """Queue depth and wait times of every rate limiter in use."""
+    with _rate_limiters_lock:
+        limiters = list(_rate_limiters.values())
+        pools = [pool for pool in _endpoint_pools.values() if pool is not None]
+    for pool in pools:
+        limiters.extend(filter(None, map(pool.rate_limiter, pool.endpoints)))
+    return {limiter.name: limiter.stats() for limiter in limiters}
+
+
+# Several API keys, Azure regions or deployments serving the same model share its requests,
+# each with its own rate limit, see endpoints.parse_endpoints. Without them every request goes
+# to the OPENAI_API_* endpoint.
+ENDPOINTS: Dict[str, List[Endpoint]] = endpoints.load_endpoints(
+    endpoints.ENDPOINTS_PATH
+)
+_endpoint_pools: Dict[str, Optional[EndpointPool]] = {}
+
+
+def get_endpoint_pool(model: str) -> Optional[EndpointPool]:
+    """Returns the endpoints shared by all the clients of model, None if it has none configured."""
+    with _rate_limiters_lock:
+        if model not in _endpoint_pools:
+            members = (
+                endpoints.endpoints_for(ENDPOINTS, model)
+                if model not in LOCAL_MODELS
+                else []
+            )
+            _endpoint_pools[model] = (
+                EndpointPool(
+                    model,
+                    members,
+                    default_limit=MODEL_RATE_LIMITS.get(
+                        chat_model_mapping.get(model, model)
+                    ),
+                    rate_limited=ENABLE_RATE_LIMITS,
+                )
+                if members
+                else None
+            )
+        return _endpoint_pools[model]
+
+
+def endpoint_stats() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Health, traffic and latency of the endpoints of every model using a pool."""
+    with _rate_limiters_lock:
+        pools = [pool for pool in _endpoint_pools.values() if pool is not None]
+    return {pool.model: pool.stats() for pool in pools}
+
+
+def _model_rate_limiter(model: str):
+    """What a request to model waits for, the rate limiter of the model or its endpoint pool."""
+    return get_endpoint_pool(model) or get_rate_limiter(model)
+
 
 # tokenization helper function
 TOKEN_BUFFER = 50
-TOKENS_PER_MESSAGE = 4
-ENCODING = tiktoken.encoding_for_model("gpt-4")
+TOKENIZER = Tokenizer("gpt-4")
+
+
+def supports_functions(model: str) -> bool:
+    return getattr(OPEN_AI_MODELS.get(model), "supports_functions", False)
 
 
 def get_max_tokens(model: str) -> int:
@@ -171,39 +349,34 @@ def get_max_tokens(model: str) -> int:
 def count_tokens(messages) -> int:
     # abstracted token count logic
     if isinstance(messages, str):
-        return len(ENCODING.encode(messages))
+        return TOKENIZER.count(messages)
 
-    return sum(len(ENCODING.encode(item["content"])) for item in messages) + (
-        len(messages) * TOKENS_PER_MESSAGE
-    )
+    return TOKENIZER.count_messages(messages)
 
 
-def truncate_to_tokens(content: str, max_token_count: int) -> str:
-    """Truncates the content to fit within the model's max tokens."""
-
-    if count_tokens(content) <= max_token_count:
-        # No need to truncate
-        return content
-
-    tokens = ENCODING.encode(content)
+def count_message_tokens(messages: List["BaseMessage"]) -> int:
+    return count_tokens([{"content": message.content} for message in messages])
 
-    # Truncate tokens
-    truncated_tokens = tokens[:max_token_count]
 
-    # Convert truncated tokens back to string
-    truncated_str = ENCODING.decode(truncated_tokens)
-
-    return truncated_str
+def truncate_to_tokens(content: str, max_token_count: int) -> str:
+    """Truncates the content to fit within the model's max tokens."""
+    return TOKENIZER.truncate(content, max_token_count)[0]
 
 
 ## LLM helper functions
+# The clients make a single attempt (max_retries=1), BaseLLM retries with the call site's RetryPolicy.
+# credentials (openai_api_key, openai_api_base, ...) point a client at another endpoint than OPENAI_API_*
 def create_chat_client(
     model: str,
     temperature: float = 0.7,
     use_azure: bool = False,
     deployment_engine: Optional[str] = None,
     model_kwargs: Optional[dict] = None,
-) -> BaseLanguageModel:
+    credentials: Optional[dict] = None,
+) -> "BaseLanguageModel":
+    import openai
+    from langchain.chat_models import ChatOpenAI
+
     if use_azure:
         if deployment_engine is None:
             raise ValueError("Deployment engine must be specified for Azure API")
@@ -214,16 +387,20 @@ def create_chat_client(
         return ChatOpenAI(
             client=openai.ChatCompletion,
             temperature=temperature,
+            max_retries=1,
             model_kwargs={
                 "engine": deployment_engine,
                 **model_kwargs,
             },
+            **(credentials or {}),
         )
     else:
         return ChatOpenAI(
             temperature=temperature,
             model=model,
             client=openai.ChatCompletion,
+            max_retries=1,
+            **(credentials or {}),
         )
 
 
@@ -233,7 +410,11 @@ def create_completion_client(
     use_azure: bool = False,
     deployment_engine: Optional[str] = None,
     model_kwargs: Optional[dict] = None,
-) -> BaseLanguageModel:
+    credentials: Optional[dict] = None,
+) -> "BaseLanguageModel":
+    import openai
+    from langchain.llms.openai import OpenAI, AzureOpenAI
+
     if use_azure:
         if deployment_engine is None:
             raise ValueError("Deployment engine must be specified for Azure API")
@@ -248,6 +429,8 @@ def create_completion_client(
             temperature=temperature,
             model_kwargs=model_kwargs,
             max_tokens=-1,
+            max_retries=1,
+            **(credentials or {}),
         )
     else:
         return OpenAI(
@@ -255,6 +438,8 @@ def create_completion_client(
             model=model,
             client=openai.Completion,
             max_tokens=-1,
+            max_retries=1,
+            **(credentials or {}),
         )
 
 
@@ -263,7 +448,10 @@ def create_embedding_client(
     use_azure: bool = False,
     deployment_engine: Optional[str] = None,
     model_kwargs: Optional[dict] = None,
-) -> Embeddings:
+) -> "Embeddings":
+    import openai
+    from langchain.embeddings.openai import OpenAIEmbeddings
+
     if use_azure:
         if deployment_engine is None:
             raise ValueError("Deployment engine must be specified for Azure API")
@@ -284,6 +472,14 @@ class BaseLLM:
             raise ValueError(f"Invalid model {model}")
 
         self.model = model
+        self._latency = get_latency_tracker(model)
+        self._pool = get_endpoint_pool(model)
+        if self._pool is not None:
+            # one client per endpoint, built on its first request
+            self._clients: Dict[str, Any] = {}
+            self._clients_lock = threading.Lock()
+            return
+
         deployment_engine = None
         use_azure = False
         model_kwargs = None
@@ -294,63 +490,938 @@ class BaseLLM:
             deployment_engine = azure_deployment_map[model]
             model_kwargs = azure_openai_model_kwargs
 
-        if model == "gpt-3.5-turbo-instruct":
-            self._llm = create_completion_client(
-                model,
-                deployment_engine=deployment_engine,
-                temperature=TEMPERATURE,
-                use_azure=use_azure,
-                model_kwargs=model_kwargs,
-            )
-        else:
-            self._llm = create_chat_client(
-                model,
-                deployment_engine=deployment_engine,
-                temperature=TEMPERATURE,
-                use_azure=use_azure,
-                model_kwargs=model_kwargs,
-            )
+        self._rate_limiter = get_rate_limiter(model)
+        self._llm = self._create_client(deployment_engine, use_azure, model_kwargs)
+
+    def _create_client(
+        self,
+        deployment_engine: Optional[str] = None,
+        use_azure: bool = False,
+        model_kwargs: Optional[dict] = None,
+        credentials: Optional[dict] = None,
+    ):
+        create = (
+            create_completion_client
+            if self.model == "gpt-3.5-turbo-instruct"
+            else create_chat_client
+        )
+        return create(
+            self.model,
+            deployment_engine=deployment_engine,
+            temperature=TEMPERATURE,
+            use_azure=use_azure,
+            model_kwargs=model_kwargs,
+            credentials=credentials,
+        )
+
+    def _endpoint_client(self, endpoint: Endpoint):
+        with self._clients_lock:
+            if endpoint.name not in self._clients:
+                self._clients[endpoint.name] = self._create_client(
+                    endpoint.deployment,
+                    endpoint.is_azure,
+                    endpoint.model_kwargs(),
+                    endpoint.credentials(),
+                )
+            return self._clients[endpoint.name]
 
     def get_llm(self):
+        if self._pool is not None:
+            return self._endpoint_client(self._pool.endpoints[0])
         return self._llm
 
-    def predict(self, prompt: str) -> str:
-        return self._llm.predict(prompt)
+    def _targets(self):
+        """The endpoint, client and rate limiter of one attempt.
+
+        With an endpoint pool, an attempt failing on an endpoint that is throttled or down
+        fails over to the next healthy one, without waiting for the retry's backoff.
+        """
+        if self._pool is None:
+            yield None, self._llm, self._rate_limiter
+            return
+        tried: Tuple[str, ...] = ()
+        endpoint = self._pool.pick()
+        while endpoint is not None:
+            yield endpoint, self._endpoint_client(endpoint), self._pool.rate_limiter(
+                endpoint
+            )
+            tried += (endpoint.name,)
+            endpoint = self._pool.pick(exclude=tried)
+            if endpoint is not None:
+                logging.warning(
+                    f"LLM request failing over from endpoint {tried[-1]} to {endpoint.name}"
+                )
+
+    def _failed(self, endpoint: Optional[Endpoint], err: Exception) -> bool:
+        """Whether the attempt may fail over to another endpoint after err."""
+        if endpoint is None:
+            return False
+        self._pool.report(endpoint, error=err)
+        return endpoints.is_endpoint_failure(err)
+
+    def _succeeded(self, endpoint: Optional[Endpoint], latency: float):
+        self._latency.record(latency)
+        if endpoint is not None:
+            self._pool.report(endpoint, latency=latency)
+
+    def _send(self, request, tokens: int):
+        """Wraps a request to the model, throttled and timed, as one attempt of retry.call.
+
+        request takes the client to send it with.
+        """
+
+        def send():
+            error = None
+            for endpoint, llm, rate_limiter in self._targets():
+                if rate_limiter is not None:
+                    rate_limiter.acquire(tokens)
+                start = time.monotonic()
+                try:
+                    result = request(llm)
+                except Exception as err:
+                    if not self._failed(endpoint, err):
+                        raise
+                    error = err
+                    continue
+                self._succeeded(endpoint, time.monotonic() - start)
+                return result
+            raise error
+
+        return send
+
+    def _asend(self, request, tokens: int):
+        async def send():
+            error = None
+            for endpoint, llm, rate_limiter in self._targets():
+                if rate_limiter is not None:
+                    await rate_limiter.aacquire(tokens)
+                start = time.monotonic()
+                try:
+                    with pooled_http_session():
+                        result = await request(llm)
+                except Exception as err:
+                    if not self._failed(endpoint, err):
+                        raise
+                    error = err
+                    continue
+                self._succeeded(endpoint, time.monotonic() - start)
+                return result
+            raise error
+
+        return send
+
+    def predict(
+        self, prompt: str, retry_policy: RetryPolicy = retry.DEFAULT_POLICY
+    ) -> str:
+        send = self._send(lambda llm: llm.predict(prompt), count_tokens(prompt))
+        policy = call_site_policy(retry_policy)
+        return self._coalesce(
+            request_key(self.model, prompt),
+            lambda: retry.call(send, policy, self._latency),
+        )
+
+    def chat(
+        self,
+        messages: List["BaseMessage"],
+        retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    ) -> "BaseMessage":
+        send = self._send(
+            lambda llm: llm.predict_messages(messages),
+            count_message_tokens(messages),
+        )
+        policy = call_site_policy(retry_policy)
+        return self._coalesce(
+            request_key(self.model, messages),
+            lambda: retry.call(send, policy, self._latency),
+        )
+
+    async def apredict(
+        self, prompt: str, retry_policy: RetryPolicy = retry.DEFAULT_POLICY
+    ) -> str:
+        send = self._asend(lambda llm: llm.apredict(prompt), count_tokens(prompt))
+        policy = call_site_policy(retry_policy)
+        return await self._acoalesce(
+            request_key(self.model, prompt),
+            lambda: retry.acall(send, policy, self._latency),
+        )
+
+    async def achat(
+        self,
+        messages: List["BaseMessage"],
+        retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    ) -> "BaseMessage":
+        send = self._asend(
+            lambda llm: llm.apredict_messages(messages),
+            count_message_tokens(messages),
+        )
+        policy = call_site_policy(retry_policy)
+        return await self._acoalesce(
+            request_key(self.model, messages),
+            lambda: retry.acall(send, policy, self._latency),
+        )
+
+    def call_function(
+        self,
+        messages: List["BaseMessage"],
+        function: Dict[str, Any],
+        retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    ) -> str:
+        """Has the model answer messages by calling function, returns the JSON text of its arguments."""
+        request = _with_function(messages, function)
+        send = self._send(
+            lambda llm: _function_arguments(
+                llm.predict_messages(
+                    messages,
+                    functions=[function],
+                    function_call={"name": function["name"]},
+                )
+            ),
+            count_message_tokens(request),
+        )
+        policy = call_site_policy(retry_policy)
+        return self._coalesce(
+            request_key(self.model, request),
+            lambda: retry.call(send, policy, self._latency),
+        )
+
+    def stream_chat(
+        self,
+        messages: List["BaseMessage"],
+        on_token: Callable[[str], None],
+        retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    ) -> "BaseMessage":
+        """Like chat, calling on_token with each piece of the response as it arrives.
+
+        Streams are neither hedged nor coalesced, and one failing after its first piece
+        isn't retried: the caller already has part of it.
+        """
+        from langchain.schema.messages import AIMessage
+
+        streamed: List[str] = []
+
+        def request(llm):
+            try:
+                for chunk in llm.stream(messages):
+                    piece = chunk if isinstance(chunk, str) else chunk.content
+                    if piece:
+                        streamed.append(piece)
+                        on_token(piece)
+            except Exception as err:
+                if streamed:
+                    raise StreamInterruptedError(
+                        f"{self.model} stream interrupted: {err}"
+                    ) from err
+                raise
+            return AIMessage(content="".join(streamed))
+
+        send = self._send(request, count_message_tokens(messages))
+        return retry.call(
+            send, replace(call_site_policy(retry_policy), hedge=False), self._latency
+        )
+
+    async def astream_chat(
+        self,
+        messages: List["BaseMessage"],
+        on_token: Callable[[str], None],
+        retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    ) -> "BaseMessage":
+        from langchain.schema.messages import AIMessage
+
+        streamed: List[str] = []
+
+        async def request(llm):
+            try:
+                async for chunk in llm.astream(messages):
+                    piece = chunk if isinstance(chunk, str) else chunk.content
+                    if piece:
+                        streamed.append(piece)
+                        on_token(piece)
+            except Exception as err:
+                if streamed:
+                    raise StreamInterruptedError(
+                        f"{self.model} stream interrupted: {err}"
+                    ) from err
+                raise
+            return AIMessage(content="".join(streamed))
+
+        send = self._asend(request, count_message_tokens(messages))
+        return await retry.acall(
+            send, replace(call_site_policy(retry_policy), hedge=False), self._latency
+        )
+
+    def _coalesce(self, key: str, call):
+        if not ENABLE_SINGLEFLIGHT:
+            return call()
+        result, shared = _singleflight.do_shared(key, call)
+        if shared:
+            _mark_coalesced()
+        return result
+
+    async def _acoalesce(self, key: str, call):
+        if not ENABLE_SINGLEFLIGHT:
+            return await call()
+        result, shared = await _singleflight.ado_shared(key, call)
+        if shared:
+            _mark_coalesced()
+        return result
+
+
+_singleflight = SingleFlight()
+
+
+@dataclass
+class _Flight:
+    """The request being sent by _cached_response, coalesced if it shared another one's response."""
+
+    coalesced: bool = False
+
+
+_flight: contextvars.ContextVar[Optional[_Flight]] = contextvars.ContextVar(
+    "jarvis_llm_flight", default=None
+)
+
+
+def _mark_coalesced():
+    flight = _flight.get()
+    if flight is not None:
+        flight.coalesced = True
+
+
+class StreamInterruptedError(RuntimeError):
+    """A streamed response failed after some of it reached the caller, it can't be retried."""
+
+
+def _with_function(
+    messages: List["BaseMessage"], function: Dict[str, Any]
+) -> List["BaseMessage"]:
+    """The messages of a function call with its function, for counting and keying the request."""
+    from langchain.schema.messages import ChatMessage
+
+    return messages + [
+        ChatMessage(
+            role="function_schema", content=json.dumps(function, sort_keys=True)
+        )
+    ]
+
+
+def _function_arguments(message: "BaseMessage") -> str:
+    function_call = message.additional_kwargs.get("function_call")
+    if function_call is None:
+        # the model answered in text instead, which the caller parses leniently
+        return message.content
+    return function_call.get("arguments", "")
+
+
+# langchain message types by OpenAI API role
+_MESSAGE_ROLES = {"human": "user", "ai": "assistant"}
+
+
+def to_api_messages(messages: List["BaseMessage"]) -> List[Tuple[str, str]]:
+    """(role, content) pairs of langchain messages, with the roles of the OpenAI API."""
+    return [
+        (
+            getattr(message, "role", None)
+            or _MESSAGE_ROLES.get(message.type, message.type),
+            message.content,
+        )
+        for message in messages
+    ]
+
+
+def request_key(model: str, request) -> str:
+    """Identifies a request by its model and a hash of its prompt or messages."""
+    if not isinstance(request, str):
+        request = to_api_messages(request)
+    return cassette.request_key(model, TEMPERATURE, request)
+
+
+def singleflight_stats() -> Dict[str, int]:
+    """Calls made through the LLM layer and how many of them shared another call's response."""
+    return _singleflight.stats()
+
+
+# One connection pool per event loop, shared by the async requests running on it
+_aiosessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_aiosession() -> "aiohttp.ClientSession":
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    session = _aiosessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=LLM_CONCURRENCY)
+        )
+        _aiosessions[loop] = session
+    return session
+
+
+@contextmanager
+def pooled_http_session():
+    """Makes the openai client use the loop's pooled session instead of one session per request."""
+    import openai
 
-    def chat(self, messages: List[BaseMessage]) -> BaseMessage:
-        return self._llm.predict_messages(messages)
+    token = openai.aiosession.set(get_aiosession())
+    try:
+        yield
+    finally:
+        openai.aiosession.reset(token)
+
+
+async def aclose_http_session():
+    """Closes the connection pool of the running loop, call before the loop ends."""
+    session = _aiosessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
 
 
 # declare llm models
-OPEN_AI_MODELS_HUB = {
-    "gpt-4": BaseLLM("gpt-4"),
-    "gpt-3.5-turbo": BaseLLM("gpt-3.5-turbo"),
-    "gpt-3.5-turbo-16k": BaseLLM("gpt-3.5-turbo-16k"),
-    "gpt-3.5-turbo-instruct": BaseLLM("gpt-3.5-turbo-instruct"),
-    "text-embedding-ada-002": create_embedding_client("text-embedding-ada-002")
-    if API_TYPE != "azure"
-    else create_embedding_client(
-        "text-embedding-ada-002",
+class ModelHub(dict):
+    """Models by name, each built on first use from its factory.
+
+    Building a LangChain client is slow, and a run usually needs only one or two models.
+    Only the models built so far are listed when iterating.
+    """
+
+    def __init__(self, factories: Dict[str, Callable[[], Any]]):
+        super().__init__()
+        self._factories = factories
+        self._lock = threading.Lock()
+
+    def __contains__(self, name) -> bool:
+        return dict.__contains__(self, name) or name in self._factories
+
+    def __missing__(self, name):
+        if name not in self._factories:
+            raise KeyError(name)
+        with self._lock:
+            if not dict.__contains__(self, name):
+                self[name] = self._factories[name]()
+            return dict.__getitem__(self, name)
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def remove(self, name):
+        """Makes a model unavailable, the router stops picking it."""
+        with self._lock:
+            self._factories.pop(name, None)
+            self.pop(name, None)
+
+
+class CassetteLLM:
+    """A model answering from a cassette, or recording the answers of a real model into it.
+
+    Replaying needs no network and answers the same way every run, for benchmarks and
+    offline tests of the compiler, interpreter and server.
+    """
+
+    def __init__(
+        self, model: str, tape: cassette.Cassette, llm: Optional[BaseLLM] = None
+    ):
+        self.model = model
+        self._cassette = tape
+        self._llm = llm
+
+    def get_llm(self):
+        return self._llm.get_llm() if self._llm is not None else None
+
+    def predict(
+        self, prompt: str, retry_policy: RetryPolicy = retry.DEFAULT_POLICY
+    ) -> str:
+        key = request_key(self.model, prompt)
+        if self._llm is None:
+            response, delay = self._cassette.replay(key)
+            time.sleep(delay)
+            return response
+
+        start = time.monotonic()
+        response = self._llm.predict(prompt, retry_policy)
+        self._cassette.record(
+            key, self.model, prompt, response, time.monotonic() - start
+        )
+        return response
+
+    def chat(
+        self,
+        messages: List["BaseMessage"],
+        retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    ) -> "BaseMessage":
+        from langchain.schema.messages import AIMessage
+
+        key = request_key(self.model, messages)
+        if self._llm is None:
+            response, delay = self._cassette.replay(key)
+            time.sleep(delay)
+            return AIMessage(content=response)
+
+        start = time.monotonic()
+        message = self._llm.chat(messages, retry_policy)
+        self._cassette.record(
+            key,
+            self.model,
+            to_api_messages(messages),
+            message.content,
+            time.monotonic() - start,
+        )
+        return message
+
+    def call_function(
+        self,
+        messages: List["BaseMessage"],
+        function: Dict[str, Any],
+        retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    ) -> str:
+        """Replays or records a function call under the key of its messages with the function."""
+        request = _with_function(messages, function)
+        key = request_key(self.model, request)
+        if self._llm is None:
+            response, delay = self._cassette.replay(key)
+            time.sleep(delay)
+            return response
+
+        start = time.monotonic()
+        arguments = self._llm.call_function(messages, function, retry_policy)
+        self._cassette.record(
+            key,
+            self.model,
+            to_api_messages(request),
+            arguments,
+            time.monotonic() - start,
+        )
+        return arguments
+
+    async def apredict(
+        self, prompt: str, retry_policy: RetryPolicy = retry.DEFAULT_POLICY
+    ) -> str:
+        key = request_key(self.model, prompt)
+        if self._llm is None:
+            response, delay = self._cassette.replay(key)
+            await asyncio.sleep(delay)
+            return response
+
+        start = time.monotonic()
+        response = await self._llm.apredict(prompt, retry_policy)
+        self._cassette.record(
+            key, self.model, prompt, response, time.monotonic() - start
+        )
+        return response
+
+    async def achat(
+        self,
+        messages: List["BaseMessage"],
+        retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    ) -> "BaseMessage":
+        from langchain.schema.messages import AIMessage
+
+        key = request_key(self.model, messages)
+        if self._llm is None:
+            response, delay = self._cassette.replay(key)
+            await asyncio.sleep(delay)
+            return AIMessage(content=response)
+
+        start = time.monotonic()
+        message = await self._llm.achat(messages, retry_policy)
+        self._cassette.record(
+            key,
+            self.model,
+            to_api_messages(messages),
+            message.content,
+            time.monotonic() - start,
+        )
+        return message
+
+
+class LocalLLM:
+    """A llama.cpp model running on this machine's CPU, see localllm.
+
+    Its tokens cost nothing and have no rate limit, which suits the short, high volume
+    requests: If conditions, result extraction and overviews. Send call sites to it with
+    JARVIS_LLM_ROUTES, e.g. "if=preferred:llama-local|gpt-3.5-turbo".
+    """
+
+    def __init__(self, model: str, llama: localllm.LlamaModel):
+        self.model = model
+        self._llama = llama
+        self._latency = get_latency_tracker(model)
+
+    def get_llm(self):
+        return None
+
+    def warm_up(self):
+        """Loads the model into memory ahead of the first request."""
+        self._llama.load()
+
+    def _timed(self, call):
+        start = time.monotonic()
+        result = call()
+        self._latency.record(time.monotonic() - start)
+        return result
+
+    async def _atimed(self, call):
+        start = time.monotonic()
+        result = await call()
+        self._latency.record(time.monotonic() - start)
+        return result
+
+    @staticmethod
+    def _api_messages(messages: List["BaseMessage"]) -> List[Dict[str, str]]:
+        return [
+            {"role": role, "content": content}
+            for role, content in to_api_messages(messages)
+        ]
+
+    # the model answers on this machine, there is no transient failure for the retry policy
+    def predict(
+        self, prompt: str, retry_policy: RetryPolicy = retry.DEFAULT_POLICY
+    ) -> str:
+        return self._timed(lambda: self._llama.complete(prompt, TEMPERATURE))
+
+    def chat(
+        self,
+        messages: List["BaseMessage"],
+        retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    ) -> "BaseMessage":
+        from langchain.schema.messages import AIMessage
+
+        api_messages = self._api_messages(messages)
+        return AIMessage(
+            content=self._timed(lambda: self._llama.chat(api_messages, TEMPERATURE))
+        )
+
+    async def apredict(
+        self, prompt: str, retry_policy: RetryPolicy = retry.DEFAULT_POLICY
+    ) -> str:
+        return await self._atimed(lambda: self._llama.acomplete(prompt, TEMPERATURE))
+
+    async def achat(
+        self,
+        messages: List["BaseMessage"],
+        retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    ) -> "BaseMessage":
+        from langchain.schema.messages import AIMessage
+
+        api_messages = self._api_messages(messages)
+        content = await self._atimed(
+            lambda: self._llama.achat(api_messages, TEMPERATURE)
+        )
+        return AIMessage(content=content)
+
+
+def _create_backend_llm(model: str):
+    if model in LOCAL_MODELS:
+        return LocalLLM(model, localllm.get_model(localllm.LOCAL_MODEL_PATH))
+    return BaseLLM(model)
+
+
+def _create_llm(model: str):
+    """Builds the model of the configured backend, see cassette.LLM_BACKEND."""
+    if cassette.LLM_BACKEND == "replay":
+        return CassetteLLM(model, cassette.get_cassette())
+    if cassette.LLM_BACKEND == "record":
+        return CassetteLLM(model, cassette.get_cassette(), _create_backend_llm(model))
+    return _create_backend_llm(model)
+
+
+def _create_embedding_model(model: str) -> "Embeddings":
+    if API_TYPE != "azure":
+        return create_embedding_client(model)
+    return create_embedding_client(
+        model,
         use_azure=True,
-        deployment_engine=azure_deployment_map.get("text-embedding-ada-002"),
+        deployment_engine=azure_deployment_map.get(model),
         model_kwargs=azure_openai_model_kwargs,
-    ),
+    )
+
+
+OPEN_AI_MODELS_HUB = ModelHub(
+    {
+        "gpt-4": lambda: _create_llm("gpt-4"),
+        "gpt-3.5-turbo": lambda: _create_llm("gpt-3.5-turbo"),
+        "gpt-3.5-turbo-16k": lambda: _create_llm("gpt-3.5-turbo-16k"),
+        "gpt-3.5-turbo-instruct": lambda: _create_llm("gpt-3.5-turbo-instruct"),
+        "text-embedding-ada-002": lambda: _create_embedding_model(
+            "text-embedding-ada-002"
+        ),
+        **{name: (lambda name=name: _create_llm(name)) for name in LOCAL_MODELS},
+    }
+)
+
+
+def warm_up_local_models():
+    """Loads the local models into memory, so that the first requests don't wait for it."""
+    for name in LOCAL_MODELS:
+        llm = OPEN_AI_MODELS_HUB[name]
+        if not isinstance(llm, LocalLLM):
+            continue
+        try:
+            llm.warm_up()
+        except Exception as err:
+            # the server starts without it
+            logging.warning(
+                f"Failed to load local model {name}, it is not available: {err}"
+            )
+            OPEN_AI_MODELS_HUB.remove(name)
+
+
+## model routing
+# Route requests to another model when they don't fit theirs or it is overloaded
+ENABLE_ROUTER = os.getenv("JARVIS_LLM_ROUTER", "true").lower() == "true"
+# Models tried after a call site's own model, when it is too small, overloaded or failing
+MODEL_FALLBACKS: Dict[str, Tuple[str, ...]] = {
+    GPT_4: (GPT_3_5_TURBO_16K,),
+    GPT_3_5_TURBO: (GPT_3_5_TURBO_16K,),
+    GPT_3_5_TURBO_16K: (GPT_4,),
 }
+# Per call site policies, e.g. JARVIS_LLM_ROUTES="reviewer=cheapest:gpt-3.5-turbo|gpt-3.5-turbo-16k|gpt-4"
+# makes reviewers use the cheapest model that fits, the call sites are those of usage.call_site
+ROUTE_POLICIES: Dict[str, RoutePolicy] = parse_route_policies(
+    os.getenv("JARVIS_LLM_ROUTES")
+)
+# Retry policies of the call sites, e.g. JARVIS_LLM_RETRY_POLICIES="reviewer=no_retry". The If
+# conditions and the result extraction are short and block the task, their requests are hedged
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    "if": retry.HEDGED_POLICY,
+    "result_extraction": retry.HEDGED_POLICY,
+    **retry.parse_retry_policies(os.getenv("JARVIS_LLM_RETRY_POLICIES")),
+}
+
+
+def call_site_policy(retry_policy: RetryPolicy) -> RetryPolicy:
+    """The retry policy of the current call site, unless the caller passed its own."""
+    if retry_policy is not retry.DEFAULT_POLICY:
+        return retry_policy
+    return RETRY_POLICIES.get(usage.current_call_site(), retry_policy)
+
+
+def _model_max_tokens(model: str) -> int:
+    return get_max_tokens(model) if model in OPEN_AI_MODELS else sys.maxsize
+
+
+def _model_prompt_cost(model: str) -> float:
+    info = OPEN_AI_MODELS.get(model)
+    return info.prompt_token_cost if info is not None else 0.0
+
+
+ROUTER = Router(
+    max_tokens=_model_max_tokens,
+    prompt_token_cost=_model_prompt_cost,
+    rate_limiter=_model_rate_limiter,
+    latency=get_latency_tracker,
+    is_available=lambda model: model in OPEN_AI_MODELS_HUB,
+    fallbacks=MODEL_FALLBACKS,
+    policies=ROUTE_POLICIES,
+)
 
 
-def complete(prompt: str, model: str, system_prompt: Optional[str] = None) -> str:
+def route(model: str, prompt_tokens: int) -> List[str]:
+    """Models to send a request of the current call site to, in order of preference."""
+    if not ENABLE_ROUTER:
+        return [model]
+    return ROUTER.route(model, usage.current_call_site(), prompt_tokens)
+
+
+def record_usage(
+    model: str,
+    prompt_tokens: int,
+    response: Optional[str],
+    latency: float,
+    cached: bool = False,
+    coalesced: bool = False,
+):
+    """Records a request and its cost for the call site and the tasks tracking their usage.
+
+    Cached and coalesced requests cost nothing, no request was sent for them.
+    """
+    completion_tokens = count_tokens(response or "")
+    cost = 0.0
+    info = OPEN_AI_MODELS.get(model)
+    if info is not None and not cached and not coalesced:
+        cost = usage.cost_of(
+            prompt_tokens,
+            completion_tokens,
+            info.prompt_token_cost,
+            getattr(info, "completion_token_cost", 0.0),
+        )
+    usage.record(
+        usage.LLMCall(
+            model=model,
+            call_site=usage.current_call_site(),
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency=latency,
+            cost=cost,
+            cached=cached,
+            coalesced=coalesced,
+        )
+    )
+
+
+def _prompt_tokens(request, prompt_tokens: Optional[int]) -> int:
+    if prompt_tokens is not None:
+        return prompt_tokens
+    if isinstance(request, str):
+        return count_tokens(request)
+    return count_message_tokens(request)
+
+
+def is_fallback_error(err: Exception) -> bool:
+    """Whether another model may succeed where this one failed: overloaded or too small."""
+    if getattr(err, "code", None) == "context_length_exceeded":
+        return True
+    return retry.is_retryable(err)
+
+
+def _fallback(models: List[str], index: int, err: Exception):
+    """Raises err unless the request can fall back to the next model."""
+    if index == len(models) - 1 or not is_fallback_error(err):
+        raise err
+    logging.warning(
+        f"LLM request to {models[index]} failed ({type(err).__name__}: {err}), "
+        f"falling back to {models[index + 1]}"
+    )
+
+
+def _cached_response(
+    model: str,
+    request,
+    cache: Optional[bool],
+    send: Callable[[str], str],
+    prompt_tokens: Optional[int] = None,
+) -> str:
+    """Returns the cached response of request if the call site caches it, sends it otherwise.
+
+    The request is sent to the models picked by the router, each one a fallback of the
+    previous one.
+    """
+    start = time.monotonic()
+    prompt_tokens = _prompt_tokens(request, prompt_tokens)
+    key = None
+    if _should_cache(cache):
+        key = request_key(model, request)
+        response = llmcache.get_cache().get(key, model)
+        if response is not None:
+            record_usage(
+                model, prompt_tokens, response, time.monotonic() - start, cached=True
+            )
+            return response
+
+    models = route(model, prompt_tokens)
+    flight = _Flight()
+    token = _flight.set(flight)
+    try:
+        for index, routed_model in enumerate(models):
+            flight.coalesced = False
+            try:
+                response = send(routed_model)
+                break
+            except Exception as err:
+                _fallback(models, index, err)
+    finally:
+        _flight.reset(token)
+
+    record_usage(
+        routed_model,
+        prompt_tokens,
+        response,
+        time.monotonic() - start,
+        coalesced=flight.coalesced,
+    )
+    if key is not None and response is not None:
+        llmcache.get_cache().put(key, model, response)
+    return response
+
+
+async def _acached_response(
+    model: str,
+    request,
+    cache: Optional[bool],
+    send: Callable[[str], Awaitable[str]],
+    prompt_tokens: Optional[int] = None,
+) -> str:
+    start = time.monotonic()
+    prompt_tokens = _prompt_tokens(request, prompt_tokens)
+    key = None
+    if _should_cache(cache):
+        key = request_key(model, request)
+        response = llmcache.get_cache().get(key, model)
+        if response is not None:
+            record_usage(
+                model, prompt_tokens, response, time.monotonic() - start, cached=True
+            )
+            return response
+
+    models = route(model, prompt_tokens)
+    flight = _Flight()
+    token = _flight.set(flight)
+    try:
+        for index, routed_model in enumerate(models):
+            flight.coalesced = False
+            try:
+                response = await send(routed_model)
+                break
+            except Exception as err:
+                _fallback(models, index, err)
+    finally:
+        _flight.reset(token)
+
+    record_usage(
+        routed_model,
+        prompt_tokens,
+        response,
+        time.monotonic() - start,
+        coalesced=flight.coalesced,
+    )
+    if key is not None and response is not None:
+        llmcache.get_cache().put(key, model, response)
+    return response
+
+
+def _should_cache(cache: Optional[bool]) -> bool:
+    # a recording captures every request, cached or not
+    return cassette.LLM_BACKEND != "record" and llmcache.should_cache(
+        cache, TEMPERATURE, usage.current_call_site()
+    )
+
+
+def response_cache_stats() -> Dict[str, Any]:
+    """Hits, misses and hit ratio of the persistent response cache in this process."""
+    return llmcache.get_cache().stats()
+
+
+# cache: True caches the responses of the call site, False never does, None (default) leaves it to
+# JARVIS_LLM_CACHE_SITES and to the deterministic mode, which caches every request when the
+# temperature is 0.
+# model is the call site's preferred model, the router may send the request to another one.
+def complete(
+    prompt: str,
+    model: str,
+    system_prompt: Optional[str] = None,
+    retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    cache: Optional[bool] = None,
+) -> str:
     if system_prompt:
         prompt = f"{system_prompt}\n##User question\n{prompt}\n"
     if model not in OPEN_AI_MODELS_HUB:
         raise ValueError(f"Not found model {model}")
-    return OPEN_AI_MODELS_HUB[model].predict(prompt)
+    return _cached_response(
+        model,
+        prompt,
+        cache,
+        lambda routed_model: OPEN_AI_MODELS_HUB[routed_model].predict(
+            prompt, retry_policy
+        ),
+    )
 
 
-def complete_with_messages(
-    model: str,
-    messages: List[Dict[str, str]],
-    prompt: Optional[str] = None,
-) -> str:
+def to_chat_messages(
+    messages: List[Dict[str, str]], prompt: Optional[str] = None
+) -> List["BaseMessage"]:
+    from langchain.schema.messages import ChatMessage, HumanMessage, SystemMessage
+
     chat_messages = []
     for message in messages:
         if message["role"] == "user":
@@ -364,15 +1435,146 @@ def complete_with_messages(
 
     if prompt is not None:
         chat_messages.append(HumanMessage(content=prompt))
+    return chat_messages
+
+
+# prompt_tokens saves counting the messages again when the caller already did
+def complete_with_messages(
+    model: str,
+    messages: List[Dict[str, str]],
+    prompt: Optional[str] = None,
+    retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    cache: Optional[bool] = None,
+    prompt_tokens: Optional[int] = None,
+) -> str:
+    chat_messages = to_chat_messages(messages, prompt)
 
     if model not in OPEN_AI_MODELS_HUB:
         raise ValueError(f"Not found model {model}")
 
-    return OPEN_AI_MODELS_HUB[model].chat(chat_messages).content
+    return _cached_response(
+        model,
+        chat_messages,
+        cache,
+        lambda routed_model: OPEN_AI_MODELS_HUB[routed_model]
+        .chat(chat_messages, retry_policy)
+        .content,
+        prompt_tokens,
+    )
+
+
+def send_messages(
+    messages: List[Dict[str, str]],
+    model: str,
+    retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    cache: Optional[bool] = None,
+    prompt_tokens: Optional[int] = None,
+) -> str:
+    return complete_with_messages(
+        model,
+        messages,
+        retry_policy=retry_policy,
+        cache=cache,
+        prompt_tokens=prompt_tokens,
+    )
 
 
-def send_messages(messages: List[Dict[str, str]], model: str) -> str:
-    return complete_with_messages(model, messages)
+def _stream_chat(
+    llm,
+    messages: List["BaseMessage"],
+    on_token: Callable[[str], None],
+    retry_policy: RetryPolicy,
+) -> str:
+    stream_chat = getattr(llm, "stream_chat", None)
+    if stream_chat is None:
+        # the backends without streaming, such as cassettes, answer in one piece
+        content = llm.chat(messages, retry_policy).content
+        on_token(content)
+        return content
+    return stream_chat(messages, on_token, retry_policy).content
+
+
+async def _astream_chat(
+    llm,
+    messages: List["BaseMessage"],
+    on_token: Callable[[str], None],
+    retry_policy: RetryPolicy,
+) -> str:
+    astream_chat = getattr(llm, "astream_chat", None)
+    if astream_chat is None:
+        content = (await llm.achat(messages, retry_policy)).content
+        on_token(content)
+        return content
+    return (await astream_chat(messages, on_token, retry_policy)).content
+
+
+def stream_messages(
+    messages: List[Dict[str, str]],
+    model: str,
+    on_token: Callable[[str], None],
+    retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    cache: Optional[bool] = None,
+    prompt_tokens: Optional[int] = None,
+) -> str:
+    """Like send_messages, calling on_token with each piece of the response as it arrives.
+
+    A cached response arrives in one piece.
+    """
+    chat_messages = to_chat_messages(messages)
+    if model not in OPEN_AI_MODELS_HUB:
+        raise ValueError(f"Not found model {model}")
+
+    streamed = False
+
+    def on_piece(piece: str):
+        nonlocal streamed
+        streamed = True
+        on_token(piece)
+
+    response = _cached_response(
+        model,
+        chat_messages,
+        cache,
+        lambda routed_model: _stream_chat(
+            OPEN_AI_MODELS_HUB[routed_model], chat_messages, on_piece, retry_policy
+        ),
+        prompt_tokens,
+    )
+    if not streamed and response:
+        on_token(response)
+    return response
+
+
+def call_function(
+    messages: List[Dict[str, str]],
+    model: str,
+    function: Dict[str, Any],
+    retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    cache: Optional[bool] = None,
+    prompt_tokens: Optional[int] = None,
+) -> str:
+    """Like send_messages, answered by calling function: returns the JSON text of its arguments.
+
+    The models without function calling answer the messages in text, which should ask for
+    the same JSON.
+    """
+    chat_messages = to_chat_messages(messages)
+    if model not in OPEN_AI_MODELS_HUB:
+        raise ValueError(f"Not found model {model}")
+
+    if prompt_tokens is not None:
+        # the function is sent with the messages
+        prompt_tokens += count_tokens(json.dumps(function))
+
+    def send(routed_model: str) -> str:
+        llm = OPEN_AI_MODELS_HUB[routed_model]
+        if supports_functions(routed_model) and hasattr(llm, "call_function"):
+            return llm.call_function(chat_messages, function, retry_policy)
+        return llm.chat(chat_messages, retry_policy).content
+
+    return _cached_response(
+        model, _with_function(chat_messages, function), cache, send, prompt_tokens
+    )
 
 
 def chat(
@@ -381,3 +1583,171 @@ def chat(
     response = complete_with_messages(model, messages, prompt)
     messages.append({"role": "assistant", "content": response})
     return messages
+
+
+## async API
+async def acomplete(
+    prompt: str,
+    model: str,
+    system_prompt: Optional[str] = None,
+    retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    cache: Optional[bool] = None,
+) -> str:
+    if system_prompt:
+        prompt = f"{system_prompt}\n##User question\n{prompt}\n"
+    if model not in OPEN_AI_MODELS_HUB:
+        raise ValueError(f"Not found model {model}")
+    return await _acached_response(
+        model,
+        prompt,
+        cache,
+        lambda routed_model: OPEN_AI_MODELS_HUB[routed_model].apredict(
+            prompt, retry_policy
+        ),
+    )
+
+
+async def acomplete_with_messages(
+    model: str,
+    messages: List[Dict[str, str]],
+    prompt: Optional[str] = None,
+    retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    cache: Optional[bool] = None,
+    prompt_tokens: Optional[int] = None,
+) -> str:
+    chat_messages = to_chat_messages(messages, prompt)
+
+    if model not in OPEN_AI_MODELS_HUB:
+        raise ValueError(f"Not found model {model}")
+
+    async def send(routed_model: str) -> str:
+        return (
+            await OPEN_AI_MODELS_HUB[routed_model].achat(chat_messages, retry_policy)
+        ).content
+
+    return await _acached_response(model, chat_messages, cache, send, prompt_tokens)
+
+
+async def asend_messages(
+    messages: List[Dict[str, str]],
+    model: str,
+    retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    cache: Optional[bool] = None,
+    prompt_tokens: Optional[int] = None,
+) -> str:
+    return await acomplete_with_messages(
+        model,
+        messages,
+        retry_policy=retry_policy,
+        cache=cache,
+        prompt_tokens=prompt_tokens,
+    )
+
+
+_STREAM_END = object()
+
+
+async def astream_messages(
+    messages: List[Dict[str, str]],
+    model: str,
+    retry_policy: RetryPolicy = retry.DEFAULT_POLICY,
+    cache: Optional[bool] = None,
+    prompt_tokens: Optional[int] = None,
+) -> AsyncIterator[str]:
+    """Yields the pieces of the response to messages as they arrive.
+
+    async for piece in gpt.astream_messages(messages, gpt.GPT_4):
+        ...
+    """
+    chat_messages = to_chat_messages(messages)
+    if model not in OPEN_AI_MODELS_HUB:
+        raise ValueError(f"Not found model {model}")
+
+    queue: asyncio.Queue = asyncio.Queue()
+    streamed = False
+
+    def on_piece(piece: str):
+        nonlocal streamed
+        streamed = True
+        queue.put_nowait(piece)
+
+    response = asyncio.ensure_future(
+        _acached_response(
+            model,
+            chat_messages,
+            cache,
+            lambda routed_model: _astream_chat(
+                OPEN_AI_MODELS_HUB[routed_model], chat_messages, on_piece, retry_policy
+            ),
+            prompt_tokens,
+        )
+    )
+    response.add_done_callback(lambda _: queue.put_nowait(_STREAM_END))
+    try:
+        while True:
+            piece = await queue.get()
+            if piece is _STREAM_END:
+                break
+            yield piece
+        # raises the error of the request, if it failed
+        if not streamed and response.result():
+            yield response.result()
+    finally:
+        if not response.done():
+            response.cancel()
+
+
+async def gather_limited(
+    calls: Iterable[Awaitable],
+    max_concurrency: int = LLM_CONCURRENCY,
+    return_exceptions: bool = False,
+) -> List[Any]:
+    """Awaits the calls with at most max_concurrency in flight, results are in the calls' order."""
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def limited(call):
+        async with semaphore:
+            return await call
+
+    return list(
+        await asyncio.gather(
+            *(limited(call) for call in calls), return_exceptions=return_exceptions
+        )
+    )
+
+
+def complete_many(
+    prompts: List[str],
+    model: str,
+    system_prompt: Optional[str] = None,
+    max_concurrency: int = LLM_CONCURRENCY,
+) -> List[str]:
+    """Sends the prompts concurrently from synchronous code, results are in the prompts' order."""
+
+    async def run():
+        try:
+            return await gather_limited(
+                [acomplete(prompt, model, system_prompt) for prompt in prompts],
+                max_concurrency,
+            )
+        finally:
+            await aclose_http_session()
+
+    return asyncio.run(run())
+
+
+def send_messages_many(
+    conversations: List[List[Dict[str, str]]],
+    model: str,
+    max_concurrency: int = LLM_CONCURRENCY,
+) -> List[str]:
+    async def run():
+        try:
+            return await gather_limited(
+                [asend_messages(messages, model) for messages in conversations],
+                max_concurrency,
+            )
+        finally:
+            await aclose_http_session()
+
+    return asyncio.run(run())
@@ -1,8 +1,11 @@
 import json
 import logging
+from typing import Optional
 
 from jarvis.smartgpt import actions
 from jarvis.smartgpt import jvm
+from jarvis.smartgpt import streaming
+from jarvis.smartgpt import usage
 from jarvis.smartgpt import utils
 
 
@@ -58,11 +61,17 @@ class JVMInstruction:
             return
 
         logging.info(f"Running action: {action}\n")
-        result = action.run()
+        published = set()
+        if action_type == "TextCompletion":
+            # the kvs are published as they stream in, post_exec stores them once the whole
+            # result is valid
+            result = action.run(on_kv=lambda kv: self.publish_kv(kv, published))
+        else:
+            result = action.run()
         logging.info(f"\nresult of {action_type}: {result}\n")
 
         if action_type != "RunPython":
-            self.post_exec(result)
+            self.post_exec(result, published)
         else:
             jvm.load_kv_store()
 
@@ -78,9 +87,35 @@ class JVMInstruction:
 
         return text
 
-    def post_exec(self, result: str):
+    def publish_kv(self, kv, published: set):
+        """Publishes a kv as partial output, once."""
         try:
-            data = json.loads(result)
+            text = f"{kv['key']}={kv['value']}"
+        except (KeyError, TypeError):
+            return
+        if text not in published:
+            published.add(text)
+            streaming.publish("kv", text)
+
+    def store_kv(self, kv, published: set) -> bool:
+        """Sets a kv of a result in the jvm, returns False if it is malformed."""
+        try:
+            key = kv["key"]
+            value = kv["value"]
+        except (KeyError, TypeError):
+            logging.error(f"Invalid KV item in the result: {kv}")
+            return False
+
+        logging.info(f"Setting KV in the JVM database: '{key}'={value}")
+        jvm.set(key, value)
+        self.publish_kv(kv, published)
+        return True
+
+    def post_exec(self, result: str, published: Optional[set] = None):
+        """Stores the kvs of result, published is the text of the kvs already published."""
+        published = set() if published is None else published
+        try:
+            data = utils.loads_json(result)
         except json.JSONDecodeError as e:
             logging.error(f"Failed to parse: {result}, error: {e}")
             raise
@@ -92,16 +127,9 @@ class JVMInstruction:
 
         # Iterate over key-value pairs and set them in the jvm
         for kv in data["kvs"]:
-            try:
-                key = kv["key"]
-                value = kv["value"]
-            except KeyError:
-                logging.error(f"Invalid KV item in the result: {kv}")
+            if not self.store_kv(kv, published):
                 return
 
-            logging.info(f"Setting KV in the JVM database: '{key}'={value}")
-            jvm.set(key, value)
-
 
 class JVMInterpreter:
     def __init__(self):
@@ -184,8 +212,9 @@ class JVMInterpreter:
         )
 
         try:
-            evaluation_result = evaluation_action.run()
-            output_res = json.loads(evaluation_result)
+            with usage.call_site("if"):
+                evaluation_result = evaluation_action.run()
+            output_res = utils.loads_json(evaluation_result)
             condition_eval_result = utils.str_to_bool(output_res["kvs"][0]["value"])
 
         except Exception as err:
@@ -9,6 +9,91 @@ from jarvis.smartgpt import utils
 kv_store_file = "kv_store.json"
 kv_store = {}
 
+# Where the reads of a RunPython script are recorded, None when they aren't traced
+_trace_file = None
+_traced_keys = set()
+_written_keys = set()
+
+
+class TracedStore(dict):
+    """The kv_store of a RunPython script, recording the entries the script reads.
+
+    Reads are appended to the trace file as they happen, one JSON object per line, so
+    the trace survives however the script exits. Entries the script wrote itself are
+    not reads, and enumerating the whole store records all of it.
+    """
+
+    def _trace(self, key):
+        if key not in _traced_keys and key not in _written_keys:
+            _traced_keys.add(key)
+            _write_trace({"key": key, "value": dict.get(self, key)})
+
+    def _trace_all(self):
+        if "*" not in _traced_keys:
+            _traced_keys.add("*")
+            _write_trace(
+                {"all": {k: v for k, v in dict.items(self) if k not in _written_keys}}
+            )
+
+    def __getitem__(self, key):
+        self._trace(key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self._trace(key)
+        return super().get(key, default)
+
+    def __contains__(self, key):
+        self._trace(key)
+        return super().__contains__(key)
+
+    def __setitem__(self, key, value):
+        _written_keys.add(key)
+        super().__setitem__(key, value)
+
+    def keys(self):
+        self._trace_all()
+        return super().keys()
+
+    def values(self):
+        self._trace_all()
+        return super().values()
+
+    def items(self):
+        self._trace_all()
+        return super().items()
+
+    def __iter__(self):
+        self._trace_all()
+        return super().__iter__()
+
+
+def _write_trace(record):
+    with open(_trace_file, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def trace_reads(trace_file):
+    """Records the entries read from now on to trace_file, call before load_kv_store."""
+    global _trace_file
+    _trace_file = trace_file
+    _traced_keys.clear()
+    _written_keys.clear()
+
+
+def _store_keys():
+    # listing keys by prefix is recorded as a read of the prefix, not of the whole store
+    return dict.keys(kv_store)
+
+
+def _trace_prefix(prefix):
+    if _trace_file is not None and f"{prefix}*" not in _traced_keys:
+        _traced_keys.add(f"{prefix}*")
+        keys = sorted(
+            k for k in _store_keys() if k.startswith(prefix) and k not in _written_keys
+        )
+        _write_trace({"prefix": prefix, "keys": keys})
+
 
 def reset_kv_store():
     global kv_store
@@ -24,11 +109,14 @@ def load_kv_store():
             kv_store = json.load(f)
     else:
         kv_store = {}
+    if _trace_file is not None:
+        kv_store = TracedStore(kv_store)
 
 
 def save_kv_store():
     with open(kv_store_file, "w") as f:
-        json.dump(kv_store, f)
+        # a plain copy, so that saving isn't traced as reading the whole store
+        json.dump(dict(dict.items(kv_store)), f)
 
 
 def get(key, default=None):
@@ -57,8 +145,9 @@ def set(key, value):
 
 def list_values_with_key_prefix(prefix):
     try:
+        _trace_prefix(prefix)
         values = []
-        for key in kv_store.keys():
+        for key in _store_keys():
             if key.startswith(prefix):
                 values.append(get(key))
         # logging.info(f"list_values_with_key_prefix, values: {values}")
@@ -70,7 +159,8 @@ def list_values_with_key_prefix(prefix):
 
 def list_keys_with_prefix(prefix):
     try:
-        keys = [key for key in kv_store.keys() if key.startswith(prefix)]
+        _trace_prefix(prefix)
+        keys = [key for key in _store_keys() if key.startswith(prefix)]
         return keys
     except Exception as err:
         logging.fatal(f"list_keys_with_prefix, An error occurred: {err}")
@@ -0,0 +1,177 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+# Responses of LLM requests kept across runs, see gpt.complete and gpt.send_messages
+ENABLE_RESPONSE_CACHE = os.getenv("JARVIS_LLM_CACHE", "true").lower() == "true"
+# At temperature 0 a request has a single expected response, cache every request then. Above it,
+# only the responses of the call sites opting in are cached
+DETERMINISTIC_CACHE = (
+    os.getenv("JARVIS_LLM_CACHE_DETERMINISTIC", "true").lower() == "true"
+)
+# Call sites of usage.call_site whose sampled responses are cached too, e.g. "planner,translator"
+# replays the plan of a goal run before instead of sampling a new one
+CACHE_SITES = {
+    site.strip()
+    for site in os.getenv("JARVIS_LLM_CACHE_SITES", "").split(",")
+    if site.strip()
+}
+RESPONSE_CACHE_PATH = os.path.expanduser(
+    os.getenv("JARVIS_LLM_CACHE_PATH", "~/.cache/jarvis/llm_responses.sqlite")
+)
+try:
+    # least recently used responses are evicted beyond this many
+    RESPONSE_CACHE_SIZE = int(os.getenv("JARVIS_LLM_CACHE_SIZE", "10000"))
+except (ValueError, TypeError):
+    RESPONSE_CACHE_SIZE = 10000
+
+
+class ResponseCache:
+    """LLM responses by request key, stored in SQLite and bounded in number of responses."""
+
+    def __init__(self, path: str, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn = None
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # shared by the threads of the process, which take the lock to use it
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL, last_used REAL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str, model: str) -> Optional[str]:
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute(
+                    "SELECT response FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self.misses[model] = self.misses.get(model, 0) + 1
+                    return None
+                conn.execute(
+                    "UPDATE responses SET last_used = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+                conn.commit()
+                self.hits[model] = self.hits.get(model, 0) + 1
+                return row[0]
+        except sqlite3.Error as err:
+            logging.warning(f"LLM response cache lookup failed: {err}")
+            return None
+
+    def put(self, key: str, model: str, response: str):
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, model, response, now, now),
+                )
+                (count,) = conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+                if count > self.max_entries:
+                    conn.execute(
+                        "DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                        (count - self.max_entries,),
+                    )
+                conn.commit()
+        except sqlite3.Error as err:
+            logging.warning(f"LLM response cache update failed: {err}")
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+            self.hits.clear()
+            self.misses.clear()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Hits, misses and hit ratio of the lookups of this process, overall and per model."""
+        with self._lock:
+            hits, misses = dict(self.hits), dict(self.misses)
+
+        def ratio(hit_count, miss_count):
+            total = hit_count + miss_count
+            return round(hit_count / total, 3) if total else 0.0
+
+        models = sorted(set(hits) | set(misses))
+        return {
+            "hits": sum(hits.values()),
+            "misses": sum(misses.values()),
+            "hit_ratio": ratio(sum(hits.values()), sum(misses.values())),
+            "models": {
+                model: {
+                    "hits": hits.get(model, 0),
+                    "misses": misses.get(model, 0),
+                    "hit_ratio": ratio(hits.get(model, 0), misses.get(model, 0)),
+                }
+                for model in models
+            },
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        lines = [
+            f"LLM response cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"hit ratio {stats['hit_ratio']:.1%}"
+        ]
+        for model, model_stats in stats["models"].items():
+            lines.append(
+                f"  {model}: {model_stats['hits']} hits, {model_stats['misses']} misses, "
+                f"hit ratio {model_stats['hit_ratio']:.1%}"
+            )
+        return "\n".join(lines)
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(RESPONSE_CACHE_PATH)
+        return _cache
+
+
+def should_cache(
+    cache: Optional[bool], temperature: float, call_site: Optional[str] = None
+) -> bool:
+    """Whether a call site's request is cached.
+
+    cache is the call site's choice, None leaves it to CACHE_SITES and the deterministic mode.
+    """
+    if not ENABLE_RESPONSE_CACHE or cache is False:
+        return False
+    return (
+        cache is True
+        or call_site in CACHE_SITES
+        or (DETERMINISTIC_CACHE and temperature == 0)
+    )
@@ -0,0 +1,207 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except (ValueError, TypeError):
+        return default
+
+
+# Local llama.cpp model answering on CPU, enabled by setting the path of its GGUF file
+LOCAL_MODEL_NAME = os.getenv("JARVIS_LOCAL_MODEL", "llama-local")
+LOCAL_MODEL_PATH = os.getenv("JARVIS_LOCAL_MODEL_PATH")
+CONTEXT_TOKENS = _env_int("JARVIS_LOCAL_MODEL_CONTEXT", 4096)
+# 0 uses every core
+THREADS = _env_int("JARVIS_LOCAL_MODEL_THREADS", 0)
+# prompt tokens evaluated per llama.cpp batch
+BATCH_TOKENS = _env_int("JARVIS_LOCAL_MODEL_BATCH", 512)
+MAX_COMPLETION_TOKENS = _env_int("JARVIS_LOCAL_MODEL_MAX_TOKENS", 512)
+# states of evaluated prompts kept in memory, requests sharing a prefix with one skip evaluating it
+PREFIX_CACHE_MB = _env_int("JARVIS_LOCAL_MODEL_PREFIX_CACHE_MB", 512)
+
+
+class ContextLengthError(ValueError):
+    """The request doesn't fit the local model's context, another model may take it."""
+
+    code = "context_length_exceeded"
+
+
+def is_installed() -> bool:
+    try:
+        import llama_cpp  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class LlamaModel:
+    """A llama.cpp model loaded once and kept resident.
+
+    A llama.cpp context evaluates one sequence at a time, so requests queue for the model's
+    thread. It takes every request queued meanwhile as a batch, evaluated in prompt order so
+    that prompts sharing a prefix, such as a system prompt, follow each other and reuse its
+    state from the prefix cache instead of evaluating it again.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        context_tokens: int = CONTEXT_TOKENS,
+        threads: int = THREADS,
+        batch_tokens: int = BATCH_TOKENS,
+        prefix_cache_mb: int = PREFIX_CACHE_MB,
+    ):
+        self.path = path
+        self.context_tokens = context_tokens
+        self.threads = threads or os.cpu_count() or 1
+        self.batch_tokens = batch_tokens
+        self.prefix_cache_mb = prefix_cache_mb
+        self._llama = None
+        self._load_lock = threading.Lock()
+        self._pending: List[Tuple[str, Callable[[], str], Future]] = []
+        self._pending_cond = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._stats = {"requests": 0, "batches": 0}
+
+    def load(self):
+        """Loads the model if it isn't yet, call at startup to keep it off the first request."""
+        with self._load_lock:
+            if self._llama is not None:
+                return self._llama
+            try:
+                import llama_cpp
+            except ImportError as err:
+                raise RuntimeError(
+                    "The local model needs llama-cpp-python, install it with `pip install llama-cpp-python`"
+                ) from err
+
+            logging.info(f"Loading local model {self.path} with {self.threads} threads")
+            llama = llama_cpp.Llama(
+                model_path=self.path,
+                n_ctx=self.context_tokens,
+                n_threads=self.threads,
+                n_batch=self.batch_tokens,
+                verbose=False,
+            )
+            if self.prefix_cache_mb > 0:
+                llama.set_cache(
+                    llama_cpp.LlamaRAMCache(capacity_bytes=self.prefix_cache_mb << 20)
+                )
+            self._llama = llama
+            return llama
+
+    def _submit(self, order_key: str, fn: Callable[[], str]) -> Future:
+        future: Future = Future()
+        with self._pending_cond:
+            self._pending.append((order_key, fn, future))
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._work, name="llama", daemon=True
+                )
+                self._worker.start()
+            self._pending_cond.notify()
+        return future
+
+    def _work(self):
+        while True:
+            with self._pending_cond:
+                while not self._pending:
+                    self._pending_cond.wait()
+                batch = sorted(self._pending, key=lambda item: item[0])
+                self._pending = []
+                self._stats["requests"] += len(batch)
+                self._stats["batches"] += 1
+
+            for _, fn, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(fn())
+                except BaseException as err:
+                    future.set_exception(err)
+
+    def _run(self, fn):
+        try:
+            return fn(self.load())
+        except ValueError as err:
+            # llama-cpp-python raises ValueError when the prompt exceeds the context
+            if "context" in str(err).lower():
+                raise ContextLengthError(str(err)) from err
+            raise
+
+    def _complete(self, prompt: str, temperature: float, max_tokens: int) -> Future:
+        return self._submit(
+            prompt,
+            lambda: self._run(
+                lambda llama: llama(
+                    prompt, max_tokens=max_tokens, temperature=temperature
+                )["choices"][0]["text"]
+            ),
+        )
+
+    def _chat(
+        self, messages: List[Dict[str, str]], temperature: float, max_tokens: int
+    ) -> Future:
+        return self._submit(
+            "\n".join(message["content"] for message in messages),
+            lambda: self._run(
+                lambda llama: llama.create_chat_completion(
+                    messages=messages, max_tokens=max_tokens, temperature=temperature
+                )["choices"][0]["message"]["content"]
+            ),
+        )
+
+    def complete(
+        self, prompt: str, temperature: float, max_tokens: int = MAX_COMPLETION_TOKENS
+    ) -> str:
+        return self._complete(prompt, temperature, max_tokens).result()
+
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int = MAX_COMPLETION_TOKENS,
+    ) -> str:
+        return self._chat(messages, temperature, max_tokens).result()
+
+    async def acomplete(
+        self, prompt: str, temperature: float, max_tokens: int = MAX_COMPLETION_TOKENS
+    ) -> str:
+        return await asyncio.wrap_future(
+            self._complete(prompt, temperature, max_tokens)
+        )
+
+    async def achat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int = MAX_COMPLETION_TOKENS,
+    ) -> str:
+        return await asyncio.wrap_future(self._chat(messages, temperature, max_tokens))
+
+    def stats(self) -> Dict[str, float]:
+        """Requests answered and how many of them were evaluated per batch on average."""
+        with self._pending_cond:
+            stats = dict(self._stats)
+        stats["batch_size"] = (
+            stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        )
+        return stats
+
+
+_models: Dict[str, LlamaModel] = {}
+_models_lock = threading.Lock()
+
+
+def get_model(path: str) -> LlamaModel:
+    """Returns the resident model of path, shared by every client in the process."""
+    with _models_lock:
+        if path not in _models:
+            _models[path] = LlamaModel(path)
+        return _models[path]
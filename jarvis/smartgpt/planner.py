@@ -9,6 +9,7 @@ import yaml
 from jarvis.smartgpt import gpt
 from jarvis.smartgpt import clarifier
 from jarvis.smartgpt import preprompts
+from jarvis.smartgpt import usage
 
 
 def gen_plan(model: str, goal: str) -> Dict:
@@ -28,7 +29,8 @@ def gen_plan(model: str, goal: str) -> Dict:
             "Your YAML response:```yaml\n"
         )
 
-        resp = gpt.complete(user_prompt, model, system_prompt)
+        with usage.call_site("planner"):
+            resp = gpt.complete(user_prompt, model, system_prompt)
 
         # resp = reorder_tasks(utils.strip_yaml(resp))
         with open("plan.yaml", "w") as stream:
@@ -117,7 +119,8 @@ def evaluate_plan(model: str, goal: str):
     messages.append({"role": "system", "content": preprompts.get("plan_eval_sys")})
     user_prompt = preprompts.get("plan_eval_user").format(goal=goal, plan=plan)
     messages.append({"role": "user", "content": user_prompt})
-    resp = gpt.send_messages(messages, model)
+    with usage.call_site("planner"):
+        resp = gpt.send_messages(messages, model)
     messages.append({"role": "assistant", "content": resp})
 
     match_answer = re.match(r"(yes|no)", resp.lower())
@@ -0,0 +1,162 @@
+import os
+import ast
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from jarvis.smartgpt import utils
+from jarvis.smartgpt import venvs
+
+# Install the dependencies of translated tasks in the background, while later tasks are translated
+ENABLE_PROVISIONING = utils.str_to_bool(
+    os.getenv("JARVIS_PROVISION_DEPENDENCIES", "true")
+)
+
+# Import names whose distribution is named differently on PyPI
+IMPORT_TO_PACKAGE = {
+    "bs4": "beautifulsoup4",
+    "cv2": "opencv-python",
+    "dateutil": "python-dateutil",
+    "docx": "python-docx",
+    "dotenv": "python-dotenv",
+    "jwt": "PyJWT",
+    "PIL": "Pillow",
+    "serial": "pyserial",
+    "sklearn": "scikit-learn",
+    "yaml": "PyYAML",
+}
+
+# Import names provided by several unrelated distributions, left to the declared dependencies
+AMBIGUOUS_IMPORTS = {"google"}
+
+# Modules provided by the project itself
+PROJECT_MODULES = {"jarvis", "jvm"}
+
+_executor = None
+_pending: Dict[str, List[Future]] = {}
+_lock = threading.Lock()
+
+
+def is_work_dir_module(name: str, work_dir: Optional[str]) -> bool:
+    """Whether name is a module or package in work_dir, such as a helper written by the plan."""
+    if work_dir is None:
+        return False
+    return os.path.isfile(os.path.join(work_dir, f"{name}.py")) or os.path.isdir(
+        os.path.join(work_dir, name)
+    )
+
+
+def imported_packages(code: str, work_dir: Optional[str] = None) -> List[str]:
+    """Returns the third party packages imported by code, which is parsed but not run.
+
+    The modules in work_dir, where the scripts run, are not packages to install.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module.split(".")[0])
+
+    return sorted(
+        IMPORT_TO_PACKAGE.get(name, name)
+        for name in names
+        if name not in PROJECT_MODULES
+        and name not in AMBIGUOUS_IMPORTS
+        and not venvs.is_standard_module(name)
+        and not is_work_dir_module(name, work_dir)
+    )
+
+
+def collect_dependencies(
+    instructions: List[Dict], work_dir: Optional[str] = None
+) -> Dict[str, List[str]]:
+    """Walks the instructions of a task, nested Loop and If bodies included.
+
+    Returns the dependencies declared by its RunPython instructions under "declared",
+    and the packages their code imports without declaring them under "imported".
+    """
+    declared, imported = set(), set()
+
+    def walk(instrs):
+        for instr in instrs or []:
+            if not isinstance(instr, dict):
+                continue
+            args = instr.get("args") or {}
+            if instr.get("type") == "RunPython":
+                declared.update(args.get("pkg_dependencies") or [])
+                code = args.get("code")
+                if isinstance(code, str):
+                    imported.update(imported_packages(code, work_dir))
+            for body in ("instructions", "then", "else"):
+                if isinstance(args.get(body), list):
+                    walk(args[body])
+
+    walk(instructions)
+    declared = set(venvs.resolve_dependencies(list(declared)))
+    normalized = {venvs.normalize_name(dep) for dep in declared}
+    return {
+        "declared": sorted(declared),
+        "imported": sorted(
+            dep for dep in imported if venvs.normalize_name(dep) not in normalized
+        ),
+    }
+
+
+def _provision(work_dir: str, dependencies: Dict[str, List[str]]):
+    with venvs.lease_work_dir_env(work_dir, dependencies["declared"]) as venv_bin:
+        if not dependencies["imported"]:
+            return
+
+        # import names are only a guess of the package to install: they are installed into the
+        # env but kept out of the executor's dependencies, and a failure here is not fatal
+        try:
+            venvs.install_packages(venv_bin, dependencies["imported"])
+        except Exception as err:
+            logging.warning(
+                f"Could not provision imported packages {dependencies['imported']}: {err}"
+            )
+
+
+def _run(work_dir: str, dependencies: Dict[str, List[str]]):
+    try:
+        _provision(work_dir, dependencies)
+        logging.info(f"Provisioned dependencies for {work_dir}: {dependencies}")
+    except Exception as err:
+        logging.warning(f"Provisioning dependencies for {work_dir} failed: {err}")
+
+
+def provision(work_dir: str, task_instrs: Dict) -> Optional[Future]:
+    """Starts installing the dependencies of a compiled task into the work dir's env."""
+    if not ENABLE_PROVISIONING or not venvs.SHARED_VENVS or not task_instrs:
+        return None
+
+    work_dir = os.path.abspath(work_dir)
+    dependencies = collect_dependencies(task_instrs.get("instructions", []), work_dir)
+    if not dependencies["declared"] and not dependencies["imported"]:
+        return None
+
+    global _executor
+    with _lock:
+        if _executor is None:
+            # one installer thread: envs are built one at a time anyway
+            _executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="provisioner"
+            )
+        future = _executor.submit(_run, work_dir, dependencies)
+        _pending.setdefault(work_dir, []).append(future)
+    return future
+
+
+def wait(work_dir: str):
+    """Blocks until the dependencies being provisioned for work_dir are installed."""
+    with _lock:
+        futures = _pending.pop(os.path.abspath(work_dir), [])
+    for future in futures:
+        future.result()
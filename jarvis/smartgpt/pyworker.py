@@ -0,0 +1,268 @@
+import os
+import json
+import queue
+import atexit
+import select
+import logging
+import threading
+import subprocess
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from jarvis.smartgpt import venvs
+
+# Pre-started zygote processes kept per virtual env, 0 disables the pool
+try:
+    POOL_SIZE = int(os.getenv("JARVIS_PYTHON_WORKERS", "2"))
+except (ValueError, TypeError):
+    POOL_SIZE = 2
+
+# A zygote is replaced after running this many scripts
+try:
+    MAX_RUNS_PER_WORKER = int(os.getenv("JARVIS_PYTHON_WORKER_MAX_RUNS", "100"))
+except (ValueError, TypeError):
+    MAX_RUNS_PER_WORKER = 100
+
+# Seconds a script waits for a busy worker, it runs in a fresh interpreter after that
+try:
+    ACQUIRE_TIMEOUT = float(os.getenv("JARVIS_PYTHON_WORKER_WAIT", "1"))
+except (ValueError, TypeError):
+    ACQUIRE_TIMEOUT = 1.0
+
+ENABLED = POOL_SIZE > 0 and hasattr(os, "fork")
+
+# Pools are kept for the most recently used virtual envs only
+MAX_POOLS = 4
+
+# extra time given to a zygote to report a killed script before the zygote itself is killed
+RESPONSE_GRACE_PERIOD = 5
+
+ZYGOTE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "zygote.py")
+
+# (exit code, stdout, stderr, timed out, resource usage)
+ScriptResult = Tuple[int, str, str, bool, Dict[str, float]]
+
+_pools: "OrderedDict[Tuple[str, str], WorkerPool]" = OrderedDict()
+_pools_lock = threading.Lock()
+
+
+class WorkerUnavailableError(RuntimeError):
+    """The script never reached a worker, it can run in a fresh interpreter instead."""
+
+
+class WorkerLostError(RuntimeError):
+    """The worker failed after receiving the script, which may have run, in part or whole."""
+
+
+class WorkerTimeoutError(WorkerLostError):
+    """The worker didn't report the script's result in time."""
+
+
+class PythonWorker:
+    """A zygote process that forks a child for every script it is asked to run."""
+
+    def __init__(self, python: str, project_dir: str):
+        self.runs = 0
+        self.process = subprocess.Popen(
+            [python, "-u", ZYGOTE_SCRIPT, project_dir],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def run(
+        self, script: str, args, cwd: str, timeout: float, limits=None
+    ) -> ScriptResult:
+        request = {
+            "script": script,
+            "args": args,
+            "cwd": cwd,
+            "timeout": timeout,
+            "limits": limits,
+        }
+        self.runs += 1
+        try:
+            self.process.stdin.write((json.dumps(request) + "\n").encode("utf-8"))
+            self.process.stdin.flush()
+        except OSError as err:
+            raise WorkerUnavailableError(f"Python worker is gone: {err}") from err
+
+        ready, _, _ = select.select(
+            [self.process.stdout], [], [], timeout + RESPONSE_GRACE_PERIOD
+        )
+        if not ready:
+            raise WorkerTimeoutError("Python worker did not answer in time")
+
+        line = self.process.stdout.readline()
+        if not line:
+            raise WorkerLostError(
+                f"Python worker exited with code {self.process.poll()}"
+            )
+
+        try:
+            response = json.loads(line)
+        except ValueError as err:
+            raise WorkerLostError(
+                f"Python worker sent a malformed response: {err}"
+            ) from err
+        return (
+            response["exit_code"],
+            response["stdout"],
+            response["stderr"],
+            response["timed_out"],
+            response["usage"],
+        )
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=1)
+        except Exception:
+            self.process.kill()
+            self.process.wait()
+
+
+class WorkerPool:
+    """Warm workers sharing one virtual env, recycled after max_runs scripts or on failure."""
+
+    def __init__(
+        self,
+        python: str,
+        project_dir: str,
+        size: int = POOL_SIZE,
+        max_runs: int = MAX_RUNS_PER_WORKER,
+        acquire_timeout: float = ACQUIRE_TIMEOUT,
+    ):
+        self.python = python
+        self.project_dir = project_dir
+        self.size = size
+        self.max_runs = max_runs
+        self.acquire_timeout = acquire_timeout
+        self._idle: queue.Queue = queue.Queue()
+        self._started = 0
+        self._lock = threading.Lock()
+        # a shared env isn't garbage collected while its workers run
+        self._lease = venvs.lease_env(os.path.dirname(python))
+
+    def prestart(self):
+        """Starts all the workers ahead of the first script."""
+        while True:
+            with self._lock:
+                if self._started >= self.size:
+                    return
+                self._started += 1
+            self._idle.put(self._start_worker())
+
+    def _acquire(self) -> PythonWorker:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            start_worker = self._started < self.size
+            if start_worker:
+                self._started += 1
+
+        if not start_worker:
+            # a hung script must not hold up the scripts of other executors
+            try:
+                return self._idle.get(timeout=self.acquire_timeout)
+            except queue.Empty:
+                raise WorkerUnavailableError(
+                    f"All {self.size} python workers stayed busy for {self.acquire_timeout}s"
+                ) from None
+        return self._start_worker()
+
+    def _start_worker(self) -> PythonWorker:
+        try:
+            return PythonWorker(self.python, self.project_dir)
+        except Exception:
+            with self._lock:
+                self._started -= 1
+            raise
+
+    def _release(self, worker: PythonWorker, healthy: bool):
+        if healthy and worker.alive() and worker.runs < self.max_runs:
+            self._idle.put(worker)
+            return
+
+        worker.close()
+        # start the replacement right away, so the next script finds it warm
+        try:
+            self._idle.put(self._start_worker())
+        except Exception as err:
+            logging.error(f"Failed to start a python worker: {err}")
+
+    def run(
+        self, script: str, args, cwd: str, timeout: float, limits=None
+    ) -> ScriptResult:
+        try:
+            worker = self._acquire()
+        except OSError as err:
+            raise WorkerUnavailableError(
+                f"Failed to start a python worker: {err}"
+            ) from err
+        healthy = False
+        try:
+            result = worker.run(script, args, cwd, timeout, limits)
+            healthy = True
+            return result
+        finally:
+            self._release(worker, healthy)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        if self._lease is not None:
+            self._lease.close()
+            self._lease = None
+
+
+def get_pool(python: str, project_dir: str) -> WorkerPool:
+    with _pools_lock:
+        key = (python, project_dir)
+        if key in _pools:
+            _pools.move_to_end(key)
+            return _pools[key]
+
+        _pools[key] = WorkerPool(python, project_dir)
+        while len(_pools) > MAX_POOLS:
+            _, evicted = _pools.popitem(last=False)
+            evicted.close()
+        return _pools[key]
+
+
+def run_script(
+    python: str,
+    project_dir: str,
+    script: str,
+    args,
+    cwd: str,
+    timeout: float,
+    limits=None,
+) -> Optional[ScriptResult]:
+    """Runs script in a warm worker, returns None if it never reached one and should run cold.
+
+    Raises WorkerLostError if the worker failed once it had the script: running the script
+    again could repeat its side effects.
+    """
+    try:
+        return get_pool(python, project_dir).run(script, args, cwd, timeout, limits)
+    except WorkerUnavailableError as err:
+        logging.warning(f"Python worker failed to run {script}: {err}")
+        return None
+
+
+@atexit.register
+def shutdown():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
@@ -0,0 +1,157 @@
+import time
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+# Waits longer than this are logged
+SLOW_WAIT_SECONDS = 1.0
+
+
+@dataclass
+class RateLimit:
+    """Requests and tokens allowed per minute, 0 for no limit."""
+
+    requests_per_minute: int = 0
+    tokens_per_minute: int = 0
+
+
+class TokenBucket:
+    """A bucket refilled continuously up to its capacity.
+
+    Taking more than is available leaves the bucket in debt: the taker is told how long
+    to wait until the debt is paid back, and later takers queue behind it.
+    """
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.refill_per_second = capacity / 60
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def wait_for(self, amount: float, now: float) -> float:
+        """Seconds a taker of amount would wait now, without taking it."""
+        level = min(
+            self.capacity, self.level + (now - self.updated) * self.refill_per_second
+        )
+        level -= min(amount, self.capacity)
+        return 0.0 if level >= 0 else -level / self.refill_per_second
+
+    def take(self, amount: float, now: float) -> float:
+        """Takes amount from the bucket, returns the seconds to wait before using it."""
+        self.level = min(
+            self.capacity, self.level + (now - self.updated) * self.refill_per_second
+        )
+        self.updated = now
+        self.level -= min(amount, self.capacity)
+        if self.level >= 0:
+            return 0.0
+        return -self.level / self.refill_per_second
+
+
+class RateLimiter:
+    """Token-bucket limiter of the requests sent to one model or deployment.
+
+    Capacity is reserved in arrival order, so callers are served first come first served
+    whether they wait in a thread or in a coroutine.
+    """
+
+    def __init__(self, name: str, limit: RateLimit):
+        self.name = name
+        self.limit = limit
+        self._requests = (
+            TokenBucket(limit.requests_per_minute)
+            if limit.requests_per_minute
+            else None
+        )
+        self._tokens = (
+            TokenBucket(limit.tokens_per_minute) if limit.tokens_per_minute else None
+        )
+        self._lock = threading.Lock()
+        self.queue_depth = 0
+        self.requests = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def reserve(self, tokens: int) -> float:
+        """Reserves capacity for a request of tokens prompt tokens, returns the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self._requests is not None:
+                wait = max(wait, self._requests.take(1, now))
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.take(tokens, now))
+
+            self.requests += 1
+            if wait > 0:
+                self.waits += 1
+                self.queue_depth += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                if wait > SLOW_WAIT_SECONDS:
+                    logging.info(
+                        f"Rate limit of {self.name}: waiting {wait:.1f}s, {self.queue_depth} requests queued"
+                    )
+            return wait
+
+    def expected_wait(self, tokens: int) -> float:
+        """Seconds a request of tokens prompt tokens would wait if it was sent now."""
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self._requests is not None:
+                wait = max(wait, self._requests.wait_for(1, now))
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.wait_for(tokens, now))
+            return wait
+
+    def _done_waiting(self):
+        with self._lock:
+            self.queue_depth -= 1
+
+    def acquire(self, tokens: int):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                self._done_waiting()
+
+    async def aacquire(self, tokens: int):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._done_waiting()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "queue_depth": self.queue_depth,
+                "requests": self.requests,
+                "waits": self.waits,
+                "total_wait": round(self.total_wait, 3),
+                "avg_wait": round(self.total_wait / self.waits, 3)
+                if self.waits
+                else 0.0,
+                "max_wait": round(self.max_wait, 3),
+            }
+
+
+def parse_rate_limits(spec: Optional[str]) -> Dict[str, RateLimit]:
+    """Parses "model=rpm:tpm,model=rpm:tpm", e.g. "gpt-4=200:40000"."""
+    limits = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        try:
+            name, values = item.split("=", 1)
+            rpm, tpm = values.split(":", 1)
+            limits[name.strip()] = RateLimit(int(rpm), int(tpm))
+        except ValueError:
+            logging.error(f"Invalid rate limit `{item}`, expected model=rpm:tpm")
+    return limits
@@ -0,0 +1,250 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Latencies kept per model to estimate when a request is slower than usual
+LATENCY_WINDOW = 200
+# Hedging starts once this many latencies were observed
+MIN_LATENCY_SAMPLES = 20
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How a call site retries and hedges its LLM requests.
+
+    A hedged request sends a second, identical request when the first one is slower than
+    hedge_percentile of the model's recent latencies, and uses whichever answers first.
+    """
+
+    max_retries: int = 3
+    # the n-th retry waits a random time in [0, min(backoff_max, backoff_base * 2^n)]
+    backoff_base: float = 1.0
+    backoff_max: float = 30.0
+    # give up instead of waiting when the API asks us to come back later than this
+    max_retry_after: float = 60.0
+    hedge: bool = False
+    hedge_percentile: float = 95.0
+    hedge_min_delay: float = 2.0
+
+
+DEFAULT_POLICY = RetryPolicy()
+# for short requests on the critical path, where a stuck request costs more than a duplicate
+HEDGED_POLICY = RetryPolicy(hedge=True)
+NO_RETRY_POLICY = RetryPolicy(max_retries=0)
+POLICIES = {
+    "default": DEFAULT_POLICY,
+    "hedged": HEDGED_POLICY,
+    "no_retry": NO_RETRY_POLICY,
+}
+
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+
+def parse_retry_policies(spec: Optional[str]) -> Dict[str, RetryPolicy]:
+    """Parses "call_site=policy,...", e.g. "if=hedged,reviewer=no_retry", with the policies of POLICIES."""
+    policies = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        call_site, _, name = item.partition("=")
+        if name.strip() not in POLICIES:
+            logging.error(
+                f"Invalid retry policy `{item}`, expected call_site={'|'.join(POLICIES)}"
+            )
+            continue
+        policies[call_site.strip()] = POLICIES[name.strip()]
+    return policies
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parses a Retry-After header, given either in seconds or as an HTTP date."""
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def retry_after_of(err: Exception) -> Optional[float]:
+    headers = getattr(err, "headers", None)
+    if not headers:
+        return None
+    milliseconds = headers.get("retry-after-ms")
+    if milliseconds:
+        try:
+            return float(milliseconds) / 1000
+        except ValueError:
+            pass
+    return parse_retry_after(headers.get("retry-after"))
+
+
+def is_retryable(err: Exception) -> bool:
+    """Whether the request failed for a reason that may go away, as opposed to a bad request."""
+    # imported here, they are slow to import and only needed once a request failed
+    import aiohttp
+    import openai
+
+    if isinstance(
+        err,
+        (
+            openai.error.RateLimitError,
+            openai.error.ServiceUnavailableError,
+            openai.error.APIConnectionError,
+            openai.error.Timeout,
+            openai.error.TryAgain,
+        ),
+    ):
+        return True
+    if isinstance(err, openai.error.OpenAIError):
+        status = getattr(err, "http_status", None)
+        if status is None:
+            return isinstance(err, openai.error.APIError)
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    return isinstance(
+        err, (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError, TimeoutError)
+    )
+
+
+def backoff_delay(
+    policy: RetryPolicy, attempt: int, retry_after: Optional[float] = None
+) -> float:
+    if retry_after is not None:
+        # honor the API, with a little jitter so waiting callers don't retry in lockstep
+        return retry_after + random.uniform(0, policy.backoff_base)
+    return random.uniform(
+        0, min(policy.backoff_max, policy.backoff_base * (2**attempt))
+    )
+
+
+class LatencyTracker:
+    """Recent latencies of one model."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < MIN_LATENCY_SAMPLES:
+                return None
+            latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        return latencies[index]
+
+    def hedge_delay(self, policy: RetryPolicy) -> Optional[float]:
+        if not policy.hedge:
+            return None
+        latency = self.percentile(policy.hedge_percentile)
+        if latency is None:
+            return None
+        return max(policy.hedge_min_delay, latency)
+
+
+def _retry_delay(policy: RetryPolicy, attempt: int, err: Exception) -> float:
+    """Returns how long to wait before retrying, raises err if it shouldn't be retried."""
+    if attempt >= policy.max_retries or not is_retryable(err):
+        raise err
+    retry_after = retry_after_of(err)
+    if retry_after is not None and retry_after > policy.max_retry_after:
+        raise err
+    delay = backoff_delay(policy, attempt, retry_after)
+    logging.warning(
+        f"LLM request failed ({type(err).__name__}: {err}), retrying in {delay:.1f}s"
+    )
+    return delay
+
+
+def _hedged(send: Callable[[], T], delay: Optional[float]) -> T:
+    if delay is None:
+        return send()
+
+    primary = _hedge_executor.submit(contextvars.copy_context().run, send)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+
+    logging.info(f"LLM request slower than {delay:.1f}s, sending a hedged request")
+    hedge = _hedge_executor.submit(contextvars.copy_context().run, send)
+    done, pending = wait([primary, hedge], return_when=FIRST_COMPLETED)
+    first = done.pop()
+    if first.exception() is None or not pending:
+        return first.result()
+    # the first one failed, the other may still succeed
+    return pending.pop().result()
+
+
+async def _ahedged(send: Callable[[], Awaitable[T]], delay: Optional[float]) -> T:
+    if delay is None:
+        return await send()
+
+    primary = asyncio.ensure_future(send())
+    done, _ = await asyncio.wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+
+    logging.info(f"LLM request slower than {delay:.1f}s, sending a hedged request")
+    hedge = asyncio.ensure_future(send())
+    done, pending = await asyncio.wait(
+        [primary, hedge], return_when=asyncio.FIRST_COMPLETED
+    )
+    first = done.pop()
+    if first.exception() is None or not pending:
+        for task in pending:
+            task.cancel()
+        return first.result()
+    return await pending.pop()
+
+
+def call(
+    send: Callable[[], T],
+    policy: RetryPolicy = DEFAULT_POLICY,
+    latency: Optional[LatencyTracker] = None,
+) -> T:
+    """Sends a request with retries and, if the policy asks for it, hedging."""
+    for attempt in range(policy.max_retries + 1):
+        delay = latency.hedge_delay(policy) if latency is not None else None
+        try:
+            return _hedged(send, delay)
+        except Exception as err:
+            time.sleep(_retry_delay(policy, attempt, err))
+    raise AssertionError("unreachable")
+
+
+async def acall(
+    send: Callable[[], Awaitable[T]],
+    policy: RetryPolicy = DEFAULT_POLICY,
+    latency: Optional[LatencyTracker] = None,
+) -> T:
+    for attempt in range(policy.max_retries + 1):
+        delay = latency.hedge_delay(policy) if latency is not None else None
+        try:
+            return await _ahedged(send, delay)
+        except Exception as err:
+            await asyncio.sleep(_retry_delay(policy, attempt, err))
+    raise AssertionError("unreachable")
@@ -8,6 +8,7 @@ import yaml
 from jarvis.smartgpt import gpt
 from jarvis.smartgpt import utils
 from jarvis.smartgpt import preprompts
+from jarvis.smartgpt import usage
 
 
 REVIEW_REPEATED_COUNT = 1
@@ -37,7 +38,8 @@ class Reviewer(ABC):
         )
         messages.append({"role": "user", "content": review_content})
 
-        review_response = gpt.send_messages(messages, self.model)
+        with usage.call_site("reviewer"):
+            review_response = gpt.send_messages(messages, self.model)
         messages.append({"role": "assistant", "content": review_response})
 
         review_response = utils.strip_yaml(review_response)
@@ -77,13 +79,16 @@ class SimulationReviewer(Reviewer):
         )
         messages.append({"role": "user", "content": review_content})
 
-        response = gpt.send_messages(messages, self.model)
+        # each round samples a new review, its responses are never cached
+        with usage.call_site("reviewer"):
+            response = gpt.send_messages(messages, self.model, cache=False)
         messages.append({"role": "assistant", "content": response})
 
         messages.append(
             {"role": "user", "content": preprompts.get("reviewer_simulation_output")}
         )
-        response = gpt.send_messages(messages, self.model)
+        with usage.call_site("reviewer"):
+            response = gpt.send_messages(messages, self.model, cache=False)
         messages.append({"role": "assistant", "content": response})
 
         if "CORRECT!" in response:
@@ -123,7 +128,8 @@ class SyntaxReviewer(Reviewer):
             }
         )
 
-        resp = gpt.send_messages(messages, self.model)
+        with usage.call_site("reviewer"):
+            resp = gpt.send_messages(messages, self.model)
         messages.append({"role": "assistant", "content": resp})
 
         if "CORRECT!" in resp:
@@ -0,0 +1,128 @@
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from jarvis.smartgpt.ratelimit import RateLimiter
+from jarvis.smartgpt.retry import LatencyTracker
+
+PREFERRED = "preferred"
+CHEAPEST = "cheapest"
+STRATEGIES = (PREFERRED, CHEAPEST)
+
+
+@dataclass(frozen=True)
+class RoutePolicy:
+    """How the requests of a call site pick their model.
+
+    The models are tried in order of preference, or from the cheapest with the cheapest
+    strategy. Models too small for the request are skipped, overloaded ones are tried last.
+    """
+
+    models: Tuple[str, ...]
+    strategy: str = PREFERRED
+    # tokens left for the response when checking whether a request fits a model
+    completion_tokens: int = 1024
+    # a model whose recent p95 latency is above this many seconds counts as overloaded
+    max_latency: Optional[float] = None
+
+
+# A model is overloaded when its requests would wait longer than this for the rate limit
+MAX_RATE_LIMIT_WAIT = 5.0
+
+
+class Router:
+    """Picks the models a request is sent to, the first one and then its fallbacks."""
+
+    def __init__(
+        self,
+        max_tokens: Callable[[str], int],
+        prompt_token_cost: Callable[[str], float],
+        rate_limiter: Callable[[str], Optional[RateLimiter]],
+        latency: Callable[[str], LatencyTracker],
+        is_available: Callable[[str], bool],
+        fallbacks: Optional[Dict[str, Tuple[str, ...]]] = None,
+        policies: Optional[Dict[str, RoutePolicy]] = None,
+    ):
+        self._max_tokens = max_tokens
+        self._prompt_token_cost = prompt_token_cost
+        self._rate_limiter = rate_limiter
+        self._latency = latency
+        self._is_available = is_available
+        self.fallbacks = fallbacks or {}
+        self.policies = policies or {}
+
+    def policy_for(self, model: str, call_site: str) -> RoutePolicy:
+        policy = self.policies.get(call_site)
+        if policy is not None:
+            return policy
+        # without a policy the call site's own model comes first, then its fallbacks
+        return RoutePolicy(models=(model,) + self.fallbacks.get(model, ()))
+
+    def is_overloaded(
+        self, model: str, prompt_tokens: int, policy: RoutePolicy
+    ) -> bool:
+        limiter = self._rate_limiter(model)
+        if (
+            limiter is not None
+            and limiter.expected_wait(prompt_tokens) > MAX_RATE_LIMIT_WAIT
+        ):
+            return True
+        if policy.max_latency is not None:
+            latency = self._latency(model).percentile(95)
+            if latency is not None and latency > policy.max_latency:
+                return True
+        return False
+
+    def route(self, model: str, call_site: str, prompt_tokens: int) -> List[str]:
+        policy = self.policy_for(model, call_site)
+        candidates = []
+        for name in policy.models:
+            if name not in candidates and self._is_available(name):
+                candidates.append(name)
+        if not candidates:
+            return [model]
+
+        fitting = [
+            name
+            for name in candidates
+            if prompt_tokens + policy.completion_tokens <= self._max_tokens(name)
+        ]
+        if not fitting:
+            # nothing fits, the largest model has the best chance
+            largest = max(candidates, key=self._max_tokens)
+            logging.warning(
+                f"Request of {prompt_tokens} tokens fits no model of {call_site}, using {largest}"
+            )
+            return [largest]
+
+        if policy.strategy == CHEAPEST:
+            fitting.sort(key=self._prompt_token_cost)
+
+        # sorting is stable, the healthy models keep their order ahead of the overloaded ones
+        return sorted(
+            fitting, key=lambda name: self.is_overloaded(name, prompt_tokens, policy)
+        )
+
+
+def parse_route_policies(spec: Optional[str]) -> Dict[str, RoutePolicy]:
+    """Parses "call_site=strategy:model|model,...", e.g. "reviewer=cheapest:gpt-3.5-turbo|gpt-4"."""
+    policies = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        try:
+            call_site, route = item.split("=", 1)
+            strategy, models = route.split(":", 1)
+            if strategy.strip() not in STRATEGIES:
+                raise ValueError(strategy)
+            policies[call_site.strip()] = RoutePolicy(
+                models=tuple(
+                    model.strip() for model in models.split("|") if model.strip()
+                ),
+                strategy=strategy.strip(),
+            )
+        except ValueError:
+            logging.error(
+                f"Invalid route policy `{item}`, expected call_site=preferred|cheapest:model|model"
+            )
+    return policies
@@ -0,0 +1,132 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+from jarvis.smartgpt import utils
+from jarvis.smartgpt import jvm
+
+# Replay RunPython scripts that opt in and already ran with the same code and the same inputs
+ENABLE_MEMOIZATION = utils.str_to_bool(os.getenv("JARVIS_MEMOIZE_RUN_PYTHON", "true"))
+
+MEMO_FILE = "run_python_memo.json"
+# Runs kept per script, e.g. one per loop iteration
+MAX_RUNS_PER_SCRIPT = 16
+
+
+def script_key(code: str, cmd_args: str, pkg_dependencies: List[str]) -> str:
+    data = json.dumps([code, cmd_args, sorted(pkg_dependencies or [])])
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def load_store(work_dir: str) -> Dict:
+    try:
+        with open(os.path.join(work_dir, jvm.kv_store_file), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_store(work_dir: str, store: Dict):
+    with open(os.path.join(work_dir, jvm.kv_store_file), "w") as f:
+        json.dump(store, f)
+
+
+def _load_memo(work_dir: str) -> Dict:
+    try:
+        with open(os.path.join(work_dir, MEMO_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_memo(work_dir: str, memo: Dict):
+    with open(os.path.join(work_dir, MEMO_FILE), "w") as f:
+        json.dump(memo, f)
+
+
+def load_trace(trace_file: str) -> Optional[Dict]:
+    """Reads the trace written by jvm.trace_reads, None if it can't be trusted."""
+    reads = {"keys": {}, "prefixes": {}, "all": None}
+    try:
+        with open(trace_file, "r") as f:
+            for line in f:
+                record = json.loads(line)
+                if "all" in record:
+                    reads["all"] = record["all"]
+                elif "prefix" in record:
+                    reads["prefixes"][record["prefix"]] = record["keys"]
+                else:
+                    reads["keys"][record["key"]] = record["value"]
+    except FileNotFoundError:
+        # the script never read the store
+        pass
+    except (OSError, ValueError) as err:
+        logging.warning(f"Failed to load the reads of a RunPython script: {err}")
+        return None
+    return reads
+
+
+def matches(reads: Dict, store: Dict) -> bool:
+    """Whether store holds the values the recorded run read."""
+    if reads["all"] is not None and any(
+        store.get(k) != v for k, v in reads["all"].items()
+    ):
+        return False
+    if any(store.get(k) != v for k, v in reads["keys"].items()):
+        return False
+    for prefix, keys in reads["prefixes"].items():
+        if sorted(k for k in store if k.startswith(prefix)) != keys:
+            return False
+    return True
+
+
+def lookup(work_dir: str, key: str) -> Optional[Dict]:
+    """Returns a recorded run of the script whose reads match the current store."""
+    runs = _load_memo(work_dir).get(key, [])
+    if not runs:
+        return None
+
+    store = load_store(work_dir)
+    for run in runs:
+        if matches(run["reads"], store):
+            return run
+    return None
+
+
+def record(
+    work_dir: str,
+    key: str,
+    trace_file: str,
+    before: Dict,
+    after: Dict,
+    stdout: str,
+    stderr: str,
+):
+    """Remembers a successful run: what it read, what it changed in the store and its output."""
+    reads = load_trace(trace_file)
+    if reads is None:
+        return
+
+    run = {
+        "reads": reads,
+        "writes": {k: v for k, v in after.items() if k not in before or before[k] != v},
+        "deletes": [k for k in before if k not in after],
+        "stdout": stdout,
+        "stderr": stderr,
+    }
+
+    memo = _load_memo(work_dir)
+    runs = [r for r in memo.get(key, []) if r["reads"] != reads]
+    memo[key] = (runs + [run])[-MAX_RUNS_PER_SCRIPT:]
+    _save_memo(work_dir, memo)
+
+
+def replay(work_dir: str, run: Dict):
+    """Applies the store changes of a recorded run."""
+    store = load_store(work_dir)
+    for k in run["deletes"]:
+        store.pop(k, None)
+    store.update(run["writes"])
+    save_store(work_dir, store)
@@ -0,0 +1,224 @@
+# Output capture and resource limits of RunPython scripts.
+#
+# Also imported by the zygote running under the scripts' virtual env, so it only uses the
+# standard library.
+import os
+import sys
+import json
+import time
+import select
+import signal
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except (ValueError, TypeError):
+        return default
+
+
+# Bytes of a script's stdout and stderr kept from the start and from the end of each stream
+OUTPUT_HEAD_BYTES = _env_int("JARVIS_RUN_PYTHON_OUTPUT_HEAD", 32 * 1024)
+OUTPUT_TAIL_BYTES = _env_int("JARVIS_RUN_PYTHON_OUTPUT_TAIL", 32 * 1024)
+
+# Resource limits of a script, 0 for no limit. Both the CPU and the memory limit are off by
+# default: multi-threaded code such as numpy and BLAS spends CPU time several times faster than
+# wall-clock time, and reserves address space far beyond what it uses.
+CPU_LIMIT_SECONDS = _env_int("JARVIS_RUN_PYTHON_CPU_LIMIT", 0)
+MEMORY_LIMIT_MB = _env_int("JARVIS_RUN_PYTHON_MEMORY_LIMIT_MB", 0)
+OPEN_FILES_LIMIT = _env_int("JARVIS_RUN_PYTHON_OPEN_FILES_LIMIT", 1024)
+
+READ_SIZE = 64 * 1024
+POLL_INTERVAL = 0.05
+
+
+class OutputBuffer:
+    """Keeps the head and the tail of a stream, however much is written to it."""
+
+    def __init__(
+        self, head_bytes: int = OUTPUT_HEAD_BYTES, tail_bytes: int = OUTPUT_TAIL_BYTES
+    ):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def write(self, data: bytes):
+        self.total += len(data)
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data and self.tail_bytes > 0:
+            self.tail += data
+            if len(self.tail) > self.tail_bytes:
+                del self.tail[: len(self.tail) - self.tail_bytes]
+
+    @property
+    def truncated(self) -> int:
+        return self.total - len(self.head) - len(self.tail)
+
+    def text(self) -> str:
+        head = self.head.decode("utf-8", errors="replace")
+        tail = self.tail.decode("utf-8", errors="replace")
+        if self.truncated:
+            return f"{head}\n... [{self.truncated} bytes truncated] ...\n{tail}"
+        return head + tail
+
+
+def limits_for(timeout: float) -> Dict[str, int]:
+    return {
+        "cpu_seconds": CPU_LIMIT_SECONDS,
+        "memory_mb": MEMORY_LIMIT_MB,
+        "open_files": OPEN_FILES_LIMIT,
+    }
+
+
+def limit_error(exit_code: int, limits: Optional[Dict[str, int]]) -> Optional[str]:
+    """Explains an exit caused by a resource limit, which the script itself can't report."""
+    sigxcpu = getattr(signal, "SIGXCPU", None)
+    if (
+        sigxcpu is not None
+        and exit_code == -sigxcpu
+        and limits
+        and limits.get("cpu_seconds")
+    ):
+        return (
+            f"CPU limit exceeded: the script used more than {limits['cpu_seconds']} seconds of CPU time "
+            "(JARVIS_RUN_PYTHON_CPU_LIMIT)"
+        )
+    return None
+
+
+def _lower_limit(kind, value: int):
+    soft, hard = resource.getrlimit(kind)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    if soft == resource.RLIM_INFINITY or value < soft:
+        resource.setrlimit(kind, (value, hard))
+
+
+def apply_limits(limits: Optional[Dict[str, int]]):
+    """Lowers the resource limits of the current process, run in the script's process before it starts."""
+    if resource is None or not limits:
+        return
+
+    if limits.get("cpu_seconds"):
+        _lower_limit(resource.RLIMIT_CPU, limits["cpu_seconds"])
+    if limits.get("memory_mb"):
+        _lower_limit(resource.RLIMIT_AS, limits["memory_mb"] * 1024 * 1024)
+    if limits.get("open_files"):
+        _lower_limit(resource.RLIMIT_NOFILE, limits["open_files"])
+
+
+def limited_command(
+    python: str, args: List[str], limits: Optional[Dict[str, int]]
+) -> List[str]:
+    """The command running python with args under limits.
+
+    The limits are applied by this module, run as a script, before it execs python: unlike a
+    preexec_fn, this is safe in a process running threads, such as the gRPC server.
+    """
+    if resource is None or not limits:
+        return [python] + args
+    return [python, os.path.abspath(__file__), json.dumps(limits)] + args
+
+
+def usage_of(rusage) -> Dict[str, float]:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = (
+        rusage.ru_maxrss / 1024 / 1024
+        if sys.platform == "darwin"
+        else rusage.ru_maxrss / 1024
+    )
+    return {
+        "cpu_seconds": round(rusage.ru_utime + rusage.ru_stime, 3),
+        "max_rss_mb": round(max_rss, 1),
+    }
+
+
+def collect(
+    pid: int, stdout_fd: int, stderr_fd: int, timeout: float
+) -> Tuple[int, OutputBuffer, OutputBuffer, bool, Dict]:
+    """Streams the output of child pid into bounded buffers until it exits or times out.
+
+    Returns (exit_code, stdout, stderr, timed_out, usage). The child is reaped, but the
+    file descriptors are left to the caller to close.
+    """
+    buffers = {stdout_fd: OutputBuffer(), stderr_fd: OutputBuffer()}
+    open_fds = set(buffers)
+    deadline = time.monotonic() + timeout
+    timed_out = False
+    status = rusage = None
+    delay = 0.001
+
+    while True:
+        if status is None:
+            waited_pid, status, rusage = os.wait4(pid, os.WNOHANG)
+            if waited_pid == 0:
+                status = None
+
+        remaining = deadline - time.monotonic()
+        if status is None and remaining <= 0:
+            os.kill(pid, signal.SIGKILL)
+            _, status, rusage = os.wait4(pid, 0)
+            timed_out = True
+
+        if status is not None:
+            # the script exited, take what is left in the pipes without waiting for
+            # processes it started that may still hold them open
+            _drain(open_fds, buffers)
+            break
+
+        if not open_fds:
+            # the pipes are closed, the script is about to exit
+            time.sleep(min(delay, max(remaining, 0)))
+            delay = min(delay * 2, POLL_INTERVAL)
+            continue
+
+        ready, _, _ = select.select(
+            list(open_fds), [], [], min(POLL_INTERVAL, max(remaining, 0))
+        )
+        for fd in ready:
+            _read(fd, open_fds, buffers)
+
+    exit_code = 1 if timed_out else os.waitstatus_to_exitcode(status)
+    return (
+        exit_code,
+        buffers[stdout_fd],
+        buffers[stderr_fd],
+        timed_out,
+        usage_of(rusage),
+    )
+
+
+def _read(fd: int, open_fds: set, buffers: Dict[int, OutputBuffer]):
+    data = os.read(fd, READ_SIZE)
+    if data:
+        buffers[fd].write(data)
+    else:
+        open_fds.discard(fd)
+
+
+def _drain(open_fds: set, buffers: Dict[int, OutputBuffer]):
+    # bounded, a process left behind by the script could keep writing forever
+    deadline = time.monotonic() + POLL_INTERVAL
+    while open_fds and time.monotonic() < deadline:
+        ready, _, _ = select.select(list(open_fds), [], [], 0)
+        if not ready:
+            return
+        for fd in ready:
+            _read(fd, open_fds, buffers)
+
+
+if __name__ == "__main__":
+    # python sandbox.py <limits> <args...>: runs python with args under the JSON limits
+    apply_limits(json.loads(sys.argv[1]))
+    os.execv(sys.executable, [sys.executable] + sys.argv[2:])
@@ -0,0 +1,282 @@
+import os
+import re
+import math
+import time
+import random
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Type
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from jarvis.smartgpt.retry import parse_retry_after
+
+# Which backend WebSearch uses: "google" or "local"
+SEARCH_PROVIDER = os.getenv("JARVIS_SEARCH_PROVIDER", "google")
+# Directory of documents indexed by the local provider
+SEARCH_INDEX_DIR = os.getenv("JARVIS_SEARCH_INDEX_DIR", "search_index")
+
+GOOGLE_SEARCH_URL = "https://www.googleapis.com/customsearch/v1"
+
+# (connect, read) timeouts of a single search request, in seconds
+REQUEST_TIMEOUT = (5, 15)
+MAX_RETRIES = 3
+# exponential backoff: the n-th retry waits a random time in [0, min(BACKOFF_MAX, BACKOFF_BASE * 2^n)]
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 20.0
+# give up instead of waiting when the provider asks us to come back later than this
+MAX_RETRY_AFTER = 60.0
+
+try:
+    # concurrent requests allowed by the provider's quota
+    SEARCH_CONCURRENCY = int(os.getenv("JARVIS_SEARCH_CONCURRENCY", "4"))
+except (ValueError, TypeError):
+    SEARCH_CONCURRENCY = 4
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# BM25 parameters of the local provider
+BM25_K1 = 1.5
+BM25_B = 0.75
+INDEXED_SUFFIXES = {".txt", ".md", ".html", ".htm"}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    if retry_after is not None:
+        # honor the provider, with a little jitter so waiting callers don't retry in lockstep
+        return retry_after + random.uniform(0, BACKOFF_BASE)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2**attempt)))
+
+
+class SearchProvider(ABC):
+    """A search backend returning the links of the documents matching a query."""
+
+    name = ""
+
+    @abstractmethod
+    def search(self, query: str, num: int = 3) -> List[str]:
+        pass
+
+    async def asearch(self, query: str, num: int = 3) -> List[str]:
+        return await asyncio.to_thread(self.search, query, num)
+
+    async def asearch_many(
+        self, queries: List[str], num: int = 3
+    ) -> List[Optional[List[str]]]:
+        """Runs the queries concurrently, a failed query gets None instead of its links."""
+
+        async def run(query):
+            try:
+                return await self.asearch(query, num)
+            except Exception as err:
+                logging.error(f"Search for `{query}` failed: {err}")
+                return None
+
+        return list(await asyncio.gather(*(run(query) for query in queries)))
+
+    def search_many(
+        self, queries: List[str], num: int = 3
+    ) -> List[Optional[List[str]]]:
+        return asyncio.run(self.asearch_many(queries, num))
+
+
+class GoogleSearchProvider(SearchProvider):
+    """Google Custom Search client sharing pooled connections between threads.
+
+    The quota semaphore bounds the requests in flight across sync and async callers,
+    and the async API waits for backoffs without holding a thread.
+    """
+
+    name = "google"
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        engine_id: Optional[str] = None,
+        max_retries: int = MAX_RETRIES,
+        timeout=REQUEST_TIMEOUT,
+        max_concurrency: int = SEARCH_CONCURRENCY,
+    ):
+        self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        self.engine_id = engine_id or os.getenv("GOOGLE_SEARCH_ENGINE_ID")
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.max_concurrency = max(1, max_concurrency)
+
+        self._quota = threading.BoundedSemaphore(self.max_concurrency)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.max_concurrency, pool_maxsize=self.max_concurrency
+        )
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def close(self):
+        self._session.close()
+
+    def _params(self, query: str, num: int) -> dict:
+        return {
+            "q": query,
+            "num": num,
+            "key": self.api_key,
+            "cx": self.engine_id,
+        }
+
+    def _attempt(self, query: str, num: int):
+        """Sends one request, returns (links, None) on success or (None, delay) when it should be retried."""
+        try:
+            with self._quota:
+                response = self._session.get(
+                    GOOGLE_SEARCH_URL,
+                    params=self._params(query, num),
+                    timeout=self.timeout,
+                )
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+        ) as err:
+            logging.warning(f"Search for `{query}` failed: {err}")
+            return None, None
+
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None and retry_after > MAX_RETRY_AFTER:
+                raise RuntimeError(
+                    f"Search provider asked to retry after {retry_after:.0f} seconds"
+                )
+            logging.warning(
+                f"Search for `{query}` returned HTTP {response.status_code}, retrying"
+            )
+            return None, retry_after
+
+        response.raise_for_status()
+        items = response.json().get("items") or []
+        return [item["link"] for item in items], None
+
+    def search(self, query: str, num: int = 3) -> List[str]:
+        """Returns the links found for query, an empty list if there are none."""
+        for attempt in range(self.max_retries + 1):
+            links, retry_after = self._attempt(query, num)
+            if links is not None:
+                return links
+            if attempt < self.max_retries:
+                time.sleep(backoff_delay(attempt, retry_after))
+
+        raise RuntimeError(
+            f"Search for `{query}` failed after {self.max_retries} retries"
+        )
+
+    async def asearch(self, query: str, num: int = 3) -> List[str]:
+        for attempt in range(self.max_retries + 1):
+            links, retry_after = await asyncio.to_thread(self._attempt, query, num)
+            if links is not None:
+                return links
+            if attempt < self.max_retries:
+                await asyncio.sleep(backoff_delay(attempt, retry_after))
+
+        raise RuntimeError(
+            f"Search for `{query}` failed after {self.max_retries} retries"
+        )
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+class LocalIndexProvider(SearchProvider):
+    """Offline provider ranking the documents of a directory with BM25.
+
+    Results are file:// links, so FetchWebContent can read them like any other page.
+    """
+
+    name = "local"
+
+    def __init__(self, index_dir: str = SEARCH_INDEX_DIR):
+        self.index_dir = Path(index_dir).absolute()
+        self.links: List[str] = []
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, List[tuple]] = defaultdict(list)
+        self.total_length = 0
+        self.avg_doc_length = 0.0
+        self.build()
+
+    @staticmethod
+    def read_document(path: Path) -> str:
+        text = path.read_text(encoding="utf-8", errors="ignore")
+        if path.suffix in (".html", ".htm"):
+            from jarvis.smartgpt import extractor
+
+            text = extractor.extract_text(text, use_pool=False)
+        return text
+
+    def add_document(self, link: str, text: str):
+        doc_id = len(self.links)
+        term_freqs = Counter(tokenize(text))
+        for term, freq in term_freqs.items():
+            self.postings[term].append((doc_id, freq))
+        self.links.append(link)
+        self.doc_lengths.append(sum(term_freqs.values()))
+        self.total_length += self.doc_lengths[-1]
+        self.avg_doc_length = self.total_length / len(self.doc_lengths)
+
+    def build(self):
+        if not self.index_dir.is_dir():
+            logging.warning(f"Search index directory {self.index_dir} does not exist")
+            return
+
+        for path in sorted(self.index_dir.rglob("*")):
+            if path.is_file() and path.suffix.lower() in INDEXED_SUFFIXES:
+                self.add_document(path.as_uri(), self.read_document(path))
+        logging.info(f"Indexed {len(self.links)} documents from {self.index_dir}")
+
+    def score(self, query: str) -> Dict[int, float]:
+        scores = defaultdict(float)
+        doc_count = len(self.links)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(
+                1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for doc_id, freq in postings:
+                norm = (
+                    1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / self.avg_doc_length
+                )
+                scores[doc_id] += idf * freq * (BM25_K1 + 1) / (freq + BM25_K1 * norm)
+        return scores
+
+    def search(self, query: str, num: int = 3) -> List[str]:
+        scores = self.score(query)
+        ranked = sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+        return [self.links[doc_id] for doc_id in ranked[:num]]
+
+
+SEARCH_PROVIDERS: Dict[str, Type[SearchProvider]] = {
+    cls.name: cls for cls in [GoogleSearchProvider, LocalIndexProvider]
+}
+
+
+def get_provider() -> SearchProvider:
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            if SEARCH_PROVIDER not in SEARCH_PROVIDERS:
+                raise ValueError(f"Unknown search provider: {SEARCH_PROVIDER}")
+            _provider = SEARCH_PROVIDERS[SEARCH_PROVIDER]()
+        return _provider
+
+
+def set_provider(provider: Optional[SearchProvider]):
+    """Replaces the provider used by WebSearch, e.g. with a LocalIndexProvider in load tests."""
+    global _provider
+    with _provider_lock:
+        _provider = provider
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces identical calls in flight: the first caller runs, the others share its result.
+
+    Nothing is cached, a call made after the first one returned runs again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._acalls: Dict[tuple, asyncio.Future] = {}
+        self.calls = 0
+        self.saved_calls = 0
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        return self.do_shared(key, fn)[0]
+
+    def do_shared(self, key: str, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """Like do, also returns whether the result was shared by another caller's call."""
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.saved_calls += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        return (await self.ado_shared(key, fn))[0]
+
+    async def ado_shared(
+        self, key: str, fn: Callable[[], Awaitable[T]]
+    ) -> Tuple[T, bool]:
+        loop = asyncio.get_running_loop()
+        # futures belong to a loop, so calls are only coalesced within one loop
+        loop_key = (id(loop), key)
+        with self._lock:
+            self.calls += 1
+            future = self._acalls.get(loop_key)
+            leader = future is None
+            if leader:
+                future = self._acalls[loop_key] = loop.create_future()
+            else:
+                self.saved_calls += 1
+
+        if not leader:
+            # a cancelled follower must not cancel the leader's call
+            return await asyncio.shield(future), True
+
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as err:
+            future.set_exception(err)
+            # followers get the error, don't report it as never retrieved
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                del self._acalls[loop_key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "saved_calls": self.saved_calls,
+                "in_flight": len(self._calls) + len(self._acalls),
+            }
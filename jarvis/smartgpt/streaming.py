@@ -0,0 +1,205 @@
+import json
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional
+
+import yaml
+
+# Receives the partial output of the code running in its context, as (kind, text)
+_listener: contextvars.ContextVar[
+    Optional[Callable[[str, str], None]]
+] = contextvars.ContextVar("jarvis_partial_output", default=None)
+
+
+@contextmanager
+def listen(callback: Callable[[str, str], None]):
+    """Sends the partial output published in this context to callback, e.g. to a gRPC stream."""
+    token = _listener.set(callback)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+
+def is_listened() -> bool:
+    return _listener.get() is not None
+
+
+def publish(kind: str, text: str):
+    """Publishes partial output, such as a stored kv or a translated instruction."""
+    callback = _listener.get()
+    if callback is None:
+        return
+    try:
+        callback(kind, text)
+    except Exception as err:
+        # a listener failing must not fail the task
+        logging.warning(f"Failed to publish {kind} partial output: {err}")
+
+
+class JSONArrayStream:
+    """Parses the items of an array of a JSON object while its text is still streaming in.
+
+    Fed the chunks of '{"kvs": [{"key": "a", "value": 1}, {"key": ...', it returns each
+    object or array item of "kvs" as soon as its closing bracket arrives. Text around the
+    object, such as a ```json fence, is skipped.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        # the key the next value at depth 1 belongs to
+        self._value_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Returns the items completed by chunk."""
+        self._text += chunk
+        items = []
+        text = self._text
+        while self._pos < len(text) and not self.done:
+            char = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start : self._pos + 1]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif char == ":" and self._depth == 1:
+                self._value_key = self._decode(self._last_string)
+            elif char == "," and self._depth == 1:
+                self._value_key = None
+            elif char in "{[":
+                self._depth += 1
+                if self._array_depth is None:
+                    if char == "[" and self._depth == 2 and self._value_key == self.key:
+                        self._array_depth = self._depth
+                elif self._depth == self._array_depth + 1:
+                    self._item_start = self._pos
+            elif char in "}]":
+                if self._array_depth is not None:
+                    if (
+                        self._depth == self._array_depth + 1
+                        and self._item_start is not None
+                    ):
+                        item = self._decode(text[self._item_start : self._pos + 1])
+                        if item is not None:
+                            items.append(item)
+                        self._item_start = None
+                    elif self._depth == self._array_depth:
+                        self.done = True
+                self._depth = max(0, self._depth - 1)
+            self._pos += 1
+        return items
+
+    @staticmethod
+    def _decode(text: Optional[str]) -> Any:
+        if text is None:
+            return None
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as err:
+            logging.debug(f"Skipping malformed streamed JSON `{text}`: {err}")
+            return None
+
+
+class YAMLListStream:
+    """Parses the items of a top-level list of a YAML document while its text is streaming in.
+
+    Fed the chunks of "instructions:\\n  - seq: 1\\n    type: ...", it returns each item of
+    "instructions" once the next item or the next top-level key starts, and the last one
+    from finish().
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._partial_line = ""
+        self._in_list = False
+        self._item_indent: Optional[int] = None
+        self._item_lines: List[str] = []
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Returns the items completed by chunk."""
+        lines = (self._partial_line + chunk).split("\n")
+        self._partial_line = lines.pop()
+        items = []
+        for line in lines:
+            item = self._line(line)
+            if item is not None:
+                items.append(item)
+        return items
+
+    def finish(self) -> List[Any]:
+        """Returns the item still open at the end of the text."""
+        items = self.feed("\n")
+        if self._item_lines:
+            item = self._parse()
+            if item is not None:
+                items.append(item)
+        self._in_list = False
+        return items
+
+    def _line(self, line: str) -> Any:
+        stripped = line.strip()
+        indent = len(line) - len(line.lstrip())
+        # a fence inside an item, such as in a block of code, is part of it
+        fence = stripped.startswith("```") and (
+            self._item_indent is None or indent <= self._item_indent
+        )
+        if (
+            not stripped
+            or stripped.startswith("#")
+            or (stripped.startswith("```") and not fence)
+        ):
+            if self._item_lines:
+                self._item_lines.append(line)
+            return None
+
+        if not self._in_list:
+            if indent == 0 and stripped == f"{self.key}:":
+                self._in_list = True
+            return None
+
+        if self._item_indent is None and stripped.startswith("- "):
+            self._item_indent = indent
+        if (
+            fence
+            or self._item_indent is None
+            or indent < self._item_indent
+            or (indent == 0 and not stripped.startswith("- "))
+        ):
+            # the list ended
+            item = self._parse() if self._item_lines else None
+            self._in_list = False
+            return item
+
+        if indent == self._item_indent and stripped.startswith("- "):
+            item = self._parse() if self._item_lines else None
+            self._item_lines = [line]
+            return item
+        self._item_lines.append(line)
+        return None
+
+    def _parse(self) -> Any:
+        text = "\n".join(line[self._item_indent :] for line in self._item_lines)
+        self._item_lines = []
+        try:
+            parsed = yaml.safe_load(text)
+        except yaml.YAMLError as err:
+            logging.debug(f"Skipping malformed streamed YAML `{text}`: {err}")
+            return None
+        return parsed[0] if isinstance(parsed, list) and parsed else None
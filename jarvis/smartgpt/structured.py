@@ -0,0 +1,54 @@
+import json
+from typing import Any, Dict, List, Optional
+
+FUNCTION_NAME = "fill_output"
+
+# JSON schemas of the values, by the type suffix of their keys, such as "summary.seq3.str"
+_VALUE_SCHEMAS = {
+    "str": {"type": "string"},
+    "int": {"type": "integer"},
+    "float": {"type": "number"},
+    "bool": {"type": "boolean"},
+    "list": {"type": "array"},
+    "dict": {"type": "object"},
+}
+
+
+def output_function(output_format: str) -> Optional[Dict[str, Any]]:
+    """The function whose arguments are the values of the kvs of output_format.
+
+    An output format of {"kvs": [{"key": "summary.seq3.str", "value": "<to_fill>"}]} is
+    filled by calling fill_output(summary.seq3.str: string): the model is held to the keys
+    and types of the kvs and leaves out their JSON boilerplate. None if output_format has no kvs.
+    """
+    try:
+        keys = [kv["key"] for kv in json.loads(output_format)["kvs"]]
+    except (ValueError, TypeError, KeyError):
+        return None
+    if not keys or not all(isinstance(key, str) and key for key in keys):
+        return None
+
+    properties = {
+        key: dict(_VALUE_SCHEMAS.get(key.rsplit(".", 1)[-1], {})) for key in keys
+    }
+    return {
+        "name": FUNCTION_NAME,
+        "description": "Fills in the values of the output format.",
+        "parameters": {
+            "type": "object",
+            "properties": properties,
+            "required": list(properties),
+        },
+    }
+
+
+def to_kvs(arguments: Any) -> List[Dict[str, Any]]:
+    """The kvs of the arguments of fill_output.
+
+    Models without function calling answer in the output format itself, its kvs are kept.
+    """
+    if not isinstance(arguments, dict):
+        raise ValueError(f"Expected the values of the kvs, got: {arguments}")
+    if isinstance(arguments.get("kvs"), list):
+        return arguments["kvs"]
+    return [{"key": key, "value": value} for key, value in arguments.items()]
@@ -0,0 +1,132 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+try:
+    # token counts kept, keyed by a hash of the text
+    TOKEN_CACHE_SIZE = int(os.getenv("JARVIS_TOKEN_CACHE_SIZE", "4096"))
+except (ValueError, TypeError):
+    TOKEN_CACHE_SIZE = 4096
+
+# threads used by tiktoken to encode a batch of texts
+ENCODE_THREADS = 8
+
+TOKENS_PER_MESSAGE = 4
+
+
+class Tokenizer:
+    """Counts and truncates tokens, remembering the counts of recently seen texts.
+
+    The encoding is loaded on first use. Special tokens such as <|endoftext|> in a text
+    are encoded as plain text instead of raising.
+    """
+
+    def __init__(self, model: str, cache_size: int = TOKEN_CACHE_SIZE):
+        self.model = model
+        self.cache_size = cache_size
+        self._encoding = None
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            import tiktoken
+
+            self._encoding = tiktoken.encoding_for_model(self.model)
+        return self._encoding
+
+    def encode(self, text: str) -> List[int]:
+        return self.encoding.encode(text, disallowed_special=())
+
+    def decode(self, tokens: List[int]) -> str:
+        return self.encoding.decode(tokens)
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def _cached(self, key: bytes) -> Optional[int]:
+        with self._lock:
+            count = self._counts.get(key)
+            if count is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._counts.move_to_end(key)
+            return count
+
+    def _remember(self, key: bytes, count: int):
+        with self._lock:
+            self._counts[key] = count
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        key = self._key(text)
+        count = self._cached(key)
+        if count is None:
+            count = len(self.encode(text))
+            self._remember(key, count)
+        return count
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        """Counts the tokens of the texts, encoding the ones not in the cache as one threaded batch."""
+        keys = [self._key(text) for text in texts]
+        counts = [self._cached(key) for key in keys]
+        missing = [i for i, count in enumerate(counts) if count is None]
+        if missing:
+            encoded = self.encoding.encode_batch(
+                [texts[i] for i in missing],
+                num_threads=ENCODE_THREADS,
+                disallowed_special=(),
+            )
+            for i, tokens in zip(missing, encoded):
+                counts[i] = len(tokens)
+                self._remember(keys[i], counts[i])
+        return counts
+
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        counts = self.count_many([message["content"] for message in messages])
+        return sum(counts) + len(messages) * TOKENS_PER_MESSAGE
+
+    def truncate(self, text: str, max_tokens: int) -> Tuple[str, int]:
+        """Truncates text to max_tokens, returns the text and its token count, encoding it at most once."""
+        if upper_bound(text) <= max_tokens:
+            return text, self.count(text)
+
+        key = self._key(text)
+        count = self._cached(key)
+        if count is not None and count <= max_tokens:
+            return text, count
+
+        tokens = self.encode(text)
+        self._remember(key, len(tokens))
+        if len(tokens) <= max_tokens:
+            return text, len(tokens)
+        return self.decode(tokens[:max_tokens]), max_tokens
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "cached": len(self._counts),
+            }
+
+
+def upper_bound(text: str) -> int:
+    """Cheap upper bound of the token count: a token is never shorter than a byte."""
+    return len(text.encode("utf-8"))
+
+
+def estimate(text: str) -> int:
+    """Cheap estimate of the token count, about four characters per token in English."""
+    return (len(text) + 3) // 4
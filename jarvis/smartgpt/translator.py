@@ -7,6 +7,8 @@ from jarvis.smartgpt import utils
 from jarvis.smartgpt import fewshot
 from jarvis.smartgpt import preprompts
 from jarvis.smartgpt import reviewer
+from jarvis.smartgpt import streaming
+from jarvis.smartgpt import usage
 from jarvis.utils.tracer import conditional_chan_traceable
 
 REVIEWER_CLASSES = [
@@ -80,7 +82,8 @@ class Translator:
             }
         )
 
-        resp = gpt.send_messages(messages, self.model)
+        with usage.call_site("translator"):
+            resp = gpt.send_messages(messages, self.model)
         messages.append({"role": "asssistant", "content": resp})
         self._trace_reviser_gen(task_info, messages)
 
@@ -104,7 +107,8 @@ class Translator:
         messages = self.build_system_prompt(few_shot_data=reference_example)
         messages.append({"role": "user", "content": user_prompt})
 
-        resp = gpt.send_messages(messages, self.model)
+        with usage.call_site("translator"):
+            resp = self._send_draft(messages)
         messages.append({"role": "asssistant", "content": resp})
         self._trace_llm_gen(task_info, messages)
 
@@ -123,6 +127,29 @@ class Translator:
             task_info, resp, review_results, review_comments
         )
 
+    def _send_draft(self, messages: List[Dict[str, str]]) -> str:
+        """Sends the translation request, publishing each drafted instruction as it arrives
+        when the caller listens for partial output. The reviewers may still revise them.
+        """
+        if not (gpt.ENABLE_STREAMING and streaming.is_listened()):
+            return gpt.send_messages(messages, self.model)
+
+        instructions = streaming.YAMLListStream("instructions")
+
+        def publish(drafted):
+            for instruction in drafted:
+                streaming.publish(
+                    "draft_instruction", json.dumps(instruction, ensure_ascii=False)
+                )
+
+        resp = gpt.stream_messages(
+            messages,
+            self.model,
+            lambda piece: publish(instructions.feed(piece)),
+        )
+        publish(instructions.finish())
+        return resp
+
     def _trace_llm_gen(self, task_info, messages):
         with open(f"review_{task_info.get('task_num', 0)}.txt", "w") as f:
             for msg in messages:
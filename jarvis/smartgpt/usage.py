@@ -0,0 +1,168 @@
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+UNKNOWN_CALL_SITE = "other"
+
+# The stage making the LLM requests of the current thread or task, e.g. "planner"
+_call_site: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "llm_call_site", default=None
+)
+# The summaries collecting the LLM requests of the current thread or task, innermost last
+_summaries: contextvars.ContextVar[Tuple["UsageSummary", ...]] = contextvars.ContextVar(
+    "llm_usage_summaries", default=()
+)
+
+
+@dataclass
+class LLMCall:
+    """One LLM request, costs are in dollars."""
+
+    model: str
+    call_site: str
+    prompt_tokens: int
+    completion_tokens: int
+    latency: float
+    cost: float
+    cached: bool = False
+    # shared the response of an identical request in flight, see singleflight
+    coalesced: bool = False
+
+
+class UsageSummary:
+    """Requests, tokens, latency and cost of LLM calls, in total and per call site and model."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = self._empty()
+        self.call_sites: Dict[str, Dict[str, float]] = {}
+        self.models: Dict[str, Dict[str, float]] = {}
+
+    @staticmethod
+    def _empty() -> Dict[str, float]:
+        return {
+            "requests": 0,
+            "cached_requests": 0,
+            "coalesced_requests": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "latency": 0.0,
+            "cost": 0.0,
+        }
+
+    @staticmethod
+    def _add(counters: Dict[str, float], call: LLMCall):
+        counters["requests"] += 1
+        counters["cached_requests"] += int(call.cached)
+        counters["coalesced_requests"] += int(call.coalesced)
+        counters["prompt_tokens"] += call.prompt_tokens
+        counters["completion_tokens"] += call.completion_tokens
+        counters["latency"] += call.latency
+        counters["cost"] += call.cost
+
+    def add(self, call: LLMCall):
+        with self._lock:
+            self._add(self.total, call)
+            self._add(self.call_sites.setdefault(call.call_site, self._empty()), call)
+            self._add(self.models.setdefault(call.model, self._empty()), call)
+
+    @staticmethod
+    def _rounded(counters: Dict[str, float]) -> Dict[str, float]:
+        return {
+            **counters,
+            "latency": round(counters["latency"], 3),
+            "cost": round(counters["cost"], 6),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._rounded(self.total),
+                "call_sites": {
+                    name: self._rounded(c) for name, c in self.call_sites.items()
+                },
+                "models": {name: self._rounded(c) for name, c in self.models.items()},
+            }
+
+    def report(self) -> str:
+        usage = self.to_dict()
+        lines = [
+            f"LLM usage: {usage['requests']} requests ({usage['cached_requests']} cached, "
+            f"{usage['coalesced_requests']} coalesced), "
+            f"{usage['prompt_tokens']} prompt + {usage['completion_tokens']} completion tokens, "
+            f"{usage['latency']:.1f}s, ${usage['cost']:.4f}"
+        ]
+        for name, site in sorted(
+            usage["call_sites"].items(), key=lambda item: -item[1]["cost"]
+        ):
+            lines.append(
+                f"  {name}: {site['requests']} requests, "
+                f"{site['prompt_tokens'] + site['completion_tokens']} tokens, "
+                f"{site['latency']:.1f}s, ${site['cost']:.4f}"
+            )
+        return "\n".join(lines)
+
+
+# every LLM request made by this process, e.g. by the gRPC server across all its executors
+SERVER_USAGE = UsageSummary()
+
+
+@contextmanager
+def call_site(name: str) -> Iterator[None]:
+    """Attributes the LLM requests made in the block to the call site name."""
+    token = _call_site.set(name)
+    try:
+        yield
+    finally:
+        _call_site.reset(token)
+
+
+@contextmanager
+def default_call_site(name: str) -> Iterator[None]:
+    """Like call_site, unless an enclosing block already set one.
+
+    E.g. TextCompletion requests made to evaluate an If condition are attributed to If.
+    """
+    if _call_site.get() is not None:
+        yield
+        return
+    with call_site(name):
+        yield
+
+
+def current_call_site() -> str:
+    return _call_site.get() or UNKNOWN_CALL_SITE
+
+
+@contextmanager
+def track(summary: Optional[UsageSummary] = None) -> Iterator[UsageSummary]:
+    """Collects the LLM requests made in the block into summary, a new one by default.
+
+    Blocks can be nested, a request is added to the summaries of all enclosing blocks.
+    """
+    summary = summary if summary is not None else UsageSummary()
+    token = _summaries.set(_summaries.get() + (summary,))
+    try:
+        yield summary
+    finally:
+        _summaries.reset(token)
+
+
+def record(call: LLMCall):
+    SERVER_USAGE.add(call)
+    for summary in _summaries.get():
+        summary.add(call)
+
+
+def cost_of(
+    prompt_tokens: int,
+    completion_tokens: int,
+    prompt_token_cost: float,
+    completion_token_cost: float,
+) -> float:
+    """Dollars of a request, the costs are per thousand tokens."""
+    return (
+        prompt_tokens * prompt_token_cost + completion_tokens * completion_token_cost
+    ) / 1000
@@ -1,4 +1,5 @@
 # Description: Utility functions
+import json
 import re
 from pathlib import Path
 
@@ -42,6 +43,111 @@ def strip_json(text):
     return text
 
 
+# the quotes a string opened by each quote is closed by
+_CLOSING_QUOTES = {'"': '"', "'": "'", "“": '”"', "‘": "’'"}
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def _drop_trailing(out, chars):
+    while out and out[-1].isspace():
+        out.pop()
+    while out and out[-1] in chars:
+        out.pop()
+
+
+def repair_json(text):
+    """Repairs the usual mistakes of JSON written by an LLM, returns None if there is no JSON.
+
+    Skips the text around the first object or array and fixes single and curly quotes,
+    newlines in strings, double quotes in single-quoted strings, Python literals, trailing commas,
+    and the strings and brackets left open by a truncated response.
+    """
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        return None
+
+    out = []
+    closers = []
+    closing_quotes = None
+    escape = False
+    index = min(starts)
+    while index < len(text):
+        char = text[index]
+        index += 1
+        if closing_quotes is not None:
+            if escape:
+                escape = False
+                # \' isn't a JSON escape
+                if char == "'":
+                    out[-1] = "'"
+                    continue
+            elif char == "\\":
+                escape = True
+            elif char in closing_quotes:
+                closing_quotes = None
+                char = '"'
+            elif char == '"':
+                char = '\\"'
+            elif char == "\n":
+                char = "\\n"
+            out.append(char)
+            continue
+
+        if char in _CLOSING_QUOTES:
+            closing_quotes = _CLOSING_QUOTES[char]
+            out.append('"')
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+            out.append(char)
+        elif char in "}]":
+            _drop_trailing(out, ",")
+            if closers:
+                closers.pop()
+            out.append(char)
+            if not closers:
+                # the text after the JSON is dropped
+                break
+        else:
+            word = next(
+                (word for word in _PYTHON_LITERALS if text.startswith(word, index - 1)),
+                None,
+            )
+            if word is not None:
+                out.append(_PYTHON_LITERALS[word])
+                index += len(word) - 1
+            else:
+                out.append(char)
+
+    if closing_quotes is not None:
+        if escape:
+            out.pop()
+        out.append('"')
+    if closers:
+        _drop_trailing(out, ",")
+        if out and out[-1] == ":":
+            out.append("null")
+    while closers:
+        out.append(closers.pop())
+    return "".join(out)
+
+
+def loads_json(text):
+    """json.loads for JSON written by an LLM, repairing it if it's malformed.
+
+    Raises the json.JSONDecodeError of text if it can't be repaired.
+    """
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as err:
+        repaired = repair_json(strip_json(text))
+        if repaired is None:
+            raise
+        try:
+            return json.loads(repaired, strict=False)
+        except json.JSONDecodeError:
+            raise err from None
+
+
 def sys_eval(text):
     return eval(text)
 
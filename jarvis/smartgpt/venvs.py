@@ -0,0 +1,489 @@
+import os
+import re
+import sys
+import glob
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import subprocess
+import venv
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+from jarvis.smartgpt import utils
+
+# Share virtual envs between executors, keyed by the dependency set of the executor's scripts
+SHARED_VENVS = utils.str_to_bool(os.getenv("JARVIS_SHARED_VENVS", "true"))
+VENV_STORE_DIR = os.path.expanduser(
+    os.getenv("JARVIS_VENV_STORE", "~/.cache/jarvis/venvs")
+)
+WHEEL_CACHE_DIR = os.path.expanduser(
+    os.getenv("JARVIS_WHEEL_CACHE", "~/.cache/jarvis/wheels")
+)
+try:
+    # least recently used envs beyond this number are removed
+    MAX_SHARED_VENVS = int(os.getenv("JARVIS_MAX_SHARED_VENVS", "16"))
+except (ValueError, TypeError):
+    MAX_SHARED_VENVS = 16
+
+# dependencies already used by the scripts of an executor, kept in its work dir
+DEPENDENCIES_FILE = "venv_dependencies.json"
+
+# Lists the importable modules and the installed distributions of the interpreter running it
+_INVENTORY_CODE = (
+    "import json, pkgutil, importlib.metadata as md; "
+    "print(json.dumps({"
+    "'modules': sorted({m.name for m in pkgutil.iter_modules()}), "
+    "'packages': sorted({d.metadata['Name'] for d in md.distributions() if d.metadata['Name']})"
+    "}))"
+)
+INVENTORY_FILE = "jarvis_inventory.json"
+
+_inventories: Dict[str, dict] = {}
+_inventory_lock = threading.Lock()
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def normalize_name(name: str) -> str:
+    """Normalizes a distribution name as pip does (PEP 503)."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def has_version_specifier(requirement: str) -> bool:
+    return bool(re.search(r"[<>=!~\[;@ ]", requirement.strip()))
+
+
+def python_path(venv_bin: str) -> str:
+    if os.name == "nt":
+        return os.path.join(venv_bin, "Scripts", "python.exe")
+    return os.path.join(venv_bin, "python")
+
+
+def site_packages_dir(venv_bin: str) -> Optional[str]:
+    venv_dir = os.path.dirname(venv_bin)
+    candidates = glob.glob(os.path.join(venv_dir, "lib", "python*", "site-packages"))
+    candidates += glob.glob(os.path.join(venv_dir, "Lib", "site-packages"))
+    return candidates[0] if candidates else None
+
+
+def site_packages_mtime(venv_bin: str) -> Optional[int]:
+    site_packages = site_packages_dir(venv_bin)
+    if site_packages is None:
+        return None
+    return os.stat(site_packages).st_mtime_ns
+
+
+def _inventory_file(venv_bin: str) -> str:
+    return os.path.join(os.path.dirname(venv_bin), INVENTORY_FILE)
+
+
+def _load_inventory(venv_bin: str) -> Optional[dict]:
+    inventory = _inventories.get(venv_bin)
+    if inventory is not None:
+        return inventory
+
+    try:
+        with open(_inventory_file(venv_bin), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _scan_inventory(venv_bin: str) -> dict:
+    output = subprocess.check_output(
+        [python_path(venv_bin), "-c", _INVENTORY_CODE]
+    ).decode("utf-8")
+    scanned = json.loads(output)
+    inventory = {
+        "mtime": site_packages_mtime(venv_bin),
+        "modules": scanned["modules"],
+        "packages": [normalize_name(name) for name in scanned["packages"]],
+    }
+
+    with open(_inventory_file(venv_bin), "w") as f:
+        json.dump(inventory, f)
+    return inventory
+
+
+def get_inventory(venv_bin: str) -> dict:
+    """Returns the modules and packages of the venv, rescanning it only if site-packages changed."""
+    with _inventory_lock:
+        inventory = _load_inventory(venv_bin)
+        if inventory is None or inventory.get("mtime") != site_packages_mtime(venv_bin):
+            logging.debug(f"Scanning the packages installed in {venv_bin}")
+            inventory = _scan_inventory(venv_bin)
+        _inventories[venv_bin] = inventory
+        return inventory
+
+
+def invalidate_inventory(venv_bin: str):
+    """Forgets the inventory of the venv, call it after installing or removing packages."""
+    with _inventory_lock:
+        _inventories.pop(venv_bin, None)
+        try:
+            os.remove(_inventory_file(venv_bin))
+        except FileNotFoundError:
+            pass
+
+
+def missing_packages(venv_bin: str, dependencies: List[str]) -> List[str]:
+    """Returns the dependencies that are neither installed nor importable in the venv."""
+    if not dependencies:
+        return []
+
+    inventory = get_inventory(venv_bin)
+    modules = set(inventory["modules"])
+    packages = set(inventory["packages"])
+
+    missing = []
+    for dependency in dependencies:
+        if has_version_specifier(dependency):
+            # let pip decide whether the installed version satisfies it
+            missing.append(dependency)
+        elif dependency not in modules and normalize_name(dependency) not in packages:
+            missing.append(dependency)
+    return missing
+
+
+def install_packages(venv_bin: str, dependencies: List[str]):
+    """Installs the dependencies missing from the venv, without changing the env's dependency set."""
+    packages = missing_packages(venv_bin, dependencies)
+    if not packages:
+        return
+
+    logging.info(f"Installing the following packages: {packages}")
+    try:
+        subprocess.check_call([os.path.join(venv_bin, "pip"), "install"] + packages)
+    finally:
+        invalidate_inventory(venv_bin)
+
+
+def is_standard_module(name: str) -> bool:
+    return name.split(".")[0] in sys.stdlib_module_names
+
+
+def resolve_dependencies(dependencies: List[str]) -> List[str]:
+    """Returns the sorted, de-duplicated third party requirements of dependencies."""
+    resolved = {
+        dependency.strip()
+        for dependency in dependencies
+        if dependency
+        and dependency.strip()
+        and not is_standard_module(dependency.strip())
+    }
+    return sorted(resolved, key=normalize_name)
+
+
+def dependency_key(dependencies: List[str]) -> str:
+    requirements = "\n".join(
+        normalize_name(dep) for dep in resolve_dependencies(dependencies)
+    )
+    return hashlib.sha256(requirements.encode("utf-8")).hexdigest()[:16]
+
+
+def _open_lease(root: str, key: str):
+    return open(os.path.join(root, f"{key}.lease"), "a")
+
+
+def lease_env(venv_bin: str):
+    """Leases the shared env of venv_bin until the returned file is closed.
+
+    The env isn't garbage collected by any process meanwhile. Returns None if venv_bin
+    isn't a shared env.
+    """
+    env_dir = os.path.dirname(os.path.abspath(venv_bin))
+    if not os.path.exists(os.path.join(env_dir, VenvStore.META_FILE)):
+        return None
+    lease_file = _open_lease(os.path.dirname(env_dir), os.path.basename(env_dir))
+    if fcntl is not None:
+        fcntl.flock(lease_file, fcntl.LOCK_SH)
+    return lease_file
+
+
+def load_dependencies(work_dir: str) -> List[str]:
+    try:
+        with open(os.path.join(work_dir, DEPENDENCIES_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def save_dependencies(work_dir: str, dependencies: List[str]):
+    with open(os.path.join(work_dir, DEPENDENCIES_FILE), "w") as f:
+        json.dump(dependencies, f)
+
+
+class VenvStore:
+    """Virtual envs shared by all executors, one per set of dependencies.
+
+    A new env doesn't copy the packages of the largest existing env whose dependencies
+    are a subset of its own: that env's site-packages is layered under the new one with
+    a .pth file, so only the missing packages are installed, in one pip call fed from a
+    local wheel cache. Envs are garbage collected least recently used first, except the
+    ones leased by a running script or a warm worker pool of any process.
+    """
+
+    META_FILE = "jarvis_venv.json"
+    READY_FILE = ".ready"
+    LAYERS_FILE = "jarvis_layers.pth"
+
+    def __init__(
+        self,
+        root: str = VENV_STORE_DIR,
+        wheel_cache: str = WHEEL_CACHE_DIR,
+        max_envs: int = MAX_SHARED_VENVS,
+    ):
+        self.root = os.path.abspath(root)
+        self.wheel_cache = os.path.abspath(wheel_cache)
+        self.max_envs = max_envs
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        os.makedirs(self.root, exist_ok=True)
+        os.makedirs(self.wheel_cache, exist_ok=True)
+
+    def env_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _lock_file(self, name: str = ".lock"):
+        lock_file = open(os.path.join(self.root, name), "w")
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _hold(self, key: str):
+        lease_file = _open_lease(self.root, key)
+        if fcntl is not None:
+            fcntl.flock(lease_file, fcntl.LOCK_SH)
+        return lease_file
+
+    @contextmanager
+    def lease(self, dependencies: List[str]) -> Iterator[str]:
+        """Like ensure, the env isn't garbage collected by any process until the block exits."""
+        # taken before ensure, so the env can't be removed between the two
+        lease_file = self._hold(dependency_key(resolve_dependencies(dependencies)))
+        try:
+            yield self.ensure(dependencies)
+        finally:
+            lease_file.close()
+
+    def _claim_unused(self, key: str):
+        """Returns the lease file of key locked exclusively, None if the env is leased."""
+        lease_file = _open_lease(self.root, key)
+        if fcntl is None:
+            return lease_file
+        try:
+            fcntl.flock(lease_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lease_file.close()
+            return None
+        return lease_file
+
+    def _is_ready(self, env_dir: str) -> bool:
+        return os.path.exists(os.path.join(env_dir, self.READY_FILE))
+
+    def _load_meta(self, env_dir: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(env_dir, self.META_FILE), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _ready_envs(self) -> Dict[str, dict]:
+        envs = {}
+        for key in os.listdir(self.root):
+            env_dir = self.env_dir(key)
+            if os.path.isdir(env_dir) and self._is_ready(env_dir):
+                meta = self._load_meta(env_dir)
+                if meta is not None:
+                    envs[key] = meta
+        return envs
+
+    def _touch(self, env_dir: str):
+        os.utime(os.path.join(env_dir, self.READY_FILE))
+
+    def _best_base(self, dependencies: List[str]) -> Optional[str]:
+        wanted = {normalize_name(dep) for dep in dependencies}
+        best_key, best_size = None, -1
+        for key, meta in self._ready_envs().items():
+            deps = {normalize_name(dep) for dep in meta["dependencies"]}
+            if deps <= wanted and len(deps) > best_size:
+                best_key, best_size = key, len(deps)
+        return best_key
+
+    def _install(self, venv_bin: str, dependencies: List[str]):
+        pip = os.path.join(venv_bin, "pip")
+        try:
+            # fill the wheel cache, wheels already in it are reused instead of downloaded or built
+            subprocess.check_call(
+                [
+                    pip,
+                    "wheel",
+                    "--quiet",
+                    "--wheel-dir",
+                    self.wheel_cache,
+                    "--find-links",
+                    self.wheel_cache,
+                ]
+                + dependencies
+            )
+            subprocess.check_call(
+                [pip, "install", "--no-index", "--find-links", self.wheel_cache]
+                + dependencies
+            )
+        except subprocess.CalledProcessError as err:
+            logging.warning(
+                f"Installing from the wheel cache failed ({err}), falling back to the index"
+            )
+            subprocess.check_call(
+                [pip, "install", "--find-links", self.wheel_cache] + dependencies
+            )
+
+    def _create(self, key: str, dependencies: List[str]) -> str:
+        env_dir = self.env_dir(key)
+        shutil.rmtree(env_dir, ignore_errors=True)
+        venv.EnvBuilder(with_pip=True).create(env_dir)
+        venv_bin = os.path.join(env_dir, "bin")
+
+        # the base is leased until the env is ready, from then on it is kept as a base
+        base_key, base_lease = self._lease_base(dependencies)
+        try:
+            layers = []
+            if base_key is not None:
+                base_dir = self.env_dir(base_key)
+                base_meta = self._load_meta(base_dir)
+                layers = [site_packages_dir(os.path.join(base_dir, "bin"))] + base_meta[
+                    "layers"
+                ]
+                with open(
+                    os.path.join(site_packages_dir(venv_bin), self.LAYERS_FILE), "w"
+                ) as f:
+                    f.write("\n".join(layers) + "\n")
+                logging.info(f"Layering venv {key} on {base_key}")
+
+            meta = {"dependencies": dependencies, "layers": layers, "base": base_key}
+            with open(os.path.join(env_dir, self.META_FILE), "w") as f:
+                json.dump(meta, f)
+
+            if dependencies:
+                logging.info(f"Installing {dependencies} into shared venv {key}")
+                try:
+                    self._install(venv_bin, dependencies)
+                except Exception:
+                    shutil.rmtree(env_dir, ignore_errors=True)
+                    raise
+                invalidate_inventory(venv_bin)
+
+            with open(os.path.join(env_dir, self.READY_FILE), "w") as f:
+                f.write(str(time.time()))
+        finally:
+            if base_lease is not None:
+                base_lease.close()
+        return venv_bin
+
+    def _lease_base(self, dependencies: List[str]):
+        """Returns the best base env of dependencies and its lease, (None, None) if there is none."""
+        base_key = self._best_base(dependencies)
+        if base_key is None:
+            return None, None
+        lease_file = self._hold(base_key)
+        if not self._is_ready(self.env_dir(base_key)):
+            # garbage collected meanwhile
+            lease_file.close()
+            return None, None
+        return base_key, lease_file
+
+    def ensure(self, dependencies: List[str]) -> str:
+        """Returns the bin directory of the env providing dependencies, creating it if needed."""
+        dependencies = resolve_dependencies(dependencies)
+        key = dependency_key(dependencies)
+        env_dir = self.env_dir(key)
+
+        # only the executors needing the same env wait while it is built
+        with self._key_lock(key):
+            if self._is_ready(env_dir):
+                self._touch(env_dir)
+                return os.path.join(env_dir, "bin")
+
+            lock_file = self._lock_file(f"{key}.lock")
+            try:
+                if self._is_ready(env_dir):
+                    venv_bin = os.path.join(env_dir, "bin")
+                else:
+                    venv_bin = self._create(key, dependencies)
+                self._touch(env_dir)
+            finally:
+                lock_file.close()
+
+        with self._lock:
+            lock_file = self._lock_file()
+            try:
+                self.collect_garbage(keep=key)
+            finally:
+                lock_file.close()
+        return venv_bin
+
+    def collect_garbage(self, keep: Optional[str] = None):
+        """Removes the least recently used envs beyond max_envs.
+
+        Never removes an env layered under another one or leased, by a script or a worker pool.
+        """
+        envs = self._ready_envs()
+        if len(envs) <= self.max_envs:
+            return
+
+        def last_used(key):
+            return os.path.getmtime(os.path.join(self.env_dir(key), self.READY_FILE))
+
+        for key in sorted(envs, key=last_used):
+            if len(envs) <= self.max_envs:
+                break
+            if key == keep or any(meta.get("base") == key for meta in envs.values()):
+                continue
+            lease_file = self._claim_unused(key)
+            if lease_file is None:
+                continue
+            try:
+                logging.info(f"Removing unused shared venv {key}")
+                shutil.rmtree(self.env_dir(key), ignore_errors=True)
+            finally:
+                lease_file.close()
+            envs.pop(key)
+
+
+def get_store() -> VenvStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = VenvStore()
+        return _store
+
+
+def ensure_work_dir_env(work_dir: str, dependencies: List[str]) -> str:
+    """Returns the shared env of an executor, which provides everything its scripts ever asked for."""
+    wanted = resolve_dependencies(load_dependencies(work_dir) + list(dependencies))
+    venv_bin = get_store().ensure(wanted)
+    save_dependencies(work_dir, wanted)
+    return venv_bin
+
+
+@contextmanager
+def lease_work_dir_env(work_dir: str, dependencies: List[str]) -> Iterator[str]:
+    """Like ensure_work_dir_env, leasing the env until the block exits."""
+    wanted = resolve_dependencies(load_dependencies(work_dir) + list(dependencies))
+    with get_store().lease(wanted) as venv_bin:
+        save_dependencies(work_dir, wanted)
+        yield venv_bin
@@ -0,0 +1,117 @@
+# Zygote process of the RunPython worker pool.
+#
+# Started once with the virtual env's python, it imports the jvm module and then waits for
+# requests on stdin, one JSON object per line. Every request is run in a process forked
+# from the zygote, so scripts skip interpreter startup and imports but stay isolated from
+# each other. The response is written as one JSON line to the original stdout.
+#
+# The output of a script is streamed through pipes into bounded buffers, and the script
+# runs under the resource limits given in its request.
+import sys
+
+# Don't let the modules next to this file shadow the ones imported by scripts
+sys.path.pop(0)
+
+import os
+import json
+import runpy
+import importlib
+import traceback
+
+
+def exit_code_of(err: SystemExit) -> int:
+    if err.code is None:
+        return 0
+    if isinstance(err.code, int):
+        return err.code
+    print(err.code, file=sys.stderr)
+    return 1
+
+
+def run_child(request, stdout_fd, stderr_fd):
+    code = 1
+    try:
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        sys.stdin = open(os.devnull, "r")
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        sandbox.apply_limits(request.get("limits"))
+
+        script = request["script"]
+        os.chdir(request["cwd"])
+        sys.argv = [script] + request.get("args", [])
+        sys.path[0:0] = [os.path.dirname(script)]
+        # packages may have been installed into the venv since the zygote started
+        importlib.invalidate_caches()
+
+        try:
+            runpy.run_path(script, run_name="__main__")
+            code = 0
+        except SystemExit as err:
+            code = exit_code_of(err)
+        except BaseException as err:
+            # report the traceback from the script's frames on, like the interpreter would
+            tb = err.__traceback__
+            while tb is not None and tb.tb_frame.f_code.co_filename != script:
+                tb = tb.tb_next
+            traceback.print_exception(type(err), err, tb)
+            code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def handle(request):
+    stdout_read, stdout_write = os.pipe()
+    stderr_read, stderr_write = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        os.close(stdout_read)
+        os.close(stderr_read)
+        run_child(request, stdout_write, stderr_write)
+
+    os.close(stdout_write)
+    os.close(stderr_write)
+    try:
+        exit_code, stdout, stderr, timed_out, usage = sandbox.collect(
+            pid, stdout_read, stderr_read, request["timeout"]
+        )
+    finally:
+        os.close(stdout_read)
+        os.close(stderr_read)
+    return {
+        "exit_code": exit_code,
+        "stdout": stdout.text(),
+        "stderr": stderr.text(),
+        "timed_out": timed_out,
+        "usage": usage,
+    }
+
+
+def main():
+    global sandbox
+    sys.path.append(sys.argv[1])
+    from jarvis.smartgpt import jvm  # noqa: F401, imported once for all the scripts
+    from jarvis.smartgpt import sandbox
+
+    # keep the protocol channel private, anything else printed to stdout goes nowhere
+    channel = os.fdopen(os.dup(1), "w")
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        response = handle(json.loads(line))
+        channel.write(json.dumps(response) + "\n")
+        channel.flush()
+
+
+if __name__ == "__main__":
+    main()
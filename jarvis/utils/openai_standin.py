@@ -0,0 +1,390 @@
+"""A local stand-in of the OpenAI API, for running and load testing jarvis offline.
+
+It answers chat completions, function calls, completions and embeddings from a cassette
+recorded with JARVIS_LLM_BACKEND=record, streamed or not, with simulated latency and,
+optionally, injected overload errors.
+Point jarvis at it with OPENAI_API_BASE:
+
+    python -m jarvis.utils.openai_standin --cassette llm_cassette.jsonl --port 8089
+    OPENAI_API_BASE=http://127.0.0.1:8089/v1 python -m jarvis.server
+"""
+import json
+import time
+import random
+import hashlib
+import argparse
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from jarvis.smartgpt import cassette
+from jarvis.smartgpt import tokenizer
+
+EMBEDDING_DIMENSIONS = 1536
+
+
+class StandIn:
+    """Answers OpenAI API requests, the HTTP handler only parses and writes them."""
+
+    def __init__(
+        self,
+        tape: Optional[cassette.Cassette] = None,
+        default_response: Optional[str] = "OK",
+        latency: float = 0.0,
+        tokens_per_second: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.tape = tape
+        # answer of the requests missing from the cassette, None answers them with a 404
+        self.default_response = default_response
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.stats = {
+            "requests": 0,
+            "replayed": 0,
+            "defaulted": 0,
+            "missed": 0,
+            "overloaded": 0,
+        }
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _id(self) -> int:
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    def _overloaded(self) -> bool:
+        with self._lock:
+            return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def _answer(self, key: str) -> Tuple[Optional[str], float]:
+        if self.tape is not None:
+            try:
+                response, delay = self.tape.replay(key)
+                self._count("replayed")
+                return response, delay
+            except cassette.CassetteMissError:
+                pass
+        if self.default_response is None:
+            self._count("missed")
+            return None, 0.0
+        self._count("defaulted")
+        return self.default_response, 0.0
+
+    def _delay(self, recorded: float, completion_tokens: int) -> float:
+        delay = recorded + self.latency
+        if self.tokens_per_second > 0:
+            delay += completion_tokens / self.tokens_per_second
+        return delay
+
+    def handle(self, path: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """Returns the HTTP status and JSON body answering a POST to path."""
+        self._count("requests")
+        if self._overloaded():
+            self._count("overloaded")
+            return 429, {
+                "error": {
+                    "message": "Rate limit reached (stand-in)",
+                    "type": "requests",
+                    "code": None,
+                }
+            }
+
+        if path.endswith("/embeddings"):
+            return 200, self._embeddings(body)
+
+        model = body.get("model") or body.get("engine") or ""
+        temperature = body.get("temperature", 0.7)
+        chat = path.endswith("/chat/completions")
+        if chat:
+            request = [
+                (message["role"], message["content"])
+                for message in body.get("messages", [])
+            ]
+            # keyed like gpt.call_function, with the function after the messages
+            request += [
+                ("function_schema", json.dumps(function, sort_keys=True))
+                for function in body.get("functions") or []
+            ]
+            prompt_tokens = sum(tokenizer.estimate(content) for _, content in request)
+        else:
+            request = body.get("prompt", "")
+            if isinstance(request, list):
+                request = request[0] if request else ""
+            prompt_tokens = tokenizer.estimate(request)
+
+        text, recorded_delay = self._answer(
+            cassette.request_key(model, temperature, request)
+        )
+        if text is None:
+            return 404, {
+                "error": {
+                    "message": "Request not in the cassette",
+                    "type": "invalid_request_error",
+                    "code": None,
+                }
+            }
+
+        completion_tokens = tokenizer.estimate(text)
+        time.sleep(self._delay(recorded_delay, completion_tokens))
+
+        function_call = body.get("function_call") if chat else None
+        if isinstance(function_call, dict):
+            # a forced function call, answered with the text as its arguments
+            message = {
+                "role": "assistant",
+                "content": None,
+                "function_call": {"name": function_call["name"], "arguments": text},
+            }
+            choice = {"index": 0, "message": message, "finish_reason": "function_call"}
+            kind = "chat.completion"
+        elif chat:
+            choice = {
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }
+            kind = "chat.completion"
+        else:
+            choice = {
+                "index": 0,
+                "text": text,
+                "logprobs": None,
+                "finish_reason": "stop",
+            }
+            kind = "text_completion"
+        return 200, {
+            "id": f"standin-{self._id()}",
+            "object": kind,
+            "created": int(time.time()),
+            "model": model,
+            "choices": [choice],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @staticmethod
+    def stream_chunks(response: Dict[str, Any], size: int = 16) -> List[Dict[str, Any]]:
+        """Splits a completion into the chunks of a streamed response, sent as server-sent events."""
+        choice = response["choices"][0]
+        chat = response["object"] == "chat.completion"
+        text = choice["message"]["content"] if chat else choice["text"]
+        pieces = [text[index : index + size] for index in range(0, len(text), size)] + [
+            None
+        ]
+        chunks = []
+        for piece in pieces:
+            finish_reason = "stop" if piece is None else None
+            if chat:
+                delta = {} if piece is None else {"role": "assistant", "content": piece}
+                streamed = {"index": 0, "delta": delta, "finish_reason": finish_reason}
+            else:
+                streamed = {
+                    "index": 0,
+                    "text": piece or "",
+                    "logprobs": None,
+                    "finish_reason": finish_reason,
+                }
+            chunks.append(
+                {
+                    "id": response["id"],
+                    "object": "chat.completion.chunk" if chat else "text_completion",
+                    "created": response["created"],
+                    "model": response["model"],
+                    "choices": [streamed],
+                }
+            )
+        return chunks
+
+    def _embeddings(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = []
+        for index, text in enumerate(inputs):
+            # the same text gets the same vector, anything else a different one
+            seed = int.from_bytes(
+                hashlib.sha256(json.dumps(text).encode("utf-8")).digest()[:8], "big"
+            )
+            rng = random.Random(seed)
+            data.append(
+                {
+                    "object": "embedding",
+                    "index": index,
+                    "embedding": [
+                        rng.uniform(-1, 1) for _ in range(EMBEDDING_DIMENSIONS)
+                    ],
+                }
+            )
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", ""),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+
+def make_handler(standin: StandIn):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, payload: Dict[str, Any]):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_stream(self, payload: Dict[str, Any]):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for chunk in standin.stream_chunks(payload):
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError:
+                self._send(
+                    400,
+                    {
+                        "error": {
+                            "message": "Invalid JSON body",
+                            "type": "invalid_request_error",
+                        }
+                    },
+                )
+                return
+            # the deployment of an Azure style path stands for the model
+            if "/deployments/" in self.path and "model" not in body:
+                body["model"] = self.path.split("/deployments/", 1)[1].split("/", 1)[0]
+            status, payload = standin.handle(self.path.split("?", 1)[0], body)
+            if body.get("stream") and status == 200 and "choices" in payload:
+                self._send_stream(payload)
+            else:
+                self._send(status, payload)
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0].endswith("/models"):
+                self._send(200, {"object": "list", "data": []})
+            else:
+                self._send(
+                    404,
+                    {
+                        "error": {
+                            "message": "Not found",
+                            "type": "invalid_request_error",
+                        }
+                    },
+                )
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    return Handler
+
+
+def serve(
+    standin: StandIn, host: str = "127.0.0.1", port: int = 8089
+) -> ThreadingHTTPServer:
+    """Starts the stand-in in a background thread, shut it down with server.shutdown()."""
+    server = ThreadingHTTPServer((host, port), make_handler(standin))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Local stand-in of the OpenAI API")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument(
+        "--cassette",
+        type=str,
+        default=None,
+        help="Cassette recorded with JARVIS_LLM_BACKEND=record",
+    )
+    parser.add_argument(
+        "--default-response",
+        type=str,
+        default="OK",
+        help="Answer of requests missing from the cassette",
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Answer requests missing from the cassette with a 404",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds added to every response"
+    )
+    parser.add_argument(
+        "--latency-scale",
+        type=float,
+        default=1.0,
+        help="Scale of the recorded latencies",
+    )
+    parser.add_argument(
+        "--tokens-per-second",
+        type=float,
+        default=0.0,
+        help="Simulated generation speed, 0 for instant",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests answered with a 429",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    tape = (
+        cassette.Cassette(args.cassette, latency_scale=args.latency_scale, latency=0.0)
+        if args.cassette
+        else None
+    )
+    standin = StandIn(
+        tape,
+        default_response=None if args.strict else args.default_response,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(standin))
+    server.daemon_threads = True
+    logging.info(f"OpenAI stand-in listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info(f"Stand-in stats: {standin.stats}")
+
+
+if __name__ == "__main__":
+    run()
@@ -1,3 +1,6 @@
+import os
+import json
+import tempfile
 import unittest
 from unittest.mock import patch
 
@@ -7,6 +10,7 @@ from jarvis.smartgpt.actions import FetchWebContentAction
 from jarvis.smartgpt.actions import WebSearchAction
 from jarvis.smartgpt.actions import RunPythonAction
 from jarvis.smartgpt.actions import TextCompletionAction
+from jarvis.smartgpt import actions, search
 
 class TestFetchWebContentAction(unittest.TestCase):
     def setUp(self):
@@ -54,10 +58,88 @@ class TestFetchWebContentAction(unittest.TestCase):
         self.assertEqual(self.action.run(), expected_result)
         mock_get_html.assert_called_once()
 
+    @patch("jarvis.smartgpt.actions.save_validated_page")
+    @patch("jarvis.smartgpt.actions.get_validated_page")
+    @patch("jarvis.smartgpt.actions.requests.get")
+    @patch.object(FetchWebContentAction, "get_html")
+    def test_fetch_text_not_modified(
+        self, mock_get_html, mock_requests_get, mock_get_page, mock_save_page
+    ):
+        mock_get_page.return_value = {"etag": '"v1"', "text": "Hello World!"}
+        response = mock_requests_get.return_value.__enter__.return_value
+        response.status_code = 304
+        response.headers = {}
+
+        self.assertEqual(self.action.fetch_text(self.action.url), "Hello World!")
+        self.assertEqual(
+            mock_requests_get.call_args.kwargs["headers"], {"If-None-Match": '"v1"'}
+        )
+        mock_get_html.assert_not_called()
+        mock_save_page.assert_not_called()
+
+    @patch("jarvis.smartgpt.actions.save_validated_page")
+    @patch("jarvis.smartgpt.actions.get_validated_page", return_value=None)
+    @patch("jarvis.smartgpt.actions.requests.head")
+    @patch.object(
+        FetchWebContentAction,
+        "get_html",
+        return_value="<html><body><p>Hello World!</p></body></html>",
+    )
+    def test_fetch_text_records_validators(
+        self, mock_get_html, mock_requests_head, mock_get_page, mock_save_page
+    ):
+        mock_requests_head.return_value.headers = {
+            "ETag": '"v2"',
+            "Last-Modified": "Mon, 02 Oct 2023 08:00:00 GMT",
+        }
+        background = []
+
+        with patch(
+            "jarvis.smartgpt.actions._in_background",
+            side_effect=lambda *call: background.append(call),
+        ):
+            self.assertEqual(self.action.fetch_text(self.action.url), "Hello World!")
+        mock_get_html.assert_called_once()
+        # the validators are requested once the page is fetched, off the critical path
+        mock_requests_head.assert_not_called()
+
+        fn, *args = background[0]
+        fn(*args)
+        mock_save_page.assert_called_once_with(
+            self.action.url,
+            {"etag": '"v2"', "last_modified": "Mon, 02 Oct 2023 08:00:00 GMT"},
+            "Hello World!",
+            args[-1],
+        )
+
+    @patch("jarvis.smartgpt.actions.get_from_cache", return_value='{"kvs": []}')
+    @patch.object(FetchWebContentAction, "fetch_text", return_value="Hello World!")
+    def test_run_revalidates_instead_of_using_the_cache(
+        self, mock_fetch_text, mock_get_from_cache
+    ):
+        self.assertEqual(
+            json.loads(self.action.run())["kvs"][0]["value"], "Hello World!"
+        )
+        mock_fetch_text.assert_called_once()
+
+    def test_validated_pages_are_bounded(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, patch.dict(
+            actions._VALIDATED_PAGES, clear=True
+        ), patch.object(actions, "MAX_VALIDATED_PAGES", 2):
+            path = os.path.join(tmp_dir, "validated_pages.json")
+            for url in ("a", "b", "a", "c"):
+                actions.save_validated_page(url, {"etag": url}, url, path)
+            with open(path) as f:
+                self.assertEqual(list(json.load(f)), ["a", "c"])
+
 
 class TestWebSearchAction(unittest.TestCase):
     def setUp(self):
         self.action = WebSearchAction(1, "hacker news", "search_url.seq3.list")
+        search.set_provider(search.GoogleSearchProvider(api_key="key", engine_id="cx"))
+
+    def tearDown(self):
+        search.set_provider(None)
 
     def test_id(self):
         self.assertEqual(self.action.id(), 1)
@@ -68,16 +150,14 @@ class TestWebSearchAction(unittest.TestCase):
     def test_short_string(self):
         self.assertEqual(self.action.short_string(), "action_id: 1, Search online for `hacker news`.")
 
-    @patch('smartgpt.actions.requests.get')
+    @patch("jarvis.smartgpt.search.GoogleSearchProvider._attempt")
     @patch('smartgpt.actions.save_to_cache')
     @patch('smartgpt.actions.get_from_cache')
-    def test_run(self, mock_cache_get, mock_cache_save, mock_requests_get):
+    def test_run(self, mock_cache_get, mock_cache_save, mock_attempt):
         # assume that there is no cache for the query
         mock_cache_get.return_value = None
-        # assume that the http request was successful
-        mock_requests_get.return_value.status_code = 200
-        # assume that the request returns a json response
-        mock_requests_get.return_value.json.return_value = {"items": [{"link": "https://news.ycombinator.com/"}]}
+        # assume that the search request was successful and found one link
+        mock_attempt.return_value = (["https://news.ycombinator.com/"], None)
 
         result = self.action.run()
         expected_result = yaml.safe_dump({"kvs": [{"key": "search_url.seq3.list", "value": ["https://news.ycombinator.com/"]}]})
@@ -0,0 +1,153 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from langchain.schema.messages import AIMessage
+
+from jarvis.smartgpt import cassette, gpt
+from jarvis.smartgpt.cassette import Cassette, CassetteMissError
+from jarvis.utils import openai_standin
+
+FUNCTION = {
+    "name": "fill_output",
+    "parameters": {"type": "object", "properties": {"answer": {"type": "string"}}},
+}
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, prompt, retry_policy=None):
+        self.calls += 1
+        return f"answer {self.calls}"
+
+    def chat(self, messages, retry_policy=None):
+        return AIMessage(content=self.predict(messages[-1].content))
+
+    def call_function(self, messages, function, retry_policy=None):
+        return json.dumps({"answer": self.predict(messages[-1].content)})
+
+
+class TestCassette(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cassette.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_record_then_replay(self):
+        llm = FakeLLM()
+        recorder = gpt.CassetteLLM("gpt-4", Cassette(self.path), llm)
+        messages = gpt.to_chat_messages(
+            [{"role": "system", "content": "be brief"}], "hi"
+        )
+        self.assertEqual(recorder.predict("hello"), "answer 1")
+        self.assertEqual(recorder.predict("hello"), "answer 2")
+        self.assertEqual(recorder.chat(messages).content, "answer 3")
+
+        player = gpt.CassetteLLM("gpt-4", Cassette(self.path))
+        self.assertEqual(player.predict("hello"), "answer 1")
+        self.assertEqual(player.predict("hello"), "answer 2")
+        # the last response repeats once the recorded ones run out
+        self.assertEqual(player.predict("hello"), "answer 2")
+        self.assertEqual(asyncio.run(player.achat(messages)).content, "answer 3")
+        self.assertEqual(llm.calls, 3)
+
+        with self.assertRaises(CassetteMissError):
+            player.predict("never asked")
+
+    def test_function_calls_are_keyed_with_their_function(self):
+        messages = gpt.to_chat_messages([{"role": "user", "content": "fill"}])
+        recorder = gpt.CassetteLLM("gpt-4", Cassette(self.path), FakeLLM())
+        self.assertEqual(
+            recorder.call_function(messages, FUNCTION), '{"answer": "answer 1"}'
+        )
+
+        player = gpt.CassetteLLM("gpt-4", Cassette(self.path))
+        self.assertEqual(
+            player.call_function(messages, FUNCTION), '{"answer": "answer 1"}'
+        )
+        # the same messages without the function are another request
+        with self.assertRaises(CassetteMissError):
+            player.chat(messages)
+        with self.assertRaises(CassetteMissError):
+            player.call_function(messages, dict(FUNCTION, name="other"))
+
+    def test_simulated_latency(self):
+        Cassette(self.path).record("key", "gpt-4", "hi", "hello", latency=2.0)
+        tape = Cassette(self.path, latency_scale=0.5, latency=0.25)
+        self.assertEqual(tape.replay("key"), ("hello", 1.25))
+
+    def test_backend_replays_through_complete(self):
+        gpt.CassetteLLM("gpt-4", Cassette(self.path), FakeLLM()).predict("hello")
+        with patch.object(cassette, "LLM_BACKEND", "replay"), patch.object(
+            cassette, "get_cassette", return_value=Cassette(self.path)
+        ), patch.dict(gpt.OPEN_AI_MODELS_HUB, {"gpt-4": gpt._create_llm("gpt-4")}):
+            self.assertEqual(gpt.complete("hello", gpt.GPT_4, cache=False), "answer 1")
+
+
+class TestStandIn(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cassette.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def start(self, standin):
+        server = openai_standin.serve(standin, port=0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    def test_openai_client_replays_the_cassette(self):
+        messages = [
+            {"role": "system", "content": "be brief"},
+            {"role": "user", "content": "hi"},
+        ]
+        recorder = gpt.CassetteLLM("gpt-4", Cassette(self.path), FakeLLM())
+        recorder.chat(gpt.to_chat_messages(messages))
+
+        api_base = self.start(
+            openai_standin.StandIn(Cassette(self.path), default_response=None)
+        )
+        with patch.dict(os.environ, {"OPENAI_API_BASE": api_base}):
+            llm = gpt.BaseLLM("gpt-4")
+        self.assertEqual(llm.chat(gpt.to_chat_messages(messages)).content, "answer 1")
+
+    def test_openai_client_replays_a_function_call(self):
+        messages = gpt.to_chat_messages([{"role": "user", "content": "fill"}])
+        gpt.CassetteLLM("gpt-4", Cassette(self.path), FakeLLM()).call_function(
+            messages, FUNCTION
+        )
+
+        api_base = self.start(
+            openai_standin.StandIn(Cassette(self.path), default_response=None)
+        )
+        with patch.dict(os.environ, {"OPENAI_API_BASE": api_base}):
+            llm = gpt.BaseLLM("gpt-4")
+        self.assertEqual(
+            llm.call_function(messages, FUNCTION), '{"answer": "answer 1"}'
+        )
+
+    def test_overload_and_miss(self):
+        standin = openai_standin.StandIn(None, default_response=None, error_rate=1.0)
+        self.assertEqual(
+            standin.handle("/v1/chat/completions", {"messages": []})[0], 429
+        )
+        standin.error_rate = 0
+        self.assertEqual(
+            standin.handle("/v1/chat/completions", {"messages": []})[0], 404
+        )
+        standin.default_response = "OK"
+        status, body = standin.handle("/v1/completions", {"prompt": "hi"})
+        self.assertEqual((status, body["choices"][0]["text"]), (200, "OK"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+from unittest import mock
+
+from jarvis.smartgpt import compactor, extractor
+
+
+class TestCompactor(unittest.TestCase):
+    def test_compact_text_removes_repeated_lines(self):
+        text = "Accept all cookies\nFirst paragraph\n|\n|\nAccept all cookies\nSecond paragraph"
+        self.assertEqual(
+            compactor.compact_text(text),
+            "Accept all cookies\nFirst paragraph\n|\n|\nSecond paragraph",
+        )
+
+    def test_compact_text_collapses_link_lists(self):
+        links = [f"[Story {i}](https://example.com/{i})" for i in range(10)]
+        text = "\n".join(["Related"] + links + ["The end"])
+        lines = compactor.compact_text(text).splitlines()
+
+        self.assertEqual(lines[0], "Related")
+        self.assertEqual(lines[-1], "The end")
+        self.assertEqual(len(lines), 3)
+        self.assertIn("[Story 0](https://example.com/0) | [Story 1]", lines[1])
+        self.assertTrue(lines[1].endswith("(+2 more links)"))
+
+    def test_compact_text_keeps_short_link_runs(self):
+        text = "[a](https://a.com)\n[b](https://b.com)\nbody"
+        self.assertEqual(compactor.compact_text(text), text)
+
+    def test_compact_page_falls_back_to_full_text(self):
+        html = "<div><p>Too short to be an article.</p></div>"
+        result = compactor.compact_page(html, lambda h: h, len)
+        self.assertFalse(result.main_content_found)
+        self.assertEqual(result.text, "Too short to be an article.")
+        self.assertEqual(result.tokens_before, len(result.text))
+
+    def test_compact_page_parses_once(self):
+        paragraph = (
+            "<p>" + "A sentence of the article, long enough to count. " * 5 + "</p>"
+        )
+        html = (
+            '<html><body><nav><a href="https://example.com/home">Home</a></nav>'
+            f'<div class="article">{paragraph * 3}<a href="https://example.com/more">More</a> tail</div>'
+            "</body></html>"
+        )
+        extract = mock.Mock(
+            side_effect=AssertionError("the page should not be parsed again")
+        )
+        with mock.patch.object(
+            compactor.extractor, "parse_html", wraps=extractor.parse_html
+        ) as parse_html:
+            result = compactor.compact_page(html, extract, len)
+
+        parse_html.assert_called_once_with(html)
+        self.assertTrue(result.main_content_found)
+        self.assertIn("[More](https://example.com/more)", result.text)
+        self.assertIn("tail", result.text)
+        self.assertNotIn("Home", result.text)
+        self.assertGreater(result.tokens_before, result.tokens_after)
+
+    def test_compact_page_uses_extract_when_lxml_fails(self):
+        with mock.patch.object(compactor.extractor, "parse_html", return_value=None):
+            result = compactor.compact_page("<p>page</p>", lambda h: "page", len)
+        self.assertFalse(result.main_content_found)
+        self.assertEqual(result.text, "page")
+
+    def test_extract_main_content_of_xhtml(self):
+        paragraph = (
+            "<p>" + "A sentence of the article, long enough to count. " * 5 + "</p>"
+        )
+        html = f'<?xml version="1.0" encoding="utf-8"?>\n<html><body><div class="article">{paragraph * 3}</div></body></html>'
+        content = compactor.extract_main_content(html)
+        self.assertIsNotNone(content)
+        self.assertIn("A sentence of the article", content)
+
+
+if __name__ == "__main__":
+    unittest.main()
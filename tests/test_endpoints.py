@@ -0,0 +1,144 @@
+import unittest
+from collections import Counter
+from unittest.mock import patch
+
+from jarvis.smartgpt import gpt
+from jarvis.smartgpt.endpoints import (
+    Endpoint,
+    EndpointPool,
+    endpoints_for,
+    parse_endpoints,
+)
+from jarvis.smartgpt.ratelimit import RateLimit
+from jarvis.smartgpt.retry import NO_RETRY_POLICY
+from jarvis.utils import openai_standin
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.http_status = status
+
+
+class TestEndpointPool(unittest.TestCase):
+    def test_weighted_round_robin(self):
+        pool = EndpointPool("gpt-4", [Endpoint("a", weight=3), Endpoint("b", weight=1)])
+        picks = [pool.pick(now=0).name for _ in range(8)]
+        self.assertEqual(Counter(picks), {"a": 6, "b": 2})
+        # smooth: b isn't starved until a's turns run out
+        self.assertIn("b", picks[:4])
+
+    def test_eject_and_readmit(self):
+        pool = EndpointPool(
+            "gpt-4", [Endpoint("a"), Endpoint("b")], eject_after=2, eject_seconds=10
+        )
+        a = pool.endpoints[0]
+        pool.report(a, error=HTTPError(429), now=0)
+        pool.report(a, error=HTTPError(503), now=0)
+        self.assertEqual({pool.pick(now=1).name for _ in range(4)}, {"b"})
+
+        # back after 10s, on probation: one more failure ejects it for twice as long
+        self.assertIn("a", {pool.pick(now=11).name for _ in range(2)})
+        pool.report(a, error=HTTPError(500), now=11)
+        self.assertEqual(pool._states["a"].ejected_until, 31)
+
+        pool.pick(now=32)
+        pool.report(a, latency=0.5, now=32)
+        self.assertEqual(
+            (pool._states["a"].failures, pool._states["a"].ejections), (0, 0)
+        )
+
+    def test_bad_requests_keep_the_endpoint(self):
+        pool = EndpointPool("gpt-4", [Endpoint("a")], eject_after=1)
+        pool.report(pool.endpoints[0], error=HTTPError(400), now=0)
+        self.assertEqual(pool._states["a"].ejected_until, 0.0)
+
+    def test_everything_ejected(self):
+        pool = EndpointPool(
+            "gpt-4", [Endpoint("a"), Endpoint("b")], eject_after=1, eject_seconds=10
+        )
+        pool.report(pool.endpoints[0], error=HTTPError(429), now=5)
+        pool.report(pool.endpoints[1], error=HTTPError(429), now=0)
+        self.assertEqual(pool.pick(now=6).name, "b")
+        self.assertEqual(pool.expected_wait(100, now=6), float("inf"))
+
+    def test_rate_limit_per_endpoint(self):
+        pool = EndpointPool(
+            "gpt-4",
+            [Endpoint("a", rate_limit=RateLimit(60, 0)), Endpoint("b")],
+            default_limit=RateLimit(120, 0),
+        )
+        a, b = pool.endpoints
+        self.assertEqual(pool.rate_limiter(a).limit, RateLimit(60, 0))
+        self.assertEqual(pool.rate_limiter(b).limit, RateLimit(120, 0))
+        self.assertIsNone(
+            EndpointPool("gpt-4", [a], rate_limited=False).rate_limiter(a)
+        )
+
+
+class TestParseEndpoints(unittest.TestCase):
+    def test_parse(self):
+        config = [
+            {"name": "openai", "api_key": "sk-a", "weight": 2},
+            {
+                "name": "east",
+                "api_type": "azure",
+                "api_base": "https://east.openai.azure.com/",
+                "api_version": "2023-07-01-preview",
+                "api_key_env": "EAST_KEY",
+                "deployments": {"gpt-4": "gpt-4-east"},
+                "rate_limits": "gpt-4=100:20000",
+            },
+            {"name": "keyless", "api_key_env": "MISSING_KEY"},
+        ]
+        with patch.dict("os.environ", {"EAST_KEY": "east-key"}):
+            endpoints = parse_endpoints(config)
+
+        gpt_4 = endpoints_for(endpoints, "gpt-4")
+        self.assertEqual([endpoint.name for endpoint in gpt_4], ["east", "openai"])
+        east = gpt_4[0]
+        self.assertEqual((east.deployment, east.api_key), ("gpt-4-east", "east-key"))
+        self.assertEqual(east.rate_limit, RateLimit(100, 20000))
+        self.assertEqual(
+            east.model_kwargs(),
+            {"api_type": "azure", "api_version": "2023-07-01-preview"},
+        )
+        self.assertEqual(
+            [endpoint.name for endpoint in endpoints_for(endpoints, "gpt-3.5-turbo")],
+            ["openai"],
+        )
+
+
+class TestBaseLLMPool(unittest.TestCase):
+    def start(self, standin):
+        server = openai_standin.serve(standin, port=0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    def test_requests_move_off_a_throttled_endpoint(self):
+        throttled = openai_standin.StandIn(error_rate=1.0)
+        healthy = openai_standin.StandIn()
+        pool = EndpointPool(
+            "gpt-4",
+            [
+                Endpoint("throttled", api_key="sk-a", api_base=self.start(throttled)),
+                Endpoint("healthy", api_key="sk-b", api_base=self.start(healthy)),
+            ],
+            eject_after=1,
+        )
+        with patch.dict(gpt._endpoint_pools, {"gpt-4": pool}):
+            llm = gpt.BaseLLM("gpt-4")
+            # the throttled endpoint's request fails over to the healthy one, no retry needed
+            answers = [
+                llm.predict(f"question {index}", NO_RETRY_POLICY) for index in range(4)
+            ]
+
+        self.assertEqual(answers, ["OK"] * 4)
+        self.assertEqual(throttled.stats["requests"], 1)
+        self.assertEqual(healthy.stats["requests"], 4)
+        self.assertFalse(pool.stats()["throttled"]["healthy"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from jarvis.smartgpt import extractor
+
+HTML = """
+<html>
+<body>
+<script>console.log('Hello, World!');</script>
+<style>p { color: red; }</style>
+<p>Hello,  <b>World!</b></p>
+<p>Read the <a href="https://example.com/docs">docs <i>here</i></a> or the <a href="/faq">FAQ</a>.</p>
+</body>
+</html>
+"""
+
+EXPECTED = "Hello,\nWorld!\nRead the [docs here](https://example.com/docs) or the FAQ."
+
+
+class TestExtractor(unittest.TestCase):
+    def test_normalize_text(self):
+        self.assertEqual(
+            extractor.normalize_text("  a  b \n\n   c\t\n"),
+            "a\nb\nc",
+        )
+
+    def test_unknown_extractor(self):
+        with self.assertRaises(ValueError):
+            extractor.get_extractor("unknown")
+
+    def test_engines_produce_same_text(self):
+        for name in extractor.EXTRACTORS:
+            if not extractor.is_available(name):
+                continue
+            with self.subTest(engine=name):
+                self.assertEqual(extractor.get_extractor(name).extract(HTML), EXPECTED)
+
+    def test_xml_declaration(self):
+        html = '<?xml version="1.0" encoding="utf-8"?>\n' + HTML
+        for name in extractor.EXTRACTORS:
+            if not extractor.is_available(name):
+                continue
+            with self.subTest(engine=name):
+                self.assertEqual(extractor.get_extractor(name).extract(html), EXPECTED)
+
+
+if __name__ == "__main__":
+    unittest.main()
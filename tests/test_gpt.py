@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import openai
+
+from jarvis.smartgpt import gpt, retry, usage
+
+
+class FakeLLM:
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def apredict(self, prompt, retry_policy=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        # later prompts finish first
+        await asyncio.sleep(0.01 / len(prompt))
+        self.in_flight -= 1
+        return prompt.upper()
+
+
+class TestAsyncAPI(unittest.TestCase):
+    def test_complete_many_keeps_order_and_concurrency_cap(self):
+        llm = FakeLLM()
+        prompts = ["a" * n for n in range(1, 11)]
+        with patch.dict(gpt.OPEN_AI_MODELS_HUB, {"fake": llm}):
+            results = gpt.complete_many(prompts, "fake", max_concurrency=3)
+
+        self.assertEqual(results, [prompt.upper() for prompt in prompts])
+        self.assertEqual(llm.max_in_flight, 3)
+
+    def test_acomplete_unknown_model(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(gpt.acomplete("hi", "no-such-model"))
+
+    def test_requests_share_the_loop_session(self):
+        async def run():
+            sessions = []
+            for _ in range(2):
+                with gpt.pooled_http_session():
+                    sessions.append(openai.aiosession.get())
+            self.assertIsNone(openai.aiosession.get())
+            await gpt.aclose_http_session()
+            return sessions
+
+        first, second = asyncio.run(run())
+        self.assertIs(first, second)
+        self.assertTrue(first.closed)
+
+
+class TestCallSitePolicy(unittest.TestCase):
+    def test_latency_sensitive_call_sites_are_hedged(self):
+        with usage.call_site("if"):
+            self.assertTrue(gpt.call_site_policy(retry.DEFAULT_POLICY).hedge)
+            # a policy passed by the caller wins
+            self.assertIs(
+                gpt.call_site_policy(retry.NO_RETRY_POLICY), retry.NO_RETRY_POLICY
+            )
+        with usage.call_site("planner"):
+            self.assertIs(
+                gpt.call_site_policy(retry.DEFAULT_POLICY), retry.DEFAULT_POLICY
+            )
+
+    def test_chat_uses_the_call_site_policy(self):
+        llm = gpt.BaseLLM("gpt-4")
+        with patch.object(
+            gpt.retry, "call", return_value="ok"
+        ) as mock_call, usage.call_site("result_extraction"):
+            llm.predict("hello")
+        self.assertIs(mock_call.call_args.args[1], retry.HEDGED_POLICY)
+
+
+class TestModelHub(unittest.TestCase):
+    def test_models_are_built_on_first_use(self):
+        built = []
+        hub = gpt.ModelHub({"fake": lambda: built.append(None) or FakeLLM()})
+
+        self.assertIn("fake", hub)
+        self.assertNotIn("other", hub)
+        self.assertEqual(built, [])
+
+        model = hub["fake"]
+        self.assertIs(hub["fake"], model)
+        self.assertIs(hub.get("fake"), model)
+        self.assertEqual(len(built), 1)
+        self.assertIsNone(hub.get("other"))
+        with self.assertRaises(KeyError):
+            hub["other"]
+
+    def test_importing_gpt_builds_no_client(self):
+        self.assertNotIn("gpt-3.5-turbo-instruct", dict(gpt.OPEN_AI_MODELS_HUB))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from jarvis.smartgpt import gpt, llmcache
+from jarvis.smartgpt.llmcache import ResponseCache
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, prompt, retry_policy=None):
+        self.calls += 1
+        return f"{prompt} #{self.calls}"
+
+    async def apredict(self, prompt, retry_policy=None):
+        return self.predict(prompt)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(
+            os.path.join(self.tmp.name, "cache", "responses.sqlite"), max_entries=2
+        )
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_get_and_put(self):
+        self.assertIsNone(self.cache.get("k", "gpt-4"))
+        self.cache.put("k", "gpt-4", "response")
+        self.assertEqual(self.cache.get("k", "gpt-4"), "response")
+
+        stats = self.cache.stats()
+        self.assertEqual(
+            (stats["hits"], stats["misses"], stats["hit_ratio"]), (1, 1, 0.5)
+        )
+        self.assertEqual(stats["models"]["gpt-4"]["hits"], 1)
+        self.assertIn("hit ratio 50.0%", self.cache.report())
+
+    def test_responses_persist(self):
+        self.cache.put("k", "gpt-4", "response")
+        self.cache.close()
+
+        reopened = ResponseCache(self.cache.path)
+        self.assertEqual(reopened.get("k", "gpt-4"), "response")
+        reopened.close()
+
+    def test_least_recently_used_response_is_evicted(self):
+        with patch("time.time", side_effect=[1, 2, 3, 4]):
+            self.cache.put("a", "gpt-4", "A")
+            self.cache.put("b", "gpt-4", "B")
+            self.cache.get("a", "gpt-4")
+            self.cache.put("c", "gpt-4", "C")
+
+        self.assertIsNone(self.cache.get("b", "gpt-4"))
+        self.assertEqual(self.cache.get("a", "gpt-4"), "A")
+        self.assertEqual(self.cache.get("c", "gpt-4"), "C")
+
+    def test_should_cache(self):
+        self.assertTrue(llmcache.should_cache(True, 0.7))
+        self.assertFalse(llmcache.should_cache(None, 0.7))
+        self.assertFalse(llmcache.should_cache(False, 0))
+        with patch.object(llmcache, "DETERMINISTIC_CACHE", True):
+            self.assertTrue(llmcache.should_cache(None, 0))
+        with patch.object(llmcache, "ENABLE_RESPONSE_CACHE", False):
+            self.assertFalse(llmcache.should_cache(True, 0.7))
+
+    def test_call_sites_opt_in(self):
+        with patch.object(llmcache, "CACHE_SITES", {"planner"}):
+            self.assertTrue(llmcache.should_cache(None, 0.7, "planner"))
+            self.assertFalse(llmcache.should_cache(None, 0.7, "reviewer"))
+            self.assertFalse(llmcache.should_cache(False, 0.7, "planner"))
+
+
+class TestCachedCompletion(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(os.path.join(self.tmp.name, "responses.sqlite"))
+        self.llm = CountingLLM()
+        patchers = [
+            patch.object(llmcache, "get_cache", return_value=self.cache),
+            patch.object(llmcache, "ENABLE_RESPONSE_CACHE", True),
+            patch.object(gpt, "TEMPERATURE", 0.7),
+            patch.dict(gpt.OPEN_AI_MODELS_HUB, {"fake": self.llm}),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_call_site_opts_in(self):
+        self.assertEqual(gpt.complete("hi", "fake", cache=True), "hi #1")
+        self.assertEqual(gpt.complete("hi", "fake", cache=True), "hi #1")
+        self.assertEqual(gpt.complete("hi", "fake"), "hi #2")
+        self.assertEqual(
+            gpt.complete("hi", "fake", system_prompt="sys", cache=True),
+            "sys\n##User question\nhi\n #3",
+        )
+
+    def test_key_includes_temperature(self):
+        gpt.complete("hi", "fake", cache=True)
+        with patch.object(gpt, "TEMPERATURE", 0.2):
+            self.assertEqual(gpt.complete("hi", "fake", cache=True), "hi #2")
+
+    def test_async_shares_the_cache(self):
+        gpt.complete("hi", "fake", cache=True)
+        self.assertEqual(asyncio.run(gpt.acomplete("hi", "fake", cache=True)), "hi #1")
+        self.assertEqual(self.llm.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import sys
+import time
+import types
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+
+from jarvis.smartgpt import gpt, localllm
+
+
+class FakeLlama:
+    instances = 0
+
+    def __init__(self, model_path, n_ctx, n_threads, n_batch, verbose):
+        FakeLlama.instances += 1
+        self.n_ctx = n_ctx
+        self.prompts = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def set_cache(self, cache):
+        self.cache = cache
+
+    def __call__(self, prompt, max_tokens, temperature):
+        self.release.wait()
+        if len(prompt) > self.n_ctx:
+            raise ValueError(f"Requested tokens exceed context window of {self.n_ctx}")
+        self.prompts.append(prompt)
+        return {"choices": [{"text": prompt.upper()}]}
+
+    def create_chat_completion(self, messages, max_tokens, temperature):
+        return {
+            "choices": [
+                {
+                    "message": {
+                        "role": "assistant",
+                        "content": messages[-1]["content"][::-1],
+                    }
+                }
+            ]
+        }
+
+
+def fake_llama_cpp():
+    return types.SimpleNamespace(
+        Llama=FakeLlama, LlamaRAMCache=lambda capacity_bytes: capacity_bytes
+    )
+
+
+class TestLlamaModel(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.dict(sys.modules, {"llama_cpp": fake_llama_cpp()})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        FakeLlama.instances = 0
+
+    def test_loaded_once(self):
+        model = localllm.LlamaModel("model.gguf", context_tokens=64)
+        self.assertEqual(model.complete("yes", 0), "YES")
+        self.assertEqual(asyncio.run(model.acomplete("no", 0)), "NO")
+        self.assertEqual(model.chat([{"role": "user", "content": "abc"}], 0), "cba")
+        self.assertEqual(FakeLlama.instances, 1)
+
+    def test_queued_requests_run_as_a_batch_in_prompt_order(self):
+        model = localllm.LlamaModel("model.gguf", context_tokens=64)
+        llama = model.load()
+        llama.release.clear()
+        # the worker is held on the first request while the others queue up
+        first = model._complete("first", 0, 8)
+        while model.stats()["requests"] == 0:
+            time.sleep(0.001)
+        queued = [model._complete(prompt, 0, 8) for prompt in ["b", "a", "c"]]
+        llama.release.set()
+
+        self.assertEqual([future.result() for future in queued], ["B", "A", "C"])
+        self.assertEqual(first.result(), "FIRST")
+        self.assertEqual(llama.prompts, ["first", "a", "b", "c"])
+        self.assertEqual(model.stats()["batches"], 2)
+
+    def test_context_overflow_falls_back(self):
+        model = localllm.LlamaModel("model.gguf", context_tokens=4)
+        with self.assertRaises(localllm.ContextLengthError) as raised:
+            model.complete("too long", 0)
+        self.assertTrue(gpt.is_fallback_error(raised.exception))
+
+    def test_missing_package(self):
+        with patch.dict(sys.modules, {"llama_cpp": None}):
+            self.assertFalse(localllm.is_installed())
+            with self.assertRaises(RuntimeError):
+                localllm.LlamaModel("model.gguf").load()
+
+
+class TestLocalLLM(unittest.TestCase):
+    def test_chat(self):
+        with patch.dict(sys.modules, {"llama_cpp": fake_llama_cpp()}):
+            llm = gpt.LocalLLM(
+                "llama-local", localllm.LlamaModel("model.gguf", context_tokens=64)
+            )
+            messages = gpt.to_chat_messages(
+                [{"role": "system", "content": "be brief"}], "hello"
+            )
+            self.assertEqual(llm.chat(messages).content, "olleh")
+            self.assertEqual(asyncio.run(llm.achat(messages)).content, "olleh")
+            self.assertEqual(llm.predict("hi"), "HI")
+
+    def test_failed_warm_up_leaves_the_model_out(self):
+        hub = gpt.ModelHub(
+            {
+                "llama-local": lambda: gpt.LocalLLM(
+                    "llama-local", localllm.LlamaModel("model.gguf")
+                )
+            }
+        )
+        with patch.dict(sys.modules, {"llama_cpp": None}), patch.object(
+            gpt, "LOCAL_MODELS", {"llama-local": None}
+        ), patch.object(gpt, "OPEN_AI_MODELS_HUB", hub):
+            gpt.warm_up_local_models()
+        self.assertNotIn("llama-local", hub)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import os
+import venv
+import tempfile
+import unittest
+import contextlib
+from unittest.mock import patch
+
+from jarvis.smartgpt import provisioner, venvs
+
+
+class TestProvisioner(unittest.TestCase):
+    def test_imported_packages(self):
+        code = (
+            "import os, json\n"
+            "import numpy as np\n"
+            "from bs4 import BeautifulSoup\n"
+            "from jarvis.smartgpt import jvm\n"
+            "from . import local\n"
+            "import matplotlib.pyplot as plt\n"
+        )
+        self.assertEqual(
+            provisioner.imported_packages(code),
+            ["beautifulsoup4", "matplotlib", "numpy"],
+        )
+
+    def test_work_dir_modules_are_not_packages(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            open(os.path.join(work_dir, "helpers.py"), "w").close()
+            os.makedirs(os.path.join(work_dir, "parsing"))
+            code = "import helpers\nfrom parsing import tables\nimport jwt\nfrom google.cloud import storage\n"
+            self.assertEqual(provisioner.imported_packages(code, work_dir), ["PyJWT"])
+            self.assertEqual(
+                provisioner.imported_packages(code), ["PyJWT", "helpers", "parsing"]
+            )
+
+    def test_imported_packages_of_invalid_code(self):
+        self.assertEqual(provisioner.imported_packages("import numpy as"), [])
+
+    def test_collect_dependencies_of_nested_instructions(self):
+        instructions = [
+            {
+                "seq": 1,
+                "type": "RunPython",
+                "args": {
+                    "code": "import pandas",
+                    "pkg_dependencies": ["pandas", "json"],
+                },
+            },
+            {
+                "seq": 2,
+                "type": "Loop",
+                "args": {
+                    "count": 2,
+                    "instructions": [
+                        {
+                            "seq": 3,
+                            "type": "If",
+                            "args": {
+                                "condition": "x",
+                                "then": [
+                                    {
+                                        "seq": 4,
+                                        "type": "RunPython",
+                                        "args": {
+                                            "code": "import yaml\nimport requests",
+                                            "pkg_dependencies": ["requests"],
+                                        },
+                                    },
+                                ],
+                            },
+                        },
+                    ],
+                },
+            },
+            {"seq": 5, "type": "TextCompletion", "args": {"request": "import numpy"}},
+        ]
+        self.assertEqual(
+            provisioner.collect_dependencies(instructions),
+            {"declared": ["pandas", "requests"], "imported": ["PyYAML"]},
+        )
+
+    @patch("jarvis.smartgpt.provisioner.venvs.install_packages")
+    @patch("jarvis.smartgpt.provisioner.venvs.lease_work_dir_env")
+    def test_provision_in_background(self, mock_lease, mock_install):
+        mock_lease.return_value = contextlib.nullcontext("/tmp/venv/bin")
+        task = {
+            "instructions": [
+                {
+                    "seq": 1,
+                    "type": "RunPython",
+                    "args": {"code": "import yaml", "pkg_dependencies": ["requests"]},
+                },
+            ]
+        }
+        with patch("jarvis.smartgpt.provisioner.venvs.SHARED_VENVS", True):
+            future = provisioner.provision("/tmp/work", task)
+        self.assertIsNotNone(future)
+
+        provisioner.wait("/tmp/work")
+        # only the declared dependencies make the executor's env, the guessed ones are installed into it
+        mock_lease.assert_called_once_with("/tmp/work", ["requests"])
+        mock_install.assert_called_once_with("/tmp/venv/bin", ["PyYAML"])
+
+    def test_guessed_packages_are_not_saved(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            work_dir = os.path.join(tmp_dir, "work")
+            os.makedirs(work_dir)
+            store = venvs.VenvStore(
+                root=os.path.join(tmp_dir, "venvs"),
+                wheel_cache=os.path.join(tmp_dir, "wheels"),
+            )
+            task = {
+                "instructions": [
+                    {
+                        "seq": 1,
+                        "type": "RunPython",
+                        "args": {"code": "import yaml", "pkg_dependencies": []},
+                    },
+                ]
+            }
+            env_builder = venv.EnvBuilder
+            with patch("jarvis.smartgpt.venvs._store", store), patch(
+                "jarvis.smartgpt.venvs.venv.EnvBuilder",
+                lambda with_pip: env_builder(with_pip=False),
+            ), patch(
+                "jarvis.smartgpt.provisioner.venvs.install_packages"
+            ) as mock_install, patch(
+                "jarvis.smartgpt.provisioner.venvs.SHARED_VENVS", True
+            ):
+                provisioner.provision(work_dir, task)
+                provisioner.wait(work_dir)
+
+            mock_install.assert_called_once_with(store.ensure([]), ["PyYAML"])
+            self.assertEqual(venvs.load_dependencies(work_dir), [])
+
+    @patch(
+        "jarvis.smartgpt.provisioner.venvs.lease_work_dir_env",
+        side_effect=RuntimeError("pip failed"),
+    )
+    def test_failed_provisioning_does_not_raise(self, mock_lease):
+        task = {
+            "instructions": [
+                {
+                    "seq": 1,
+                    "type": "RunPython",
+                    "args": {"code": "", "pkg_dependencies": ["requests"]},
+                },
+            ]
+        }
+        with patch("jarvis.smartgpt.provisioner.venvs.SHARED_VENVS", True):
+            provisioner.provision("/tmp/work", task)
+        provisioner.wait("/tmp/work")
+        mock_lease.assert_called_once()
+
+    def test_nothing_to_provision(self):
+        task = {
+            "instructions": [{"seq": 1, "type": "WebSearch", "args": {"query": "q"}}]
+        }
+        self.assertIsNone(provisioner.provision("/tmp/work", task))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from jarvis.smartgpt import pyworker
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "the worker pool requires fork")
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.pool = pyworker.WorkerPool(sys.executable, PROJECT_DIR, size=1, max_runs=2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmp_dir.cleanup()
+
+    def write_script(self, code):
+        script = os.path.join(self.tmp_dir.name, "script.py")
+        with open(script, "w") as f:
+            f.write(code)
+        return script
+
+    def test_run(self):
+        script = self.write_script("import os, sys\nprint(sys.argv[1:], os.getcwd())\n")
+        exit_code, stdout, stderr, timed_out, usage = self.pool.run(
+            script, ["a", "b"], self.tmp_dir.name, 5
+        )
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(stdout, f"['a', 'b'] {os.path.realpath(self.tmp_dir.name)}\n")
+        self.assertEqual(stderr, "")
+        self.assertFalse(timed_out)
+        self.assertGreater(usage["max_rss_mb"], 0)
+
+    def test_run_with_error(self):
+        script = self.write_script("print(1/0)\n")
+        exit_code, _, stderr, _, _ = self.pool.run(script, [], self.tmp_dir.name, 5)
+
+        self.assertEqual(exit_code, 1)
+        self.assertIn("ZeroDivisionError", stderr)
+        self.assertNotIn("zygote.py", stderr)
+
+    def test_run_with_exit_code(self):
+        script = self.write_script("import sys\nsys.exit(3)\n")
+        self.assertEqual(self.pool.run(script, [], self.tmp_dir.name, 5)[0], 3)
+
+    def test_run_with_timeout(self):
+        script = self.write_script("while True: pass\n")
+        exit_code, _, _, timed_out, _ = self.pool.run(script, [], self.tmp_dir.name, 1)
+
+        self.assertEqual(exit_code, 1)
+        self.assertTrue(timed_out)
+
+    def test_output_is_capped(self):
+        script = self.write_script("print('x' * 1000000)\nprint('end')\n")
+        stdout = self.pool.run(script, [], self.tmp_dir.name, 5)[1]
+
+        self.assertLess(len(stdout), 100000)
+        self.assertIn("bytes truncated", stdout)
+        self.assertTrue(stdout.endswith("end\n"))
+
+    def test_cpu_limit(self):
+        script = self.write_script("while True: pass\n")
+        exit_code, _, _, timed_out, usage = self.pool.run(
+            script, [], self.tmp_dir.name, 10, {"cpu_seconds": 1}
+        )
+
+        self.assertNotEqual(exit_code, 0)
+        self.assertFalse(timed_out)
+        self.assertGreaterEqual(usage["cpu_seconds"], 0.9)
+
+    def test_scripts_are_isolated(self):
+        script = self.write_script(
+            "import json\nprint(getattr(json, 'touched', False))\njson.touched = True\n"
+        )
+        self.assertEqual(self.pool.run(script, [], self.tmp_dir.name, 5)[1], "False\n")
+        self.assertEqual(self.pool.run(script, [], self.tmp_dir.name, 5)[1], "False\n")
+
+    def test_worker_recycled_after_max_runs(self):
+        script = self.write_script("import os\nprint(os.getppid())\n")
+        zygotes = [self.pool.run(script, [], self.tmp_dir.name, 5)[1] for _ in range(3)]
+
+        self.assertEqual(zygotes[0], zygotes[1])
+        self.assertNotEqual(zygotes[1], zygotes[2])
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "the worker pool requires fork")
+class TestRunScript(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.addCleanup(pyworker.shutdown)
+
+    def test_script_never_sent_runs_cold(self):
+        script = os.path.join(self.tmp_dir.name, "script.py")
+        self.assertIsNone(
+            pyworker.run_script(
+                "/nonexistent/python", PROJECT_DIR, script, [], self.tmp_dir.name, 5
+            )
+        )
+
+    def test_busy_pool_runs_cold(self):
+        script = os.path.join(self.tmp_dir.name, "script.py")
+        with open(script, "w") as f:
+            f.write("import time\ntime.sleep(2)\n")
+        pool = pyworker.WorkerPool(
+            sys.executable, PROJECT_DIR, size=1, acquire_timeout=0.1
+        )
+        self.addCleanup(pool.close)
+        hung = threading.Thread(
+            target=pool.run, args=(script, [], self.tmp_dir.name, 10)
+        )
+        hung.start()
+        self.addCleanup(hung.join)
+        while pool._idle.qsize() or not pool._started:
+            time.sleep(0.01)
+
+        with patch.dict(pyworker._pools, {(sys.executable, PROJECT_DIR): pool}):
+            start = time.monotonic()
+            self.assertIsNone(
+                pyworker.run_script(
+                    sys.executable, PROJECT_DIR, script, [], self.tmp_dir.name, 5
+                )
+            )
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_lost_script_is_not_run_again(self):
+        script = os.path.join(self.tmp_dir.name, "script.py")
+        with open(script, "w") as f:
+            f.write("import os, signal\nos.kill(os.getppid(), signal.SIGKILL)\n")
+        with self.assertRaises(pyworker.WorkerLostError):
+            pyworker.run_script(
+                sys.executable, PROJECT_DIR, script, [], self.tmp_dir.name, 5
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
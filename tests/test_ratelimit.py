@@ -0,0 +1,75 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from jarvis.smartgpt import gpt
+from jarvis.smartgpt.ratelimit import (
+    RateLimit,
+    RateLimiter,
+    TokenBucket,
+    parse_rate_limits,
+)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_take(self):
+        bucket = TokenBucket(60)  # one per second
+        now = bucket.updated
+        self.assertEqual(bucket.take(60, now), 0.0)
+        self.assertAlmostEqual(bucket.take(2, now), 2.0)
+        # refilled while waiting, the next taker queues behind the debt
+        self.assertAlmostEqual(bucket.take(1, now + 1), 2.0)
+
+    def test_take_more_than_capacity(self):
+        bucket = TokenBucket(60)
+        self.assertEqual(bucket.take(1000, bucket.updated), 0.0)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_reservations_are_first_come_first_served(self):
+        limiter = RateLimiter(
+            "model", RateLimit(requests_per_minute=60, tokens_per_minute=6000)
+        )
+        limiter.reserve(6000)
+        waits = [limiter.reserve(100) for _ in range(3)]
+
+        self.assertEqual(waits, sorted(waits))
+        self.assertAlmostEqual(waits[0], 1.0, places=1)
+        self.assertAlmostEqual(waits[2], 3.0, places=1)
+        stats = limiter.stats()
+        self.assertEqual(stats["queue_depth"], 3)
+        self.assertEqual(stats["requests"], 4)
+        self.assertEqual(stats["waits"], 3)
+
+    def test_acquire_waits(self):
+        limiter = RateLimiter("model", RateLimit(requests_per_minute=600))
+        limiter.reserve(1)
+        limiter._requests.level = 0
+        with patch("jarvis.smartgpt.ratelimit.time.sleep") as mock_sleep:
+            limiter.acquire(1)
+        self.assertAlmostEqual(mock_sleep.call_args.args[0], 0.1, places=2)
+        self.assertEqual(limiter.stats()["queue_depth"], 0)
+
+    def test_aacquire_without_limit(self):
+        limiter = RateLimiter("model", RateLimit())
+        asyncio.run(limiter.aacquire(10**6))
+        self.assertEqual(limiter.stats()["waits"], 0)
+
+    def test_parse_rate_limits(self):
+        self.assertEqual(
+            parse_rate_limits("gpt-4=200:40000, bad, gpt-3.5-turbo=3500:90000"),
+            {"gpt-4": RateLimit(200, 40000), "gpt-3.5-turbo": RateLimit(3500, 90000)},
+        )
+
+
+class TestModelRateLimiters(unittest.TestCase):
+    def test_aliases_share_a_limiter(self):
+        self.assertIs(gpt.get_rate_limiter("gpt-4"), gpt.get_rate_limiter("gpt-4-0613"))
+        self.assertIsNot(
+            gpt.get_rate_limiter("gpt-4"), gpt.get_rate_limiter("gpt-3.5-turbo")
+        )
+        self.assertIn("gpt-4-0613", gpt.rate_limit_stats())
+
+
+if __name__ == "__main__":
+    unittest.main()
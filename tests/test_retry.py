@@ -0,0 +1,136 @@
+import time
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import openai
+
+from jarvis.smartgpt import retry
+from jarvis.smartgpt.retry import RetryPolicy
+
+
+def rate_limit_error(retry_after=None):
+    headers = {"retry-after": retry_after} if retry_after else {}
+    return openai.error.RateLimitError("slow down", http_status=429, headers=headers)
+
+
+class Flaky:
+    """Fails with the given errors, then answers."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+class TestRetry(unittest.TestCase):
+    def test_is_retryable(self):
+        self.assertTrue(retry.is_retryable(rate_limit_error()))
+        self.assertTrue(
+            retry.is_retryable(openai.error.APIError("oops", http_status=502))
+        )
+        self.assertTrue(retry.is_retryable(openai.error.Timeout("timeout")))
+        self.assertFalse(
+            retry.is_retryable(openai.error.InvalidRequestError("bad", "messages"))
+        )
+        self.assertFalse(retry.is_retryable(openai.error.AuthenticationError("no key")))
+        self.assertFalse(retry.is_retryable(ValueError("bug")))
+
+    def test_retry_after_of(self):
+        self.assertEqual(retry.retry_after_of(rate_limit_error("7")), 7.0)
+        self.assertEqual(
+            retry.retry_after_of(
+                openai.error.RateLimitError("", headers={"retry-after-ms": "250"})
+            ),
+            0.25,
+        )
+        self.assertIsNone(retry.retry_after_of(ValueError()))
+
+    @patch("jarvis.smartgpt.retry.time.sleep")
+    def test_call_retries_retryable_errors(self, mock_sleep):
+        send = Flaky(
+            rate_limit_error("3"), openai.error.ServiceUnavailableError("busy")
+        )
+        self.assertEqual(retry.call(send), "ok")
+        self.assertEqual(send.calls, 3)
+        self.assertGreaterEqual(mock_sleep.call_args_list[0].args[0], 3)
+
+    @patch("jarvis.smartgpt.retry.time.sleep")
+    def test_call_gives_up(self, mock_sleep):
+        send = Flaky(*[rate_limit_error()] * 5)
+        with self.assertRaises(openai.error.RateLimitError):
+            retry.call(send, RetryPolicy(max_retries=2))
+        self.assertEqual(send.calls, 3)
+
+        send = Flaky(openai.error.InvalidRequestError("bad", "messages"))
+        with self.assertRaises(openai.error.InvalidRequestError):
+            retry.call(send)
+        self.assertEqual(send.calls, 1)
+
+        # waiting longer than the policy allows is not worth it
+        send = Flaky(rate_limit_error("600"))
+        with self.assertRaises(openai.error.RateLimitError):
+            retry.call(send)
+        self.assertEqual(send.calls, 1)
+
+    def test_parse_retry_policies(self):
+        self.assertEqual(
+            retry.parse_retry_policies("if=hedged, reviewer=no_retry,planner=fast,"),
+            {"if": retry.HEDGED_POLICY, "reviewer": retry.NO_RETRY_POLICY},
+        )
+
+
+class TestHedging(unittest.TestCase):
+    def setUp(self):
+        self.latency = retry.LatencyTracker()
+        for _ in range(retry.MIN_LATENCY_SAMPLES):
+            self.latency.record(0.01)
+        self.policy = RetryPolicy(hedge=True, hedge_min_delay=0.05)
+
+    def test_hedge_delay(self):
+        self.assertIsNone(retry.LatencyTracker().hedge_delay(self.policy))
+        self.assertIsNone(self.latency.hedge_delay(RetryPolicy()))
+        self.assertEqual(self.latency.hedge_delay(self.policy), 0.05)
+
+    def test_slow_request_is_hedged(self):
+        calls = []
+
+        def send():
+            calls.append(None)
+            if len(calls) == 1:
+                time.sleep(1)
+                return "slow"
+            return "fast"
+
+        start = time.monotonic()
+        self.assertEqual(retry.call(send, self.policy, self.latency), "fast")
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(len(calls), 2)
+
+    def test_slow_async_request_is_hedged(self):
+        calls = []
+
+        async def send():
+            calls.append(None)
+            if len(calls) == 1:
+                await asyncio.sleep(1)
+                return "slow"
+            return "fast"
+
+        async def run():
+            start = time.monotonic()
+            result = await retry.acall(send, self.policy, self.latency)
+            return result, time.monotonic() - start
+
+        result, elapsed = asyncio.run(run())
+        self.assertEqual(result, "fast")
+        self.assertLess(elapsed, 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+from unittest.mock import patch
+
+import openai
+
+from jarvis.smartgpt import gpt, usage
+from jarvis.smartgpt.ratelimit import RateLimit, RateLimiter
+from jarvis.smartgpt.retry import LatencyTracker, NO_RETRY_POLICY
+from jarvis.smartgpt.router import CHEAPEST, RoutePolicy, Router, parse_route_policies
+
+MAX_TOKENS = {"small": 4000, "large": 16000, "best": 8000}
+COSTS = {"small": 0.001, "large": 0.003, "best": 0.03}
+
+
+class FakeLLM:
+    def __init__(self, name, error=None):
+        self.name = name
+        self.error = error
+        self.calls = 0
+
+    def predict(self, prompt, retry_policy=None):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.name
+
+
+class TestRouter(unittest.TestCase):
+    def setUp(self):
+        self.limiters = {}
+        self.latencies = {name: LatencyTracker() for name in MAX_TOKENS}
+        self.router = Router(
+            max_tokens=MAX_TOKENS.get,
+            prompt_token_cost=COSTS.get,
+            rate_limiter=self.limiters.get,
+            latency=self.latencies.get,
+            is_available=lambda name: name in MAX_TOKENS,
+            fallbacks={"small": ("large",), "best": ("large",)},
+        )
+
+    def test_own_model_first_then_fallbacks(self):
+        self.assertEqual(self.router.route("small", "planner", 100), ["small", "large"])
+
+    def test_models_too_small_are_skipped(self):
+        self.assertEqual(self.router.route("small", "planner", 3500), ["large"])
+
+    def test_nothing_fits(self):
+        self.assertEqual(self.router.route("small", "planner", 50000), ["large"])
+
+    def test_cheapest_policy(self):
+        self.router.policies["reviewer"] = RoutePolicy(
+            models=("best", "large", "small"), strategy=CHEAPEST
+        )
+        self.assertEqual(
+            self.router.route("best", "reviewer", 100), ["small", "large", "best"]
+        )
+        self.assertEqual(self.router.route("best", "reviewer", 5000), ["large", "best"])
+
+    def test_rate_limited_model_goes_last(self):
+        limiter = self.limiters["small"] = RateLimiter(
+            "small", RateLimit(requests_per_minute=1)
+        )
+        limiter.reserve(0)
+        self.assertEqual(self.router.route("small", "planner", 100), ["large", "small"])
+
+    def test_slow_model_goes_last(self):
+        self.router.policies["planner"] = RoutePolicy(
+            models=("best", "large"), max_latency=10
+        )
+        for _ in range(50):
+            self.latencies["best"].record(30)
+        self.assertEqual(self.router.route("best", "planner", 100), ["large", "best"])
+
+    def test_parse_route_policies(self):
+        policies = parse_route_policies(
+            "reviewer=cheapest:gpt-3.5-turbo|gpt-4, planner=bogus:gpt-4"
+        )
+        self.assertEqual(
+            policies, {"reviewer": RoutePolicy(("gpt-3.5-turbo", "gpt-4"), CHEAPEST)}
+        )
+
+
+class TestFallback(unittest.TestCase):
+    def test_overloaded_model_falls_back(self):
+        overloaded = FakeLLM("gpt-4", openai.error.RateLimitError("slow down"))
+        fallback = FakeLLM("gpt-3.5-turbo-16k")
+        hub = {"gpt-4": overloaded, "gpt-3.5-turbo-16k": fallback}
+        with patch.dict(gpt.OPEN_AI_MODELS_HUB, hub), usage.track() as summary:
+            result = gpt.complete(
+                "hi", gpt.GPT_4, retry_policy=NO_RETRY_POLICY, cache=False
+            )
+
+        self.assertEqual(result, "gpt-3.5-turbo-16k")
+        self.assertEqual((overloaded.calls, fallback.calls), (1, 1))
+        self.assertEqual(list(summary.to_dict()["models"]), ["gpt-3.5-turbo-16k"])
+
+    def test_bad_request_does_not_fall_back(self):
+        broken = FakeLLM("gpt-4", openai.error.InvalidRequestError("bad", None))
+        fallback = FakeLLM("gpt-3.5-turbo-16k")
+        hub = {"gpt-4": broken, "gpt-3.5-turbo-16k": fallback}
+        with patch.dict(gpt.OPEN_AI_MODELS_HUB, hub):
+            with self.assertRaises(openai.error.InvalidRequestError):
+                gpt.complete("hi", gpt.GPT_4, retry_policy=NO_RETRY_POLICY, cache=False)
+        self.assertEqual(fallback.calls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import tempfile
+import contextlib
+import unittest
+from unittest.mock import patch
+
+from jarvis.smartgpt import jvm
+from jarvis.smartgpt import runmemo
+from jarvis.smartgpt.actions import RunPythonAction
+
+
+class TestJvmTracing(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp_dir.name)
+        with open(jvm.kv_store_file, "w") as f:
+            json.dump({"a": 1, "item.1": "x", "item.2": "y", "unused": 0}, f)
+        self.trace_file = os.path.join(self.tmp_dir.name, "trace")
+
+    def tearDown(self):
+        jvm.trace_reads(None)
+        jvm.load_kv_store()
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def test_reads_are_recorded(self):
+        jvm.trace_reads(self.trace_file)
+        jvm.load_kv_store()
+        jvm.get("a")
+        jvm.get("missing")
+        jvm.list_values_with_key_prefix("item.")
+        jvm.set("b", 2)
+        jvm.get("b")
+
+        reads = runmemo.load_trace(self.trace_file)
+        self.assertEqual(
+            reads["keys"], {"a": 1, "missing": None, "item.1": "x", "item.2": "y"}
+        )
+        self.assertEqual(reads["prefixes"], {"item.": ["item.1", "item.2"]})
+        self.assertIsNone(reads["all"])
+
+    def test_enumerating_the_store_reads_all_of_it(self):
+        jvm.trace_reads(self.trace_file)
+        jvm.load_kv_store()
+        dict(jvm.kv_store.items())
+
+        reads = runmemo.load_trace(self.trace_file)
+        self.assertEqual(
+            reads["all"], {"a": 1, "item.1": "x", "item.2": "y", "unused": 0}
+        )
+
+
+class TestRunPythonMemoization(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp_dir.name)
+        jvm.reset_kv_store()
+
+        venv_bin = os.path.join(self.tmp_dir.name, "bin")
+        os.makedirs(venv_bin)
+        os.symlink(sys.executable, os.path.join(venv_bin, "python"))
+        for name, value in (
+            ("_create_or_use_virtual_env", contextlib.nullcontext(venv_bin)),
+            ("_install_dependencies", None),
+        ):
+            patcher = patch.object(RunPythonAction, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def run_action(self, memoize=True):
+        action = RunPythonAction(
+            action_id=1,
+            code="x = jvm.get('x')\nprint(x * 2)\njvm.set('doubled', x * 2)",
+            timeout=10,
+            memoize=memoize,
+        )
+        return action.run()
+
+    def test_replay_when_inputs_match(self):
+        jvm.set("x", 2)
+        first = self.run_action()
+        self.assertIn("4", first)
+
+        jvm.reset_kv_store()
+        jvm.set("x", 2)
+        with patch.object(RunPythonAction, "_run_script") as mock_run_script:
+            second = self.run_action()
+            mock_run_script.assert_not_called()
+        self.assertIn("#stdout of process:\n4\n", second)
+        self.assertEqual(runmemo.load_store(self.tmp_dir.name), {"x": 2, "doubled": 4})
+
+    def test_run_again_when_inputs_change(self):
+        jvm.set("x", 2)
+        self.run_action()
+
+        jvm.set("x", 3)
+        output = self.run_action()
+        self.assertIn("#stdout of process:\n6\n", output)
+        self.assertEqual(runmemo.load_store(self.tmp_dir.name)["doubled"], 6)
+
+    def test_memoization_is_opt_in(self):
+        jvm.set("x", 2)
+        RunPythonAction(action_id=1, code="print(jvm.get('x'))", timeout=10).run()
+        self.assertFalse(os.path.exists(runmemo.MEMO_FILE))
+
+
+if __name__ == "__main__":
+    unittest.main()
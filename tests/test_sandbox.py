@@ -0,0 +1,85 @@
+import sys
+import subprocess
+import unittest
+
+from jarvis.smartgpt import sandbox
+
+
+class TestOutputBuffer(unittest.TestCase):
+    def test_short_output_is_kept(self):
+        buffer = sandbox.OutputBuffer(head_bytes=10, tail_bytes=10)
+        buffer.write(b"hello ")
+        buffer.write(b"world")
+        self.assertEqual(buffer.text(), "hello world")
+        self.assertEqual(buffer.truncated, 0)
+
+    def test_long_output_keeps_head_and_tail(self):
+        buffer = sandbox.OutputBuffer(head_bytes=4, tail_bytes=4)
+        for chunk in (b"abcdef", b"ghijkl", b"mnop"):
+            buffer.write(chunk)
+        self.assertEqual(buffer.truncated, 8)
+        self.assertEqual(buffer.text(), "abcd\n... [8 bytes truncated] ...\nmnop")
+
+
+class TestCollect(unittest.TestCase):
+    def run_python(self, code, timeout=10, limits=None):
+        with subprocess.Popen(
+            sandbox.limited_command(sys.executable, ["-c", code], limits),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        ) as process:
+            result = sandbox.collect(
+                process.pid, process.stdout.fileno(), process.stderr.fileno(), timeout
+            )
+            process.returncode = result[0]
+            return result
+
+    def test_collect(self):
+        exit_code, stdout, stderr, timed_out, usage = self.run_python(
+            "import sys\nprint('out')\nprint('err', file=sys.stderr)\nsys.exit(2)"
+        )
+        self.assertEqual(exit_code, 2)
+        self.assertEqual(stdout.text(), "out\n")
+        self.assertEqual(stderr.text(), "err\n")
+        self.assertFalse(timed_out)
+        self.assertGreater(usage["max_rss_mb"], 0)
+
+    def test_collect_large_output(self):
+        _, stdout, _, _, _ = self.run_python("print('x' * 10000000)")
+        self.assertEqual(stdout.total, 10000001)
+        self.assertLessEqual(
+            len(stdout.head) + len(stdout.tail),
+            sandbox.OUTPUT_HEAD_BYTES + sandbox.OUTPUT_TAIL_BYTES,
+        )
+
+    def test_collect_timeout(self):
+        exit_code, _, _, timed_out, _ = self.run_python(
+            "import time\ntime.sleep(10)", timeout=0.5
+        )
+        self.assertEqual(exit_code, 1)
+        self.assertTrue(timed_out)
+
+    @unittest.skipIf(sandbox.resource is None, "resource limits are not supported")
+    def test_open_files_limit(self):
+        exit_code, _, stderr, _, _ = self.run_python(
+            "files = [open(__import__('os').devnull) for _ in range(100)]",
+            limits={"open_files": 32},
+        )
+        self.assertEqual(exit_code, 1)
+        self.assertIn("Too many open files", stderr.text())
+
+    @unittest.skipIf(sandbox.resource is None, "resource limits are not supported")
+    def test_cpu_limit_is_explained(self):
+        limits = {"cpu_seconds": 1}
+        exit_code, _, stderr, timed_out, _ = self.run_python(
+            "while True: pass", limits=limits
+        )
+        self.assertFalse(timed_out)
+        # killed by SIGXCPU, with nothing on stderr
+        self.assertEqual(stderr.text(), "")
+        self.assertIn("CPU limit exceeded", sandbox.limit_error(exit_code, limits))
+        self.assertIsNone(sandbox.limit_error(1, limits))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from jarvis.smartgpt import search
+
+
+def make_response(status_code, json_data=None, headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.json.return_value = json_data or {}
+    return response
+
+
+class TestGoogleSearchProvider(unittest.TestCase):
+    def setUp(self):
+        self.client = search.GoogleSearchProvider(
+            api_key="key", engine_id="cx", max_retries=2
+        )
+
+    def test_parse_retry_after(self):
+        self.assertEqual(search.parse_retry_after("7"), 7.0)
+        self.assertEqual(search.parse_retry_after("Mon, 02 Oct 2000 08:00:00 GMT"), 0.0)
+        self.assertIsNone(search.parse_retry_after(None))
+        self.assertIsNone(search.parse_retry_after("soon"))
+
+    def test_backoff_delay(self):
+        for attempt in range(10):
+            self.assertLessEqual(search.backoff_delay(attempt), search.BACKOFF_MAX)
+        self.assertGreaterEqual(search.backoff_delay(0, retry_after=3), 3)
+
+    @patch("jarvis.smartgpt.search.time.sleep")
+    def test_search_retries_on_rate_limit(self, mock_sleep):
+        self.client._session.get = MagicMock(
+            side_effect=[
+                make_response(429, headers={"Retry-After": "2"}),
+                make_response(200, {"items": [{"link": "https://example.com"}]}),
+            ]
+        )
+
+        self.assertEqual(self.client.search("jarvis"), ["https://example.com"])
+        self.assertEqual(self.client._session.get.call_count, 2)
+        self.assertGreaterEqual(mock_sleep.call_args.args[0], 2)
+        self.assertEqual(
+            self.client._session.get.call_args.kwargs["timeout"], search.REQUEST_TIMEOUT
+        )
+
+    @patch("jarvis.smartgpt.search.time.sleep")
+    def test_search_gives_up(self, mock_sleep):
+        self.client._session.get = MagicMock(return_value=make_response(503))
+        with self.assertRaises(RuntimeError):
+            self.client.search("jarvis")
+        self.assertEqual(self.client._session.get.call_count, 3)
+
+    def test_search_gives_up_on_long_retry_after(self):
+        self.client._session.get = MagicMock(
+            return_value=make_response(429, headers={"Retry-After": "3600"})
+        )
+        with self.assertRaises(RuntimeError):
+            self.client.search("jarvis")
+        self.assertEqual(self.client._session.get.call_count, 1)
+
+    def test_search_many(self):
+        bad_request = make_response(400)
+        bad_request.raise_for_status.side_effect = RuntimeError("bad request")
+
+        def fake_get(url, params, timeout):
+            if params["q"] == "broken":
+                return bad_request
+            return make_response(
+                200, {"items": [{"link": f"https://example.com/{params['q']}"}]}
+            )
+
+        self.client._session.get = MagicMock(side_effect=fake_get)
+
+        results = self.client.search_many(["a", "broken", "b"])
+        self.assertEqual(
+            results, [["https://example.com/a"], None, ["https://example.com/b"]]
+        )
+
+
+class TestLocalIndexProvider(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        docs = {
+            "tidb.md": "TiDB is a distributed SQL database. TiDB supports vector search.",
+            "jarvis.txt": "Jarvis translates goals into JVM instructions and runs them.",
+            "vector.html": "<html><body><p>Vector search finds similar embeddings.</p></body></html>",
+            "ignored.bin": "vector vector vector",
+        }
+        for name, content in docs.items():
+            with open(os.path.join(self.tmp_dir.name, name), "w") as f:
+                f.write(content)
+        self.provider = search.LocalIndexProvider(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_index(self):
+        self.assertEqual(len(self.provider.links), 3)
+        self.assertTrue(all(link.startswith("file://") for link in self.provider.links))
+
+    def test_search_ranks_by_bm25(self):
+        results = self.provider.search("TiDB vector search", num=2)
+        self.assertEqual(len(results), 2)
+        self.assertTrue(results[0].endswith("tidb.md"))
+        self.assertTrue(results[1].endswith("vector.html"))
+
+    def test_search_without_match(self):
+        self.assertEqual(self.provider.search("kubernetes"), [])
+
+    def test_search_many(self):
+        results = self.provider.search_many(["jarvis", "embeddings"], num=1)
+        self.assertTrue(results[0][0].endswith("jarvis.txt"))
+        self.assertTrue(results[1][0].endswith("vector.html"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from concurrent import futures
+
+import grpc
+
+from jarvis.smartgpt import streaming
+
+try:
+    from jarvis.server import jarvis_pb2, jarvis_pb2_grpc
+    from jarvis.server.jarvis_server import JarvisServicer
+except ImportError:
+    # protobuf comes with grpcio-tools
+    jarvis_pb2 = None
+
+
+@unittest.skipIf(jarvis_pb2 is None, "protobuf is not installed")
+class TestExecuteStream(unittest.TestCase):
+    def test_partial_output_comes_before_the_response(self):
+        class FakeServicer(JarvisServicer):
+            def __init__(self):
+                pass
+
+            def Execute(self, request, context):
+                streaming.publish("kv", "a=1")
+                return jarvis_pb2.ExecuteResponse(
+                    executor_id=request.executor_id, result="done"
+                )
+
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+        jarvis_pb2_grpc.add_JarvisServicer_to_server(FakeServicer(), server)
+        port = server.add_insecure_port("127.0.0.1:0")
+        server.start()
+        self.addCleanup(server.stop, None)
+
+        with grpc.insecure_channel(f"127.0.0.1:{port}") as channel:
+            stub = jarvis_pb2_grpc.JarvisStub(channel)
+            responses = list(
+                stub.ExecuteStream(jarvis_pb2.ExecuteRequest(executor_id="e", task="t"))
+            )
+
+        self.assertEqual(
+            [
+                (response.chunk_kind, response.chunk_text, response.result)
+                for response in responses
+            ],
+            [("kv", "a=1", ""), ("", "", "done")],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import time
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+
+from jarvis.smartgpt import gpt, usage
+from jarvis.smartgpt.singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def run_threads(self, target, count):
+        results = [None] * count
+
+        def run(i):
+            try:
+                results[i] = target()
+            except Exception as err:
+                results[i] = err
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_identical_calls_are_coalesced(self):
+        flight = SingleFlight()
+        calls = []
+
+        def fn():
+            calls.append(None)
+            time.sleep(0.2)
+            return "answer"
+
+        results = self.run_threads(lambda: flight.do("key", fn), 5)
+
+        self.assertEqual(results, ["answer"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats(), {"calls": 5, "saved_calls": 4, "in_flight": 0})
+
+        # nothing is cached once the call returned
+        flight.do("key", fn)
+        self.assertEqual(len(calls), 2)
+
+    def test_errors_are_shared(self):
+        flight = SingleFlight()
+
+        def fn():
+            time.sleep(0.2)
+            raise RuntimeError("failed")
+
+        results = self.run_threads(lambda: flight.do("key", fn), 3)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+    def test_async_calls_are_coalesced(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(None)
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        async def run():
+            return await asyncio.gather(
+                flight.ado("key", fn), flight.ado("key", fn), flight.ado("other", fn)
+            )
+
+        self.assertEqual(asyncio.run(run()), ["answer"] * 3)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(flight.saved_calls, 1)
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def predict_messages(self, messages):
+        self.calls += 1
+        time.sleep(0.2)
+        return messages[-1]
+
+
+class TestCoalescedRequests(unittest.TestCase):
+    def test_identical_requests_are_sent_once(self):
+        llm = gpt.OPEN_AI_MODELS_HUB["gpt-4"]
+        fake = FakeLLM()
+        messages = [{"role": "user", "content": "same question"}]
+        results = []
+        summary = usage.UsageSummary()
+
+        def send():
+            with usage.track(summary):
+                results.append(gpt.send_messages(messages, "gpt-4"))
+
+        with patch.object(llm, "_llm", fake):
+            threads = [threading.Thread(target=send) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results, ["same question"] * 3)
+        self.assertEqual(fake.calls, 1)
+        self.assertGreaterEqual(gpt.singleflight_stats()["saved_calls"], 2)
+        # the request is paid for once
+        totals = summary.to_dict()
+        self.assertEqual((totals["requests"], totals["coalesced_requests"]), (3, 2))
+        info = gpt.OPEN_AI_MODELS["gpt-4"]
+        once = usage.cost_of(
+            totals["prompt_tokens"] // 3,
+            totals["completion_tokens"] // 3,
+            info.prompt_token_cost,
+            info.completion_token_cost,
+        )
+        self.assertAlmostEqual(totals["cost"], once, places=6)
+
+    def test_request_key(self):
+        question = gpt.to_chat_messages([{"role": "user", "content": "a"}])
+        self.assertEqual(
+            gpt.request_key("gpt-4", question), gpt.request_key("gpt-4", list(question))
+        )
+        self.assertNotEqual(
+            gpt.request_key("gpt-4", question),
+            gpt.request_key("gpt-3.5-turbo", question),
+        )
+        self.assertNotEqual(
+            gpt.request_key("gpt-4", question), gpt.request_key("gpt-4", "a")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+import os
+import json
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from jarvis.smartgpt import actions, gpt, streaming
+from jarvis.smartgpt.instruction import JVMInstruction
+from jarvis.utils import openai_standin
+
+COMPLETION = '```json\n{"kvs": [{"key": "a.seq1.str", "value": "has } and \\" inside"}, {"key": "b.seq1.int", "value": 2}]}\n```'
+
+
+class TestJSONArrayStream(unittest.TestCase):
+    def test_items_complete_one_by_one(self):
+        parser = streaming.JSONArrayStream("kvs")
+        items = [
+            (index, item)
+            for index, char in enumerate(COMPLETION)
+            for item in parser.feed(char)
+        ]
+        self.assertEqual(
+            [item for _, item in items],
+            [
+                {"key": "a.seq1.str", "value": 'has } and " inside'},
+                {"key": "b.seq1.int", "value": 2},
+            ],
+        )
+        # each item as soon as it closes, not at the end of the text
+        self.assertEqual(COMPLETION[items[0][0]], "}")
+        self.assertTrue(parser.done)
+
+    def test_other_keys_are_skipped(self):
+        parser = streaming.JSONArrayStream("kvs")
+        self.assertEqual(
+            parser.feed('{"other": [{"key": 1}], "kvs": [[1, 2]]}'), [[1, 2]]
+        )
+
+
+class TestYAMLListStream(unittest.TestCase):
+    def test_items_complete_one_by_one(self):
+        text = (
+            "```yaml\ntask: search\ninstructions:\n  - seq: 1\n    type: WebSearch\n"
+            "  - seq: 2\n    type: If\n    args:\n      then:\n        - seq: 3\n          type: Loop\n"
+            "end_seq: 3\n```"
+        )
+        parser = streaming.YAMLListStream("instructions")
+        # the first item is complete once the line of the second one is
+        split = text.index("type: If")
+        self.assertEqual(parser.feed(text[:split]), [{"seq": 1, "type": "WebSearch"}])
+        self.assertEqual(
+            parser.feed(text[split:]) + parser.finish(),
+            [{"seq": 2, "type": "If", "args": {"then": [{"seq": 3, "type": "Loop"}]}}],
+        )
+
+    def test_list_ending_with_the_fence(self):
+        text = "```yaml\ninstructions:\n  - seq: 1\n    type: WebSearch\n  - seq: 2\n    type: If\n```\n"
+        parser = streaming.YAMLListStream("instructions")
+        self.assertEqual(
+            parser.feed(text) + parser.finish(),
+            [{"seq": 1, "type": "WebSearch"}, {"seq": 2, "type": "If"}],
+        )
+
+
+class TestStreamMessages(unittest.TestCase):
+    def setUp(self):
+        server = openai_standin.serve(
+            openai_standin.StandIn(default_response=COMPLETION), port=0
+        )
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        api_base = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        with patch.dict(os.environ, {"OPENAI_API_BASE": api_base}):
+            llm = gpt.BaseLLM("gpt-4")
+        patcher = patch.dict(gpt.OPEN_AI_MODELS_HUB, {"gpt-4": llm})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.messages = [{"role": "user", "content": "fill the kvs"}]
+
+    def test_stream(self):
+        pieces = []
+        response = gpt.stream_messages(
+            self.messages, gpt.GPT_4, pieces.append, cache=False
+        )
+        self.assertEqual(response, COMPLETION)
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual("".join(pieces), COMPLETION)
+
+    def test_async_stream(self):
+        async def collect():
+            try:
+                return [
+                    piece
+                    async for piece in gpt.astream_messages(
+                        self.messages, gpt.GPT_4, cache=False
+                    )
+                ]
+            finally:
+                await gpt.aclose_http_session()
+
+        pieces = asyncio.run(collect())
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual("".join(pieces), COMPLETION)
+
+    def test_kvs_are_stored_as_they_arrive(self):
+        instruction = JVMInstruction(
+            {
+                "seq": 1,
+                "type": "TextCompletion",
+                "args": {"request": "r", "content": "c", "output_format": {}},
+            },
+            {"TextCompletion": actions.TextCompletionAction},
+            "task",
+        )
+        stored = []
+        published = []
+        with patch("jarvis.smartgpt.actions.get_from_cache", return_value=None), patch(
+            "jarvis.smartgpt.actions.save_to_cache"
+        ), patch(
+            "jarvis.smartgpt.instruction.jvm.set",
+            side_effect=lambda key, value: stored.append(key),
+        ), patch(
+            "jarvis.smartgpt.actions.jvm.get", return_value=None
+        ), patch.object(
+            actions.TextCompletionAction,
+            "generate_messages_with_token_count",
+            return_value=(self.messages, 10),
+        ), streaming.listen(
+            lambda kind, text: published.append(kind)
+        ):
+            instruction.execute()
+
+        # each kv is published once while streaming, and stored once the whole result is valid
+        self.assertEqual(stored, ["a.seq1.str", "b.seq1.int"])
+        self.assertEqual(published, ["kv", "kv"])
+
+    def test_kvs_are_streamed_with_function_calling_enabled(self):
+        instruction = JVMInstruction(
+            {
+                "seq": 1,
+                "type": "TextCompletion",
+                "args": {
+                    "request": "r",
+                    "content": "c",
+                    "output_format": {
+                        "kvs": [{"key": "a.seq1.str", "value": "<to_fill>"}]
+                    },
+                },
+            },
+            {"TextCompletion": actions.TextCompletionAction},
+            "task",
+        )
+        events = []
+        stream_messages = gpt.stream_messages
+
+        def streamed(*args, **kwargs):
+            result = stream_messages(*args, **kwargs)
+            events.append("response")
+            return result
+
+        with patch.object(gpt, "ENABLE_STREAMING", True), patch.object(
+            gpt, "ENABLE_FUNCTION_CALLING", True
+        ), patch("jarvis.smartgpt.actions.get_from_cache", return_value=None), patch(
+            "jarvis.smartgpt.actions.save_to_cache"
+        ), patch(
+            "jarvis.smartgpt.instruction.jvm.set"
+        ), patch(
+            "jarvis.smartgpt.actions.jvm.get", return_value=None
+        ), patch.object(
+            actions.TextCompletionAction,
+            "generate_messages_with_token_count",
+            return_value=(self.messages, 10),
+        ), patch(
+            "jarvis.smartgpt.actions.gpt.stream_messages", side_effect=streamed
+        ), streaming.listen(
+            lambda kind, text: events.append(kind)
+        ):
+            instruction.execute()
+
+        # the kvs are published while the response streams in, not once it is complete
+        self.assertEqual(events, ["kv", "kv", "response"])
+
+    def test_interrupted_stream_stores_no_kvs(self):
+        instruction = JVMInstruction(
+            {
+                "seq": 1,
+                "type": "TextCompletion",
+                "args": {"request": "r", "content": "c", "output_format": {}},
+            },
+            {"TextCompletion": actions.TextCompletionAction},
+            "task",
+        )
+
+        def interrupted(messages, model, on_token, **kwargs):
+            on_token(COMPLETION[: COMPLETION.index("b.seq1")])
+            raise gpt.StreamInterruptedError("gpt-4 stream interrupted")
+
+        stored = []
+        published = []
+        with patch("jarvis.smartgpt.actions.get_from_cache", return_value=None), patch(
+            "jarvis.smartgpt.actions.save_to_cache"
+        ), patch(
+            "jarvis.smartgpt.instruction.jvm.set",
+            side_effect=lambda key, value: stored.append(key),
+        ), patch(
+            "jarvis.smartgpt.actions.jvm.get", return_value=None
+        ), patch.object(
+            actions.TextCompletionAction,
+            "generate_messages_with_token_count",
+            return_value=(self.messages, 10),
+        ), patch(
+            "jarvis.smartgpt.actions.gpt.stream_messages", side_effect=interrupted
+        ), streaming.listen(
+            lambda kind, text: published.append(text)
+        ):
+            with self.assertRaises(json.JSONDecodeError):
+                instruction.execute()
+
+        # the kv was shown as partial output, but the jvm is left as it was
+        self.assertEqual(published, ['a.seq1.str=has } and " inside'])
+        self.assertEqual(stored, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import json
+import unittest
+from unittest.mock import patch
+
+from jarvis.smartgpt import actions, gpt, structured
+from jarvis.utils import openai_standin
+
+OUTPUT_FORMAT = json.dumps(
+    {
+        "kvs": [
+            {"key": "summary.seq1.str", "value": "<to_fill>"},
+            {"key": "count.seq1.int", "value": "<to_fill>"},
+        ]
+    }
+)
+
+
+class TestOutputFunction(unittest.TestCase):
+    def test_schema(self):
+        function = structured.output_function(OUTPUT_FORMAT)
+        self.assertEqual(function["name"], structured.FUNCTION_NAME)
+        self.assertEqual(
+            function["parameters"],
+            {
+                "type": "object",
+                "properties": {
+                    "summary.seq1.str": {"type": "string"},
+                    "count.seq1.int": {"type": "integer"},
+                },
+                "required": ["summary.seq1.str", "count.seq1.int"],
+            },
+        )
+
+    def test_no_kvs(self):
+        self.assertIsNone(structured.output_function("{}"))
+        self.assertIsNone(structured.output_function("not json"))
+        self.assertIsNone(structured.output_function('{"kvs": [{"value": 1}]}'))
+
+    def test_to_kvs(self):
+        self.assertEqual(
+            structured.to_kvs({"a.seq1.bool": True}),
+            [{"key": "a.seq1.bool", "value": True}],
+        )
+        # the answer of a model without function calling
+        kvs = [{"key": "a.seq1.bool", "value": True}]
+        self.assertEqual(structured.to_kvs({"kvs": kvs}), kvs)
+        with self.assertRaises(ValueError):
+            structured.to_kvs([1])
+
+
+class RecordingStandIn(openai_standin.StandIn):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bodies = []
+
+    def handle(self, path, body):
+        self.bodies.append(body)
+        return super().handle(path, body)
+
+
+class TestCallFunction(unittest.TestCase):
+    def setUp(self):
+        self.standin = RecordingStandIn(
+            default_response='{"summary.seq1.str": "short", "count.seq1.int": 2}'
+        )
+        server = openai_standin.serve(self.standin, port=0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        with patch.dict(
+            os.environ,
+            {"OPENAI_API_BASE": f"http://127.0.0.1:{server.server_address[1]}/v1"},
+        ):
+            llm = gpt.BaseLLM("gpt-4")
+        patcher = patch.dict(gpt.OPEN_AI_MODELS_HUB, {"gpt-4": llm})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.messages = [{"role": "user", "content": "fill the kvs"}]
+
+    def test_text_completion(self):
+        action = actions.TextCompletionAction(
+            action_id=1,
+            request="r",
+            content="c",
+            output_format=OUTPUT_FORMAT,
+            model_name=gpt.GPT_4,
+        )
+        with patch("jarvis.smartgpt.actions.get_from_cache", return_value=None), patch(
+            "jarvis.smartgpt.actions.save_to_cache"
+        ), patch("jarvis.smartgpt.actions.jvm.get", return_value=None), patch.object(
+            actions.TextCompletionAction,
+            "generate_messages_with_token_count",
+            return_value=(self.messages, 10),
+        ):
+            result = action.run()
+
+        self.assertEqual(
+            json.loads(result),
+            {
+                "kvs": [
+                    {"key": "summary.seq1.str", "value": "short"},
+                    {"key": "count.seq1.int", "value": 2},
+                ]
+            },
+        )
+        body = self.standin.bodies[0]
+        self.assertEqual(body["function_call"], {"name": structured.FUNCTION_NAME})
+        self.assertEqual(body["functions"], [structured.output_function(OUTPUT_FORMAT)])
+
+    def test_models_without_function_calling_answer_in_text(self):
+        function = structured.output_function(OUTPUT_FORMAT)
+        with patch.object(gpt, "supports_functions", return_value=False):
+            arguments = gpt.call_function(
+                self.messages, gpt.GPT_4, function, cache=False
+            )
+
+        self.assertEqual(
+            json.loads(arguments), {"summary.seq1.str": "short", "count.seq1.int": 2}
+        )
+        self.assertNotIn("functions", self.standin.bodies[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
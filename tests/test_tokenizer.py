@@ -0,0 +1,80 @@
+import unittest
+
+from jarvis.smartgpt import tokenizer
+from jarvis.smartgpt.tokenizer import Tokenizer
+
+
+class WordEncoding:
+    """One token per word, counting the calls to encode."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, text, **kwargs):
+        self.encoded.append(text)
+        return text.split()
+
+    def encode_batch(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return [text.split() for text in texts]
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+class TestTokenizer(unittest.TestCase):
+    def setUp(self):
+        self.tokenizer = Tokenizer("gpt-4", cache_size=2)
+        self.encoding = self.tokenizer._encoding = WordEncoding()
+
+    def test_count_is_cached(self):
+        self.assertEqual(self.tokenizer.count("one two three"), 3)
+        self.assertEqual(self.tokenizer.count("one two three"), 3)
+        self.assertEqual(self.encoding.encoded, ["one two three"])
+        self.assertEqual(self.tokenizer.stats()["hits"], 1)
+
+    def test_least_recently_used_count_is_evicted(self):
+        self.tokenizer.count("a")
+        self.tokenizer.count("b")
+        self.tokenizer.count("a")
+        self.tokenizer.count("c")
+
+        self.tokenizer.count("a")
+        self.tokenizer.count("b")
+        self.assertEqual(self.encoding.encoded, ["a", "b", "c", "b"])
+
+    def test_count_many_encodes_uncached_texts_as_a_batch(self):
+        self.tokenizer.count("a b")
+        self.assertEqual(self.tokenizer.count_many(["a b", "c d e"]), [2, 3])
+        self.assertEqual(self.encoding.encoded, ["a b", "c d e"])
+
+    def test_count_messages(self):
+        messages = [{"content": "a b"}, {"content": "c"}]
+        self.assertEqual(
+            self.tokenizer.count_messages(messages),
+            3 + 2 * tokenizer.TOKENS_PER_MESSAGE,
+        )
+
+    def test_truncate_encodes_once(self):
+        text, count = self.tokenizer.truncate("one two three four five", 2)
+        self.assertEqual((text, count), ("one two", 2))
+        self.assertEqual(len(self.encoding.encoded), 1)
+
+    def test_truncate_short_text(self):
+        self.assertEqual(self.tokenizer.truncate("one two", 100), ("one two", 2))
+        self.assertEqual(
+            self.tokenizer.truncate("one two three", 5), ("one two three", 3)
+        )
+        # the count of the second call is cached
+        self.assertEqual(
+            self.tokenizer.truncate("one two three", 5), ("one two three", 3)
+        )
+        self.assertEqual(self.encoding.encoded, ["one two", "one two three"])
+
+    def test_estimates(self):
+        self.assertEqual(tokenizer.estimate("abcdefgh"), 2)
+        self.assertEqual(tokenizer.upper_bound("é"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
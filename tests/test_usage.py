@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from jarvis.smartgpt import gpt, usage
+from jarvis.smartgpt.usage import LLMCall, UsageSummary
+
+
+class EchoLLM:
+    def predict(self, prompt, retry_policy=None):
+        return "done"
+
+    async def apredict(self, prompt, retry_policy=None):
+        return "done"
+
+
+def make_call(call_site="planner", model="gpt-4", cost=1.0):
+    return LLMCall(
+        model, call_site, prompt_tokens=10, completion_tokens=5, latency=0.5, cost=cost
+    )
+
+
+class TestUsage(unittest.TestCase):
+    def test_summary_rolls_up_per_call_site_and_model(self):
+        summary = UsageSummary()
+        summary.add(make_call("planner"))
+        summary.add(make_call("reviewer", "gpt-3.5-turbo", cost=0.5))
+        summary.add(make_call("reviewer", "gpt-3.5-turbo", cost=0.5))
+
+        totals = summary.to_dict()
+        self.assertEqual(totals["requests"], 3)
+        self.assertEqual(totals["prompt_tokens"], 30)
+        self.assertEqual(totals["cost"], 2.0)
+        self.assertEqual(totals["call_sites"]["reviewer"]["requests"], 2)
+        self.assertEqual(totals["models"]["gpt-4"]["cost"], 1.0)
+        self.assertIn("reviewer: 2 requests", summary.report())
+
+    def test_nested_tracking(self):
+        with usage.track() as outer:
+            usage.record(make_call())
+            with usage.track() as inner:
+                usage.record(make_call())
+        usage.record(make_call())
+
+        self.assertEqual(outer.to_dict()["requests"], 2)
+        self.assertEqual(inner.to_dict()["requests"], 1)
+
+    def test_call_sites(self):
+        self.assertEqual(usage.current_call_site(), usage.UNKNOWN_CALL_SITE)
+        with usage.default_call_site("text_completion"):
+            self.assertEqual(usage.current_call_site(), "text_completion")
+        with usage.call_site("if"), usage.default_call_site("text_completion"):
+            self.assertEqual(usage.current_call_site(), "if")
+            with usage.call_site("reviewer"):
+                self.assertEqual(usage.current_call_site(), "reviewer")
+
+    def test_cost_per_thousand_tokens(self):
+        self.assertAlmostEqual(usage.cost_of(1000, 500, 0.03, 0.06), 0.06)
+
+
+class TestRecordedRequests(unittest.TestCase):
+    def setUp(self):
+        patchers = [
+            patch.object(gpt, "TEMPERATURE", 0.7),
+            patch.dict(gpt.OPEN_AI_MODELS_HUB, {"gpt-4": EchoLLM()}),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_requests_are_recorded_with_their_cost(self):
+        server_requests = usage.SERVER_USAGE.to_dict()["requests"]
+        with usage.track() as summary, usage.call_site("planner"):
+            gpt.complete("plan this", "gpt-4")
+            asyncio.run(gpt.acomplete("plan that", "gpt-4"))
+
+        totals = summary.to_dict()
+        planner = totals["call_sites"]["planner"]
+        self.assertEqual(planner["requests"], 2)
+        self.assertEqual(planner["completion_tokens"], 2 * gpt.count_tokens("done"))
+        expected_cost = usage.cost_of(
+            gpt.count_tokens("plan this") + gpt.count_tokens("plan that"),
+            2 * gpt.count_tokens("done"),
+            0.03,
+            0.06,
+        )
+        self.assertAlmostEqual(planner["cost"], expected_cost, places=6)
+        self.assertEqual(usage.SERVER_USAGE.to_dict()["requests"], server_requests + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,10 @@
 # test_utils.py
 
+import json
 import unittest
 from unittest.mock import patch
 
-from jarvis.smartgpt import jvm
+from jarvis.smartgpt import jvm, utils
 
 class TestUtils(unittest.TestCase):
     @patch('smartgpt.jvm.get', return_value=0)
@@ -112,5 +113,36 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(jvm.eval(expected_step_2), expected_step_3)
 
 
+class TestLoadsJSON(unittest.TestCase):
+    def test_valid_json(self):
+        self.assertEqual(utils.loads_json('{"kvs": []}'), {"kvs": []})
+
+    def test_repairs(self):
+        cases = [
+            (
+                '```json\n{"kvs": [{"key": "a", "value": 1},]}\n```',
+                {"kvs": [{"key": "a", "value": 1}]},
+            ),
+            ("Sure: {'key': 'a', 'value': True} as asked", {"key": "a", "value": True}),
+            (
+                '{"value": "line 1\nline 2", "none": None}',
+                {"value": "line 1\nline 2", "none": None},
+            ),
+            ("{'value': 'it\\'s \"quoted\"'}", {"value": 'it\'s "quoted"'}),
+            (
+                '{"kvs": [{"key": "a", "value": "truncat',
+                {"kvs": [{"key": "a", "value": "truncat"}]},
+            ),
+            ('{"kvs": [{"key": "a", "value": ', {"kvs": [{"key": "a", "value": None}]}),
+        ]
+        for text, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(utils.loads_json(text), expected)
+
+    def test_no_json(self):
+        with self.assertRaises(json.JSONDecodeError):
+            utils.loads_json("Invalid JSON string")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,197 @@
+import os
+import sys
+import time
+import venv
+import tempfile
+import threading
+import subprocess
+import unittest
+from unittest.mock import patch
+
+from jarvis.smartgpt import pyworker, venvs
+
+
+class TestVenvs(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.venv_bin = os.path.join(self.tmp_dir.name, "bin")
+        self.site_packages = os.path.join(
+            self.tmp_dir.name, "lib", "python3.10", "site-packages"
+        )
+        os.makedirs(self.venv_bin)
+        os.makedirs(self.site_packages)
+        os.symlink(sys.executable, os.path.join(self.venv_bin, "python"))
+
+    def tearDown(self):
+        venvs.invalidate_inventory(self.venv_bin)
+        self.tmp_dir.cleanup()
+
+    def test_normalize_name(self):
+        self.assertEqual(venvs.normalize_name("Foo_Bar.baz"), "foo-bar-baz")
+
+    def test_missing_packages_without_dependencies(self):
+        with patch(
+            "jarvis.smartgpt.venvs.subprocess.check_output"
+        ) as mock_check_output:
+            self.assertEqual(venvs.missing_packages(self.venv_bin, []), [])
+            mock_check_output.assert_not_called()
+
+    def test_missing_packages(self):
+        missing = venvs.missing_packages(
+            self.venv_bin, ["json", "pytest", "surely-not-installed", "pytest>=1.0"]
+        )
+        self.assertEqual(missing, ["surely-not-installed", "pytest>=1.0"])
+
+    def test_inventory_is_cached_until_site_packages_changes(self):
+        with patch(
+            "jarvis.smartgpt.venvs._scan_inventory", wraps=venvs._scan_inventory
+        ) as mock_scan:
+            venvs.get_inventory(self.venv_bin)
+            venvs.get_inventory(self.venv_bin)
+            self.assertEqual(mock_scan.call_count, 1)
+
+            os.makedirs(os.path.join(self.site_packages, "new_package"))
+            mtime = os.stat(self.site_packages).st_mtime_ns
+            os.utime(self.site_packages, ns=(mtime + 10**9, mtime + 10**9))
+            venvs.get_inventory(self.venv_bin)
+            self.assertEqual(mock_scan.call_count, 2)
+
+
+def fake_install(venv_bin, dependencies):
+    """Installs an empty module per dependency, instead of downloading it."""
+    for dependency in dependencies:
+        module = venvs.normalize_name(dependency).replace("-", "_")
+        with open(
+            os.path.join(venvs.site_packages_dir(venv_bin), f"{module}.py"), "w"
+        ) as f:
+            f.write(f"NAME = '{dependency}'\n")
+
+
+class TestVenvStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = venvs.VenvStore(
+            root=os.path.join(self.tmp_dir.name, "venvs"),
+            wheel_cache=os.path.join(self.tmp_dir.name, "wheels"),
+            max_envs=3,
+        )
+        # envs without pip are much faster to create, and the tests don't install anything
+        env_builder = venv.EnvBuilder
+        builder = patch(
+            "jarvis.smartgpt.venvs.venv.EnvBuilder",
+            lambda with_pip: env_builder(with_pip=False),
+        )
+        builder.start()
+        self.addCleanup(builder.stop)
+        install = patch.object(self.store, "_install", side_effect=fake_install)
+        self.mock_install = install.start()
+        self.addCleanup(install.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_dependency_key_ignores_order_and_standard_modules(self):
+        self.assertEqual(
+            venvs.dependency_key(["Requests", "numpy", "json"]),
+            venvs.dependency_key(["numpy", "requests", "numpy"]),
+        )
+        self.assertNotEqual(
+            venvs.dependency_key(["numpy"]), venvs.dependency_key(["pandas"])
+        )
+
+    def test_ensure_reuses_env(self):
+        first = self.store.ensure(["foo", "os"])
+        second = self.store.ensure(["foo"])
+        self.assertEqual(first, second)
+        self.mock_install.assert_called_once_with(first, ["foo"])
+
+    def test_env_is_layered_on_subset_env(self):
+        self.store.ensure(["foo"])
+        layered = self.store.ensure(["bar", "foo"])
+
+        # pip gets the whole set in one call, the base env's packages are found through the layer
+        self.assertEqual(self.mock_install.call_args.args, (layered, ["bar", "foo"]))
+        site_packages = venvs.site_packages_dir(layered)
+        with open(os.path.join(site_packages, venvs.VenvStore.LAYERS_FILE)) as f:
+            self.assertEqual(
+                f.read().split(), [venvs.site_packages_dir(self.store.ensure(["foo"]))]
+            )
+        os.remove(os.path.join(site_packages, "foo.py"))
+        output = subprocess.check_output(
+            [
+                venvs.python_path(layered),
+                "-c",
+                "import foo, bar; print(foo.NAME, bar.NAME)",
+            ]
+        )
+        self.assertEqual(output.decode().strip(), "foo bar")
+
+    def test_least_recently_used_envs_are_removed(self):
+        base = self.store.ensure(["foo"])
+        layered = self.store.ensure(["foo", "bar"])
+        time.sleep(0.01)
+        unused = self.store.ensure(["baz"])
+        time.sleep(0.01)
+        self.store.ensure(["foo", "bar"])
+        self.store.ensure(["qux"])
+
+        # the base env is kept while the env layered on it exists
+        self.assertTrue(os.path.exists(base))
+        self.assertTrue(os.path.exists(layered))
+        self.assertFalse(os.path.exists(unused))
+
+    def test_envs_in_use_are_kept(self):
+        with self.store.lease(["foo"]) as leased:
+            pooled = self.store.ensure(["bar"])
+            time.sleep(0.01)
+            unused = self.store.ensure(["baz"])
+            time.sleep(0.01)
+            pool = pyworker.WorkerPool(venvs.python_path(pooled), self.tmp_dir.name)
+            self.store.ensure(["qux"])
+            self.store.ensure(["quux"])
+
+            # the least recently used envs are leased or have a worker pool
+            self.assertTrue(os.path.exists(leased))
+            self.assertTrue(os.path.exists(pooled))
+            self.assertFalse(os.path.exists(unused))
+
+        self.store.ensure(["corge"])
+        self.assertFalse(os.path.exists(leased))
+        pool.close()
+        self.store.ensure(["grault"])
+        self.assertFalse(os.path.exists(pooled))
+
+    def test_different_envs_are_built_concurrently(self):
+        building = threading.Event()
+        release = threading.Event()
+
+        def slow_install(venv_bin, dependencies):
+            if dependencies == ["slow"]:
+                building.set()
+                release.wait(10)
+            fake_install(venv_bin, dependencies)
+
+        self.mock_install.side_effect = slow_install
+        slow = threading.Thread(target=self.store.ensure, args=(["slow"],))
+        slow.start()
+        try:
+            self.assertTrue(building.wait(10))
+            # not held up by the env being built
+            self.assertTrue(os.path.exists(self.store.ensure(["fast"])))
+            self.assertTrue(slow.is_alive())
+        finally:
+            release.set()
+            slow.join()
+
+    def test_work_dir_env_keeps_earlier_dependencies(self):
+        work_dir = os.path.join(self.tmp_dir.name, "work")
+        os.makedirs(work_dir)
+        with patch("jarvis.smartgpt.venvs._store", self.store):
+            venvs.ensure_work_dir_env(work_dir, ["foo"])
+            venv_bin = venvs.ensure_work_dir_env(work_dir, [])
+        self.assertEqual(venv_bin, self.store.ensure(["foo"]))
+        self.assertEqual(venvs.load_dependencies(work_dir), ["foo"])
+
+
+if __name__ == "__main__":
+    unittest.main()